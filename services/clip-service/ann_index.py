@@ -0,0 +1,296 @@
+import logging
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from inverted_index import RowList
+from vector_store import gather_blocks
+
+logger = logging.getLogger(__name__)
+
+ASSIGN_CHUNK_ROWS = 16384
+
+
+class ExactIndex:
+    """Brute-force cosine scan over every (or every filtered) row."""
+
+    name = "exact"
+
+    def __init__(self, store):
+        self.store = store
+
+    def rebuild(self):
+        pass
+
+    def add(self, first_row: int, vectors: np.ndarray):
+        pass
+
+    def snapshot(self):
+        """State to carry over a compaction; taken under the store lock."""
+        return None
+
+    def remap(self, snapshot, live: np.ndarray, rows: int):
+        """Renumber ``snapshot`` (of ``rows`` rows) to the compacted rows ``live``; runs without the store lock."""
+        return None
+
+    def install(self, state):
+        """Adopt ``remap``'s result under the store lock; rows added since go through ``add``."""
+        pass
+
+    def search(self, query: np.ndarray, top_k: int,
+               rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        return self.store.exact_search(query, top_k, rows)
+
+    @property
+    def training(self) -> bool:
+        """A background thread is building the index."""
+        return False
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file index with a spherical k-means coarse quantizer.
+
+    Rows are bucketed by their nearest centroid; a query scores only the rows
+    in its ``nprobe`` nearest buckets, trading recall for latency. New rows are
+    assigned to a bucket on insert. Once the store holds ``min_train_rows``
+    rows, and again once it has grown ``retrain_factor`` times past the last
+    training size, inserts and loads start training in a background thread;
+    searches never train, and keep using the previous centroids (or an exact
+    scan) until the new ones are swapped in. Centroids are saved next to the
+    store so restarts only re-assign rows.
+    """
+
+    name = "ivf"
+
+    def __init__(self, store, nlist: int = 0, nprobe: int = 8, min_train_rows: int = 4096,
+                 iterations: int = 10, sample_size: int = 65536, retrain_factor: float = 4.0):
+        super().__init__(store)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.retrain_factor = retrain_factor
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[RowList] = []
+        self.trained_rows = 0
+        self._training = False
+
+    @property
+    def centroids_path(self) -> str:
+        return f"{self.store.base_path}.ivf_centroids.npy"
+
+    def rebuild(self):
+        """Reload saved centroids (if any) and re-bucket every stored row."""
+        self.centroids = None
+        self.lists = []
+        if os.path.exists(self.centroids_path):
+            centroids = np.load(self.centroids_path)
+            if centroids.ndim == 2 and centroids.shape[1] == self.store.dim:
+                self.centroids = centroids.astype(np.float32)
+                self.lists = _bucket_blocks(self.centroids, self.store.blocks())
+                self.trained_rows = len(self.store)
+            else:
+                logger.warning(f"Ignoring IVF centroids with shape {centroids.shape}")
+        self.maybe_train()
+
+    def _target_nlist(self, rows: int) -> int:
+        if self.nlist:
+            return min(self.nlist, rows)
+        return min(int(np.clip(4 * np.sqrt(rows), 16, 4096)), max(rows // 8, 1))
+
+    def _needs_training(self) -> bool:
+        rows = len(self.store)
+        if rows < self.min_train_rows:
+            return False
+        return self.centroids is None or rows > self.retrain_factor * self.trained_rows
+
+    @property
+    def training(self) -> bool:
+        return self._training
+
+    def maybe_train(self) -> bool:
+        """Start background training if the store has outgrown the index. Called under the store lock."""
+        if self._training or not self._needs_training():
+            return False
+        self._training = True
+        threading.Thread(target=self._train_in_background, name="ivf-training", daemon=True).start()
+        return True
+
+    def _train_in_background(self):
+        swapped = True
+        try:
+            swapped = self.train()
+        except Exception:
+            logger.exception("IVF training failed")
+        finally:
+            with self.store.lock:
+                self._training = False
+                if not swapped:
+                    self.maybe_train()
+
+    def train(self) -> bool:
+        """
+        Train centroids and bucket a snapshot of the store without holding
+        its lock, then bucket the rows added meanwhile and swap the result
+        in under the lock. Returns False (nothing swapped) if the store was
+        compacted in between, since row ids changed.
+        """
+        start = time.perf_counter()
+        with self.store.lock:
+            generation = self.store.generation
+            rows, blocks = self.store.snapshot()
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(rows, size=min(rows, self.sample_size), replace=False))
+        sample = gather_blocks(blocks, sample_rows, self.store.dim)
+        centroids = spherical_kmeans(sample, self._target_nlist(rows), self.iterations, rng)
+        lists = _bucket_blocks(centroids, blocks)
+
+        with self.store.lock:
+            if self.store.generation != generation:
+                logger.info("Discarding IVF training: the store was compacted meanwhile")
+                return False
+            added = np.arange(rows, len(self.store))
+            if len(added):
+                _bucket(lists, rows, _assign(centroids, self.store.gather(added)))
+            self.centroids, self.lists, self.trained_rows = centroids, lists, rows
+
+        tmp_path = self.centroids_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, centroids)
+        os.replace(tmp_path, self.centroids_path)
+        logger.info(
+            f"Trained IVF index with {len(centroids)} lists on {len(sample)} of {rows} rows "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return True
+
+    def add(self, first_row: int, vectors: np.ndarray):
+        if self.centroids is not None:
+            _bucket(self.lists, first_row, _assign(self.centroids, vectors))
+        self.maybe_train()
+
+    def snapshot(self):
+        if self.centroids is None:
+            return None
+        # Row lists only grow, so these views stay valid
+        return self.centroids, [rows.rows() for rows in self.lists], self.trained_rows
+
+    def remap(self, snapshot, live: np.ndarray, rows: int):
+        if snapshot is None:
+            return None
+        centroids, old_lists, trained_rows = snapshot
+        new_rows = np.full(rows, -1, dtype=np.int64)
+        new_rows[live] = np.arange(len(live))
+        lists = []
+        for old in old_lists:
+            mapped = new_rows[old]
+            rows_list = RowList()
+            rows_list.extend(mapped[mapped >= 0])
+            lists.append(rows_list)
+        return centroids, lists, min(trained_rows, len(live))
+
+    def install(self, state):
+        if state is None:
+            self.centroids, self.lists = None, []
+        else:
+            self.centroids, self.lists, self.trained_rows = state
+        self.maybe_train()
+
+    def search(self, query: np.ndarray, top_k: int,
+               rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        if self.centroids is None:
+            return self.store.exact_search(query, top_k, rows)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        # A selective filter is cheaper to scan exactly than to probe
+        if rows is not None and len(rows) <= nprobe * len(self.store) / len(self.centroids):
+            return self.store.exact_search(query, top_k, rows)
+
+        query = np.asarray(query, dtype=np.float32)
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.sort(np.concatenate([self.lists[c].rows() for c in probe]))
+        if rows is not None:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        candidates = candidates[candidates < len(self.store)]
+        return self.store.exact_search(query, top_k, candidates)
+
+    def stats(self) -> dict:
+        sizes = [len(rows) for rows in self.lists]
+        return {
+            "backend": self.name,
+            "trained": self.centroids is not None,
+            "training": self.training,
+            "nlist": len(self.lists),
+            "nprobe": self.nprobe,
+            "largest_list": max(sizes) if sizes else 0,
+        }
+
+
+def _assign(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK_ROWS], dtype=np.float32)
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def _bucket(lists: List[RowList], first_row: int, labels: np.ndarray):
+    order = np.argsort(labels, kind="stable")
+    counts = np.bincount(labels, minlength=len(lists))
+    offset = 0
+    for cluster in np.nonzero(counts)[0]:
+        count = counts[cluster]
+        lists[cluster].extend(first_row + order[offset:offset + count])
+        offset += count
+
+
+def _bucket_blocks(centroids: np.ndarray, blocks) -> List[RowList]:
+    """One row list per centroid, holding every row of the (first_row, block) pairs."""
+    lists = [RowList() for _ in range(len(centroids))]
+    for first_row, block in blocks:
+        _bucket(lists, first_row, _assign(centroids, block))
+    return lists
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int,
+                     rng: np.random.Generator) -> np.ndarray:
+    """K-means on the unit sphere (cosine similarity); returns normalized centroids."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+            labels[start:start + ASSIGN_CHUNK_ROWS] = np.argmax(
+                vectors[start:start + ASSIGN_CHUNK_ROWS] @ centroids.T, axis=1
+            )
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=k)
+        nonempty = np.nonzero(counts)[0]
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids[nonempty] = sums
+        empty = np.nonzero(counts == 0)[0]
+        if len(empty):
+            # Reseed empty clusters on random points
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+def create_ann_index(backend: str, store, **options) -> ExactIndex:
+    """Build the index backend named by config ("exact" or "ivf"); options tune IVF."""
+    backend = backend.lower()
+    if backend == "exact":
+        return ExactIndex(store)
+    if backend == "ivf":
+        return IVFIndex(store, **options)
+    raise ValueError(f"Unknown index backend '{backend}' (expected 'exact' or 'ivf')")
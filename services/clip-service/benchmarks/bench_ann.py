@@ -0,0 +1,85 @@
+"""
+Recall@k and QPS of the IVF index against the exact scan.
+
+    python benchmarks/bench_ann.py --items 200000 --nprobe 1 4 8 16 32
+
+Vectors are synthetic, normalized and 512-d. By default they are drawn around
+random cluster centres (closer to real CLIP embeddings, which are far from
+uniform); pass --uniform for isotropic noise, the worst case for IVF.
+Queries are perturbed copies of stored vectors.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex  # noqa: E402
+from vector_store import VectorStore  # noqa: E402
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def synthetic_vectors(rng, count: int, dim: int, clusters: int, uniform: bool) -> np.ndarray:
+    if uniform:
+        return normalize(rng.standard_normal((count, dim)).astype(np.float32))
+    centres = normalize(rng.standard_normal((clusters, dim)).astype(np.float32))
+    labels = rng.integers(clusters, size=count)
+    noise = rng.standard_normal((count, dim)).astype(np.float32) / np.sqrt(dim)
+    return normalize(centres[labels] + noise)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--uniform", action="store_true")
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data_dir = tempfile.mkdtemp(prefix="clip-ann-bench-")
+    store = VectorStore(os.path.join(data_dir, "embeddings"), os.path.join(data_dir, "metadata.jsonl"), dim=args.dim)
+    store.load()
+    vectors = synthetic_vectors(rng, args.items, args.dim, args.clusters, args.uniform)
+    for start in range(0, args.items, 10000):
+        chunk = vectors[start:start + 10000]
+        store.add_many(chunk, [{"item_id": f"item_{start + i}"} for i in range(len(chunk))])
+
+    queries = vectors[rng.integers(args.items, size=args.queries)]
+    queries = normalize(queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.3 / np.sqrt(args.dim))
+
+    start = time.perf_counter()
+    truth = [{row for row, _ in store.exact_search(q, args.top_k)} for q in queries]
+    exact_qps = len(queries) / (time.perf_counter() - start)
+
+    index = IVFIndex(store, nlist=args.nlist, min_train_rows=0)
+    start = time.perf_counter()
+    index.train()
+    train_s = time.perf_counter() - start
+
+    print(f"{args.items} items, {len(index.centroids)} lists, trained in {train_s:.1f}s")
+    print(f"{'mode':<14}{f'recall@{args.top_k}':>12}{'QPS':>10}{'speedup':>10}")
+    print(f"{'exact':<14}{1.0:>12.3f}{exact_qps:>10.0f}{1.0:>9.1f}x")
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        start = time.perf_counter()
+        results = [index.search(q, args.top_k) for q in queries]
+        qps = len(queries) / (time.perf_counter() - start)
+        recall = np.mean([len(expected & {row for row, _ in got}) / args.top_k
+                          for expected, got in zip(truth, results)])
+        print(f"{f'ivf nprobe={nprobe}':<14}{recall:>12.3f}{qps:>10.0f}{qps / exact_qps:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
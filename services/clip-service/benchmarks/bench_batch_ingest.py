@@ -0,0 +1,86 @@
+"""
+Compare per-item ingest (what /upload does) against batched ingest (/upload/batch).
+
+    python benchmarks/bench_batch_ingest.py --items 128 --batch-sizes 8 16 32
+
+Both paths decode JPEG bytes, embed with CLIP and append to a fresh store in a
+temporary directory, so the numbers include decode, inference and persistence.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+DATA_DIR = tempfile.mkdtemp(prefix="clip-bench-")
+os.environ.setdefault("VECTOR_DB_PATH", os.path.join(DATA_DIR, "embeddings"))
+os.environ.setdefault("METADATA_PATH", os.path.join(DATA_DIR, "metadata.json"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from vector_store import VectorStore  # noqa: E402
+
+
+def make_jpegs(count: int, size=(640, 480)):
+    rng = np.random.default_rng(0)
+    payloads = []
+    for _ in range(count):
+        pixels = rng.integers(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format="JPEG", quality=85)
+        payloads.append(buf.getvalue())
+    return payloads
+
+
+def fresh_store(name: str) -> VectorStore:
+    store = VectorStore(os.path.join(DATA_DIR, name), os.path.join(DATA_DIR, f"{name}.jsonl"))
+    store.load()
+    return store
+
+
+def bench_per_item(payloads):
+    store = fresh_store("per_item")
+    start = time.perf_counter()
+    for i, data in enumerate(payloads):
+        embedding = main.get_image_embedding(main.decode_image(data))
+        store.add(embedding, {"item_id": f"item_{i}"})
+    return time.perf_counter() - start
+
+
+def bench_batched(payloads, batch_size: int):
+    store = fresh_store(f"batched_{batch_size}")
+    start = time.perf_counter()
+    images = [main.decode_image(data) for data in payloads]
+    embeddings = main.get_image_embeddings(images, batch_size=batch_size)
+    store.add_many(embeddings, [{"item_id": f"item_{i}"} for i in range(len(payloads))])
+    return time.perf_counter() - start
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=128)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 16, 32])
+    args = parser.parse_args()
+
+    # The service loads the model in its startup task, which does not run on import
+    main.load_model()
+    payloads = make_jpegs(args.items)
+    # Warm up kernels so the first timed path is not penalised
+    main.get_image_embeddings([main.decode_image(payloads[0])])
+
+    elapsed = bench_per_item(payloads)
+    baseline = args.items / elapsed
+    print(f"{'path':<16}{'seconds':>10}{'items/s':>12}{'speedup':>10}")
+    print(f"{'per-item':<16}{elapsed:>10.2f}{baseline:>12.1f}{1.0:>9.2f}x")
+    for batch_size in args.batch_sizes:
+        elapsed = bench_batched(payloads, batch_size)
+        rate = args.items / elapsed
+        print(f"{f'batch={batch_size}':<16}{elapsed:>10.2f}{rate:>12.1f}{rate / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
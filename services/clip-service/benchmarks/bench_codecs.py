@@ -0,0 +1,89 @@
+"""
+Memory per item, recall@k and QPS of the storage codecs against float32.
+
+    python benchmarks/bench_codecs.py --items 100000 --rerank 0 4 20
+
+Every codec is searched over the same synthetic, clustered 512-d vectors
+(see bench_ann.py). With --rerank 0 the compressed scores are returned as
+they are; larger values re-score that many candidates per result exactly
+against the float32 rows. Memory is the store's resident estimate, which
+includes ~512 bytes of metadata per item. numpy has no fast float16 or
+int8 matmul, so those codes are widened to float32 chunk by chunk: the win
+is memory, not scan speed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ann import normalize, synthetic_vectors  # noqa: E402
+from vector_codecs import create_codec  # noqa: E402
+from vector_store import VectorStore  # noqa: E402
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--codecs", nargs="+", default=["float16", "int8", "pq"])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4, 20])
+    parser.add_argument("--subvectors", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data_dir = tempfile.mkdtemp(prefix="clip-codec-bench-")
+    store = VectorStore(os.path.join(data_dir, "embeddings"), os.path.join(data_dir, "metadata.jsonl"), dim=args.dim)
+    store.load()
+    vectors = synthetic_vectors(rng, args.items, args.dim, args.clusters, uniform=False)
+    for start in range(0, args.items, 10000):
+        chunk = vectors[start:start + 10000]
+        store.add_many(chunk, [{"item_id": f"item_{start + i}"} for i in range(len(chunk))])
+
+    queries = vectors[rng.integers(args.items, size=args.queries)]
+    queries = normalize(queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.3 / np.sqrt(args.dim))
+
+    start = time.perf_counter()
+    truth = [{row for row, _ in store.exact_search(q, args.top_k)} for q in queries]
+    exact_qps = len(queries) / (time.perf_counter() - start)
+    baseline = store.storage_stats()
+
+    print(f"{args.items} items, recall@{args.top_k} against the float32 scan")
+    print(f"{'codec':<10}{'rerank':>8}{'bytes/vec':>11}{'mem/item':>10}{'recall':>9}{'QPS':>9}")
+    print(f"{'float32':<10}{'-':>8}{baseline['bytes_per_vector']:>11}{baseline['memory_per_item']:>10}{1.0:>9.3f}{exact_qps:>9.0f}")
+    store.close()
+    for name in args.codecs:
+        # Reopen the same files with the codec attached, as the service does
+        store = VectorStore(store.base_path, store.metadata_path, dim=args.dim)
+        store.codec = create_codec(name, args.dim, subvectors=args.subvectors)
+        if os.path.exists(store.codec_path):
+            os.remove(store.codec_path)
+        start = time.perf_counter()
+        store.load()
+        # Loading starts training and encoding in the background
+        while store.storage_stats()["preparing"]:
+            time.sleep(0.01)
+        setup_s = time.perf_counter() - start
+        stats = store.storage_stats()
+        for rerank in args.rerank:
+            store.codec.rerank_factor = rerank
+            start = time.perf_counter()
+            results = [store.exact_search(q, args.top_k) for q in queries]
+            qps = len(queries) / (time.perf_counter() - start)
+            recall = np.mean([len(expected & {row for row, _ in got}) / args.top_k
+                              for expected, got in zip(truth, results)])
+            print(f"{name:<10}{rerank:>8}{stats['bytes_per_vector']:>11}{stats['memory_per_item']:>10}"
+                  f"{recall:>9.3f}{qps:>9.0f}")
+        print(f"{'':<10}(load + train + encode {setup_s:.1f}s)")
+        store.close()
+
+
+if __name__ == "__main__":
+    main_cli()
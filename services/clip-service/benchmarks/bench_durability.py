@@ -0,0 +1,74 @@
+"""
+Ingest throughput under each durability mode.
+
+    python benchmarks/bench_durability.py --writers 1 8 32 --items 2000
+
+Concurrent writer threads each add single items to one store and, like the
+upload handlers, wait until their write is durable before adding the next.
+"always" pays one fsync per write; "group" shares each fsync among every
+write that arrived while the previous one ran; "periodic" never waits.
+Also reports a baseline with no fsync at all (flush to the OS only).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from durability import GroupCommitter  # noqa: E402
+from vector_store import VectorStore  # noqa: E402
+
+
+def run(mode, writers: int, items: int, dim: int, interval_ms: float) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="clip-durability-bench-")
+    store = VectorStore(os.path.join(data_dir, "embeddings"), os.path.join(data_dir, "metadata.jsonl"), dim=dim)
+    committer = GroupCommitter(mode, interval_ms) if mode else None
+    store.committer = committer
+    store.load()
+    if committer is not None:
+        committer.start()
+    vector = np.ones(dim, dtype=np.float32) / np.sqrt(dim)
+    per_writer = items // writers
+
+    def writer(index: int):
+        for i in range(per_writer):
+            store.add(vector, {"item_id": f"w{index}_{i}"})
+            store.wait_durable()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stats = committer.stats() if committer is not None else {"fsyncs": 0, "commits_per_group": 0.0}
+    store.close()
+    if committer is not None:
+        committer.stop()
+    return {"items_per_s": per_writer * writers / elapsed, **stats}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--interval-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'writers':>8}{'items/s':>10}{'fsyncs':>8}{'writes/group':>14}")
+    for mode in (None, "always", "group", "periodic"):
+        for writers in args.writers:
+            result = run(mode, writers, args.items, args.dim, args.interval_ms)
+            print(f"{mode or 'os-flush':<10}{writers:>8}{result['items_per_s']:>10.0f}"
+                  f"{result['fsyncs']:>8}{result['commits_per_group']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
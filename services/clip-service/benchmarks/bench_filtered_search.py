@@ -0,0 +1,98 @@
+"""
+Filtered search: inverted-index candidate scoring vs. full scan + post-filter.
+
+    python benchmarks/bench_filtered_search.py --items 200000 --queries 200
+
+Builds a synthetic store of normalized 512-d vectors with random
+category/color/style attributes, then times both strategies for filters of
+decreasing selectivity and checks that they return identical results.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import VectorStore, top_k_rows  # noqa: E402
+
+CATEGORIES = ["top", "bottom", "shoes", "outerwear", "dress", "accessory", "bag", "hat", "socks", "scarf"]
+COLORS = ["black", "white", "blue", "red", "green", "grey", "beige", "brown", "pink", "navy", "yellow", "purple"]
+STYLES = ["casual", "formal", "sport", "street", "vintage"]
+
+
+def build_store(items: int, dim: int, seed: int = 0) -> VectorStore:
+    rng = np.random.default_rng(seed)
+    data_dir = tempfile.mkdtemp(prefix="clip-filter-bench-")
+    store = VectorStore(os.path.join(data_dir, "embeddings"), os.path.join(data_dir, "metadata.jsonl"), dim=dim)
+    store.load()
+    chunk = 10000
+    for start in range(0, items, chunk):
+        count = min(chunk, items - start)
+        vectors = rng.standard_normal((count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        records = [{
+            "item_id": f"item_{start + i}",
+            "category": CATEGORIES[rng.integers(len(CATEGORIES))],
+            "color": COLORS[rng.integers(len(COLORS))],
+            "style": STYLES[rng.integers(len(STYLES))],
+        } for i in range(count)]
+        store.add_many(vectors, records)
+    return store
+
+
+def attribute_mask(store: VectorStore, filters: dict) -> np.ndarray:
+    mask = np.ones(len(store), dtype=bool)
+    for field, value in filters.items():
+        mask &= np.fromiter((item.get(field) == value for item in store.metadata), dtype=bool, count=len(store))
+    return mask
+
+
+def post_filter_search(store: VectorStore, query: np.ndarray, top_k: int, mask: np.ndarray):
+    """Baseline: score every row, then drop rows that do not match."""
+    scores = np.where(mask, store.scores(query), -np.inf)
+    return [(row, score) for row, score in top_k_rows(scores, top_k) if score != -np.inf]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    store = build_store(args.items, args.dim)
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    cases = [
+        {"category": "shoes"},
+        {"category": "shoes", "color": "black"},
+        {"category": "shoes", "color": "black", "style": "formal"},
+    ]
+    print(f"{'filter':<40}{'matches':>9}{'scan ms':>10}{'index ms':>10}{'speedup':>9}")
+    for filters in cases:
+        matches = len(store.index.rows(filters))
+        mask = attribute_mask(store, filters)
+
+        start = time.perf_counter()
+        baseline = [post_filter_search(store, q, args.top_k, mask) for q in queries]
+        scan_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        indexed = [store.search(q, args.top_k, filters) for q in queries]
+        index_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        for expected, got in zip(baseline, indexed):
+            assert [row for row, _ in expected] == [row for row, _ in got], "filtered results differ"
+        label = ",".join(f"{k}={v}" for k, v in filters.items())
+        print(f"{label:<40}{matches:>9}{scan_ms:>10.2f}{index_ms:>10.2f}{scan_ms / index_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
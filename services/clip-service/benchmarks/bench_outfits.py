@@ -0,0 +1,102 @@
+"""
+Latency of "complete the look" beam search, and how often it finds the
+exhaustive optimum.
+
+    python benchmarks/bench_outfits.py --items 5000 --anchors 100
+
+Builds a synthetic wardrobe of clustered, normalized vectors spread over the
+upload form's categories, then completes outfits around stored items. The
+exhaustive search scores every top x bottom x shoes (x accessory or none)
+combination of the same per-category shortlists, so it checks the beam
+search, not the shortlisting.
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ann import synthetic_vectors  # noqa: E402
+from outfits import OutfitBuilder  # noqa: E402
+from vector_store import VectorStore  # noqa: E402
+
+CATEGORIES = ["top", "bottom", "dress", "outerwear", "shoes", "accessory"]
+
+
+def exhaustive(builder: OutfitBuilder, anchor: np.ndarray, anchor_item: dict) -> float:
+    """Best outfit score over every combination of the shortlisted candidates."""
+    choices = []
+    for slot in builder.slots:
+        if slot == anchor_item["category"]:
+            continue
+        vectors, items = builder._category_blocks()[slot]
+        keep = np.array([item["item_id"] != anchor_item["item_id"] for item in items])
+        vectors = vectors[keep]
+        affinity = vectors @ anchor
+        shortlist = np.argsort(-affinity)[:builder.candidates_per_slot]
+        options = [vectors[i] for i in shortlist]
+        if slot in builder.optional:
+            options.append(None)
+        choices.append(options)
+
+    best = -np.inf
+    for combo in itertools.product(*choices):
+        members = np.array([anchor] + [v for v in combo if v is not None])
+        anchor_mean = float(np.mean(members[1:] @ anchor))
+        gram = members @ members.T
+        pair_mean = float(gram[np.triu_indices(len(members), 1)].mean())
+        best = max(best, builder.anchor_weight * anchor_mean + (1 - builder.anchor_weight) * pair_mean)
+    return best
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--anchors", type=int, default=100)
+    parser.add_argument("--beam-width", type=int, default=32)
+    parser.add_argument("--candidates", type=int, default=64)
+    parser.add_argument("--check", type=int, default=20, help="anchors to verify exhaustively")
+    parser.add_argument("--check-candidates", type=int, default=12)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data_dir = tempfile.mkdtemp(prefix="clip-outfit-bench-")
+    store = VectorStore(os.path.join(data_dir, "embeddings"), os.path.join(data_dir, "metadata.jsonl"), dim=args.dim)
+    store.load()
+    vectors = synthetic_vectors(rng, args.items, args.dim, clusters=50, uniform=False)
+    store.add_many(vectors, [{"item_id": f"item_{i}", "category": CATEGORIES[rng.integers(len(CATEGORIES))]}
+                             for i in range(args.items)])
+
+    builder = OutfitBuilder(store, candidates_per_slot=args.candidates, beam_width=args.beam_width)
+    start = time.perf_counter()
+    builder._category_blocks()
+    print(f"{args.items} items, category blocks built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    anchors = rng.choice(args.items, size=args.anchors, replace=False)
+    latencies = []
+    for row in anchors:
+        item = store.metadata[row]
+        start = time.perf_counter()
+        builder.complete(vectors[row], item, top_n=5)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"complete(): p50 {np.percentile(latencies, 50):.2f} ms, p95 {np.percentile(latencies, 95):.2f} ms "
+          f"(beam {args.beam_width}, {args.candidates} candidates per slot)")
+
+    small = OutfitBuilder(store, candidates_per_slot=args.check_candidates, beam_width=args.beam_width)
+    matches = 0
+    for row in anchors[:args.check]:
+        item = store.metadata[row]
+        found = small.complete(vectors[row], item, top_n=1)[0][0]
+        matches += abs(found - exhaustive(small, vectors[row], item)) < 1e-5
+    print(f"beam search found the exhaustive optimum for {matches}/{min(args.check, len(anchors))} anchors "
+          f"({args.check_candidates} candidates per slot)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,84 @@
+"""
+Upload decode cost: full-resolution decode vs. the preprocessing stage.
+
+    python benchmarks/bench_preprocessing.py --width 4032 --height 3024 --images 20
+
+Encodes a synthetic phone-sized JPEG (with an EXIF rotation tag) and times
+the old path (``Image.open(...).convert("RGB")`` at full size, then resize)
+against ``preprocess_image`` for CLIP (shortest side 224) and diffusion
+(512x512), with the per-stage breakdown. Then pushes a burst of uploads
+through ``ImagePreprocessor`` with 0 (threads) and N worker processes.
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_preprocessing import ImagePreprocessor, preprocess_image  # noqa: E402
+
+
+def phone_jpeg(width: int, height: int) -> bytes:
+    rng = np.random.default_rng(0)
+    # Smooth content compresses like a photo; pure noise would not
+    small = rng.integers(0, 255, (height // 48, width // 48, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    exif = image.getexif()
+    exif[0x0112] = 6  # rotated 90 degrees, as phones store portrait shots
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+async def burst(preprocessor: ImagePreprocessor, data: bytes, count: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(preprocessor.run(data, min_side=224) for _ in range(count)))
+    return count / (time.perf_counter() - start)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    data = phone_jpeg(args.width, args.height)
+    print(f"{args.width}x{args.height} JPEG, {len(data) // 1024} KB")
+
+    full = timed(lambda: Image.open(io.BytesIO(data)).convert("RGB"), 3)
+    full_512 = timed(lambda: Image.open(io.BytesIO(data)).convert("RGB").resize((512, 512)), 3)
+    print(f"{'full decode':<28}{full:>8.1f} ms")
+    print(f"{'full decode + 512 resize':<28}{full_512:>8.1f} ms")
+    for label, options in (("preprocess (CLIP, 224)", {"min_side": 224}),
+                           ("preprocess (diffusion, 512)", {"size": (512, 512)})):
+        image, stages = preprocess_image(data, **options)
+        total = timed(lambda: preprocess_image(data, **options), 5)
+        breakdown = ", ".join(f"{stage} {ms:.1f}" for stage, ms in stages.items())
+        print(f"{label:<28}{total:>8.1f} ms  -> {image.size[0]}x{image.size[1]}  ({breakdown})")
+
+    for workers in sorted({0, args.workers}):
+        preprocessor = ImagePreprocessor(workers)
+        preprocessor.start()
+        rate = asyncio.run(burst(preprocessor, data, args.images))
+        preprocessor.stop()
+        print(f"burst of {args.images} with {workers} worker processes: {rate:.1f} images/s, "
+              f"avg stages {preprocessor.stats()['avg_ms']}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,156 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Hashable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Bounded least-recently-used cache for embeddings with hit/miss counters."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "collections.OrderedDict[Hashable, np.ndarray]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: np.ndarray):
+        if self.max_size <= 0:
+            return
+        value = np.array(value, dtype=np.float32)
+        value.flags.writeable = False
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a text query, used as a cache key."""
+    return " ".join(text.lower().split())
+
+
+class PersistentEmbeddingCache(LRUCache):
+    """
+    LRU cache keyed by a SHA-256 content hash, persisted as an append-only log.
+
+    The log starts with a one-line JSON header naming the ``fingerprint`` of
+    whatever produced the embeddings (model, inference profile,
+    preprocessing); a log written under another fingerprint is discarded on
+    load. Each record is the 32-byte digest followed by the float32
+    embedding. The log is replayed on load (later records win) and rewritten
+    atomically once it holds more than twice ``max_size`` records, so disk
+    use stays bounded too.
+    """
+
+    def __init__(self, path: str, max_size: int, dim: int, fingerprint: str = ""):
+        super().__init__(max_size)
+        self.path = path
+        self.dim = dim
+        self.fingerprint = fingerprint
+        self._header = (json.dumps({"fingerprint": fingerprint, "dim": dim}) + "\n").encode()
+        self._record_size = 32 + dim * 4
+        self._log_records = 0
+        self._file = None
+
+    def load(self):
+        with self._lock:
+            self._entries.clear()
+            self._log_records = 0
+            data = b""
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    data = f.read()
+                if not data.startswith(self._header):
+                    # Another model, profile or preprocessing (or a log without a header)
+                    logger.warning(f"Discarding image embedding cache {self.path}: written for a different configuration")
+                    data = b""
+            if not data:
+                with open(self.path, "wb") as f:
+                    f.write(self._header)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._file = open(self.path, "ab")
+                return
+            offset = len(self._header)
+            whole = (len(data) - offset) // self._record_size
+            for i in range(whole):
+                start = offset + i * self._record_size
+                record = data[start:start + self._record_size]
+                value = np.frombuffer(record[32:], dtype=np.float32).copy()
+                value.flags.writeable = False
+                key = record[:32].hex()
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            self._log_records = whole
+            if len(data) != offset + whole * self._record_size:
+                # Partial record from an interrupted append
+                with open(self.path, "r+b") as f:
+                    f.truncate(offset + whole * self._record_size)
+            self._file = open(self.path, "ab")
+
+    def put(self, key: str, value: np.ndarray):
+        if self.max_size <= 0:
+            return
+        value = np.array(value, dtype=np.float32).reshape(self.dim)
+        super().put(key, value)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(bytes.fromhex(key) + value.tobytes())
+            self._file.flush()
+            self._log_records += 1
+            if self._log_records > 2 * self.max_size:
+                self._rewrite()
+
+    def _rewrite(self):
+        """Replace the log with just the live entries, oldest first."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._header)
+            for key, value in self._entries.items():
+                f.write(bytes.fromhex(key) + value.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
+        self._log_records = len(self._entries)
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of raw upload bytes."""
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from typing import Callable, List
+
+import torch
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_PROFILES = ("default", "cpu-int8")
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (honours affinity/cgroup pinning, unlike ``os.cpu_count``)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class InferenceProfile:
+    """
+    How the CLIP model is run.
+
+    - ``default``: the model as loaded (float32), torch's default threading.
+    - ``cpu-int8``: for CPU-only nodes. The linear layers of the vision and
+      text towers (attention projections and MLPs, nearly all of the FLOPs)
+      are dynamically quantized to int8: weights are stored as int8 and
+      activations are quantized per batch, so no calibration data is needed.
+      The embedding projections stay float32 to limit drift. Intra-op
+      threads default to the CPUs available to the container and inter-op
+      threads to 1, since the inference scheduler runs one forward at a time.
+
+    Thread counts can be set explicitly for either profile (0 = profile
+    default). They must be configured before the model runs anything, as
+    torch fixes the inter-op pool on first use.
+    """
+
+    def __init__(self, name: str = "default", intra_op_threads: int = 0, inter_op_threads: int = 0):
+        name = name.lower()
+        if name not in INFERENCE_PROFILES:
+            raise ValueError(f"Unknown inference profile '{name}' (expected one of {', '.join(INFERENCE_PROFILES)})")
+        self.name = name
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.quantized = False
+        self.warmup_ms = None
+
+    def configure_threads(self):
+        intra, inter = self.intra_op_threads, self.inter_op_threads
+        if self.name == "cpu-int8":
+            intra = intra or available_cpus()
+            inter = inter or 1
+        if intra:
+            torch.set_num_threads(intra)
+        if inter:
+            try:
+                torch.set_num_interop_threads(inter)
+            except RuntimeError:
+                logger.warning("Inter-op thread pool already started; keeping "
+                               f"{torch.get_num_interop_threads()} threads")
+
+    def prepare(self, model: torch.nn.Module, device: str) -> torch.nn.Module:
+        """Apply the profile to a loaded model (in place) and put it in eval mode."""
+        model.eval()
+        if self.name == "cpu-int8":
+            if device != "cpu":
+                logger.warning(f"Inference profile 'cpu-int8' needs a CPU model; running float32 on {device}")
+            else:
+                for tower in ("vision_model", "text_model"):
+                    torch.ao.quantization.quantize_dynamic(
+                        getattr(model, tower), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+                    )
+                self.quantized = True
+        return model
+
+    def warm_up(self, embed_images: Callable[[List[Image.Image]], object],
+                embed_texts: Callable[[List[str]], object], image_side: int):
+        """Run one image and one text forward so the first request does not pay for lazy initialization."""
+        start = time.perf_counter()
+        embed_images([Image.new("RGB", (image_side, image_side))])
+        embed_texts(["warmup"])
+        self.warmup_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Model warmup ({self.name}) took {self.warmup_ms:.0f} ms")
+
+    def stats(self) -> dict:
+        return {
+            "profile": self.name,
+            "quantized": self.quantized,
+            "intra_op_threads": torch.get_num_threads(),
+            "inter_op_threads": torch.get_num_interop_threads(),
+            "warmup_ms": round(self.warmup_ms, 1) if self.warmup_ms is not None else None,
+        }
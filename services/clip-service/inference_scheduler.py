@@ -0,0 +1,144 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ("item", "future", "loop", "enqueued_at")
+
+    def __init__(self, item: Any, future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.item = item
+        self.future = future
+        self.loop = loop
+        self.enqueued_at = time.monotonic()
+
+
+class InferenceScheduler:
+    """
+    Dynamic micro-batching for model inference.
+
+    Handlers ``await submit(queue, item)``; the request is parked in a named
+    queue and a single worker thread (which owns the model) drains queues in
+    batches. A batch is dispatched once it holds ``max_batch_size`` requests or
+    its oldest request has waited ``max_wait_ms``, whichever comes first. Each
+    queue has its own batch function, e.g. one for images and one for text.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queues: Dict[str, collections.deque] = {}
+        self._batch_fns: Dict[str, Callable[[List[Any]], np.ndarray]] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.stats = {"batches": 0, "requests": 0}
+
+    def register(self, name: str, batch_fn: Callable[[List[Any]], np.ndarray]):
+        """Add a queue whose batches are run through ``batch_fn`` (one row per input)."""
+        with self._cond:
+            self._queues[name] = collections.deque()
+            self._batch_fns[name] = batch_fn
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._worker, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def submit(self, name: str, item: Any) -> np.ndarray:
+        """Queue one input and wait for its row of the batched result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Inference scheduler is not running")
+            self._queues[name].append(_Request(item, future, loop))
+            self._cond.notify()
+        return await future
+
+    async def submit_many(self, name: str, items: List[Any]) -> np.ndarray:
+        """Queue several inputs at once; they are batched with any concurrent requests."""
+        rows = await asyncio.gather(*(self.submit(name, item) for item in items))
+        return np.stack(rows) if rows else np.empty((0, 0), dtype=np.float32)
+
+    def _next_batch(self):
+        """Block until a batch is ready. Returns (name, requests) or None on shutdown."""
+        with self._cond:
+            while True:
+                if not self._running:
+                    return None
+                pending = [name for name, queue in self._queues.items() if queue]
+                if not pending:
+                    self._cond.wait()
+                    continue
+                # Serve the queue whose head request has waited longest
+                name = min(pending, key=lambda n: self._queues[n][0].enqueued_at)
+                queue = self._queues[name]
+                deadline = queue[0].enqueued_at + self.max_wait
+                remaining = deadline - time.monotonic()
+                if len(queue) < self.max_batch_size and remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch_size))]
+                return name, batch
+
+    def _worker(self):
+        while True:
+            ready = self._next_batch()
+            if ready is None:
+                break
+            name, batch = ready
+            try:
+                results = self._batch_fns[name]([request.item for request in batch])
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} {name} requests failed: {e}")
+                for request in batch:
+                    _resolve(request, _set_exception, e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(batch)
+            for request, row in zip(batch, results):
+                _resolve(request, _set_result, row)
+
+        # Fail anything still queued so callers do not hang on shutdown
+        with self._cond:
+            for queue in self._queues.values():
+                while queue:
+                    _resolve(queue.popleft(), _set_exception, RuntimeError("Inference scheduler stopped"))
+
+
+def _resolve(request: _Request, setter, value):
+    """Hand a result back to the event loop that owns the request's future."""
+    try:
+        request.loop.call_soon_threadsafe(setter, request.future, value)
+    except RuntimeError:
+        # The loop has already been closed; nobody is waiting any more.
+        pass
+
+
+def _set_result(future: asyncio.Future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _set_exception(future: asyncio.Future, exc: BaseException):
+    if not future.done():
+        future.set_exception(exc)
@@ -0,0 +1,88 @@
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+FILTER_FIELDS = ("category", "color", "style")
+
+
+def normalize_value(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = " ".join(str(value).lower().split())
+    return value or None
+
+
+class RowList:
+    """Growable int64 array of row ids; appends are O(1) amortized."""
+
+    __slots__ = ("_rows", "_size")
+
+    def __init__(self):
+        self._rows = np.empty(16, dtype=np.int64)
+        self._size = 0
+
+    def append(self, row: int):
+        if self._size == len(self._rows):
+            grown = np.empty(len(self._rows) * 2, dtype=np.int64)
+            grown[:self._size] = self._rows
+            self._rows = grown
+        self._rows[self._size] = row
+        self._size += 1
+
+    def extend(self, rows: np.ndarray):
+        needed = self._size + len(rows)
+        if needed > len(self._rows):
+            capacity = len(self._rows)
+            while capacity < needed:
+                capacity *= 2
+            grown = np.empty(capacity, dtype=np.int64)
+            grown[:self._size] = self._rows[:self._size]
+            self._rows = grown
+        self._rows[self._size:needed] = rows
+        self._size = needed
+
+    def rows(self) -> np.ndarray:
+        return self._rows[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class InvertedIndex:
+    """
+    Attribute value -> row id postings over the item metadata.
+
+    Rows are appended in increasing order, so every posting list is sorted and
+    filters on several fields are answered by intersecting sorted arrays.
+    """
+
+    def __init__(self, fields: Iterable[str] = FILTER_FIELDS):
+        self.fields = tuple(fields)
+        self._postings: Dict[str, Dict[str, RowList]] = {field: {} for field in self.fields}
+
+    def add(self, row: int, item: dict):
+        for field in self.fields:
+            value = normalize_value(item.get(field))
+            if value is not None:
+                self._postings[field].setdefault(value, RowList()).append(row)
+
+    def rows(self, filters: Dict[str, Optional[str]]) -> Optional[np.ndarray]:
+        """
+        Sorted row ids matching every given filter, or None if no filter is set
+        (meaning "all rows").
+        """
+        result = None
+        for field, value in filters.items():
+            value = normalize_value(value)
+            if value is None:
+                continue
+            if field not in self._postings:
+                raise ValueError(f"Cannot filter on '{field}'")
+            postings = self._postings[field].get(value)
+            if postings is None:
+                return np.empty(0, dtype=np.int64)
+            rows = postings.rows()
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
@@ -1,23 +1,45 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 import torch
 from transformers import CLIPProcessor, CLIPModel
 from PIL import Image
-from sklearn.neighbors import NearestNeighbors
 import numpy as np
-import io
+import asyncio
+import time
 import os
 import json
-import pickle
 import logging
+from vector_store import EMBEDDING_DIM
+from ann_index import create_ann_index
+from vector_codecs import create_codec
+from inference_scheduler import InferenceScheduler
+from caches import LRUCache, PersistentEmbeddingCache, content_hash, normalize_query
+from partitions import PartitionManager, validate_wardrobe_id
+from durability import GroupCommitter
+from image_preprocessing import ImagePreprocessor, preprocess_image
+from inference_profile import InferenceProfile
+from startup import StartupTracker
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="CLIP Similarity Search Service")
 
+# Model and index load in the background after the server starts listening;
+# until they are ready only the probes (and the API docs) are served.
+startup = StartupTracker()
+UNGATED_PATHS = {"/healthz", "/readyz", "/docs", "/openapi.json"}
+
+@app.middleware("http")
+async def require_ready(request: Request, call_next):
+    if not startup.ready and request.url.path not in UNGATED_PATHS:
+        detail = f"Startup failed: {startup.error}" if startup.error else "Service is starting"
+        return JSONResponse(status_code=503, content={"detail": detail}, headers={"Retry-After": "5"})
+    return await call_next(request)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -29,56 +51,86 @@ app.add_middleware(
 
 # Configuration
 MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
+TEXT_CACHE_SIZE = int(os.getenv("CLIP_TEXT_CACHE_SIZE", "1024"))
+IMAGE_CACHE_SIZE = int(os.getenv("CLIP_IMAGE_CACHE_SIZE", "10000"))
+# "exact" (brute-force scan) or "ivf" (approximate, k-means inverted lists)
+INDEX_BACKEND = os.getenv("CLIP_INDEX_BACKEND", "exact")
+IVF_NLIST = int(os.getenv("CLIP_IVF_NLIST", "0"))  # 0 = ~4*sqrt(items)
+IVF_NPROBE = int(os.getenv("CLIP_IVF_NPROBE", "8"))
+IVF_MIN_TRAIN_ROWS = int(os.getenv("CLIP_IVF_MIN_TRAIN_ROWS", "4096"))
+# In-memory vector codec searched before exact re-ranking: float32, float16, int8 or pq
+VECTOR_CODEC = os.getenv("CLIP_VECTOR_CODEC", "float32")
+PQ_SUBVECTORS = int(os.getenv("CLIP_PQ_SUBVECTORS", "64"))
+# Candidates re-ranked exactly per result (unset = codec default, 0 = no re-rank)
+RERANK_FACTOR = int(os.environ["CLIP_RERANK_FACTOR"]) if os.getenv("CLIP_RERANK_FACTOR") else None
 VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "./data/embeddings")
 METADATA_PATH = os.getenv("METADATA_PATH", "./data/metadata.json")
+EMBED_BATCH_SIZE = int(os.getenv("CLIP_EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("CLIP_EMBED_MAX_WAIT_MS", "5"))
+MAX_EMBED_TEXTS = int(os.getenv("CLIP_MAX_EMBED_TEXTS", "512"))
+# fsync policy for uploads and deletes: always, group (batched fsync, the
+# response waits for it) or periodic (batched fsync, nobody waits)
+DURABILITY = os.getenv("CLIP_DURABILITY", "group")
+GROUP_COMMIT_MS = float(os.getenv("CLIP_GROUP_COMMIT_MS", "0"))
+# Processes decoding uploads (0 = threads in this process)
+DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Resident size budget for loaded wardrobe partitions (LRU-evicted beyond it)
+PARTITION_MEMORY_MB = int(os.getenv("CLIP_PARTITION_MEMORY_MB", "1024"))
+# "default" (float32) or "cpu-int8" (dynamic int8 quantization for CPU-only nodes)
+INFERENCE_PROFILE = os.getenv("CLIP_INFERENCE_PROFILE", "default")
+INTRA_OP_THREADS = int(os.getenv("CLIP_INTRA_OP_THREADS", "0"))  # 0 = profile default
+INTER_OP_THREADS = int(os.getenv("CLIP_INTER_OP_THREADS", "0"))
 
-# Initialize CLIP model
+# CLIP model (loaded by the startup task)
 device = "cuda" if torch.cuda.is_available() else "cpu"
-logger.info(f"Loading CLIP model: {MODEL_NAME} on {device}")
-model = CLIPModel.from_pretrained(MODEL_NAME).to(device)
-processor = CLIPProcessor.from_pretrained(MODEL_NAME)
+inference_profile = InferenceProfile(INFERENCE_PROFILE, INTRA_OP_THREADS, INTER_OP_THREADS)
+inference_profile.configure_threads()
+model = None
+processor = None
+# Uploads only need to be decoded down to the processor's input size
+CLIP_IMAGE_SIDE = 224
+
+def load_model():
+    global model, processor, CLIP_IMAGE_SIDE
+    logger.info(f"Loading CLIP model: {MODEL_NAME} on {device} (profile: {inference_profile.name})")
+    processor = CLIPProcessor.from_pretrained(MODEL_NAME)
+    CLIP_IMAGE_SIDE = processor.image_processor.size.get("shortest_edge", 224)
+    model = inference_profile.prepare(CLIPModel.from_pretrained(MODEL_NAME).to(device), device)
+
+# Initialize vector storage
+# Embeddings are appended to memory-mapped .npy segments and metadata to a
+# JSON-lines log next to METADATA_PATH, so an upload never rewrites the index.
+# Each wardrobe_id gets its own partition (store, ANN index and dedup map);
+# requests without one use the default partition at the configured paths.
+committer = GroupCommitter(DURABILITY, GROUP_COMMIT_MS)
+
+def configure_store(store):
+    store.committer = committer
+    store.codec = create_codec(VECTOR_CODEC, store.dim, rerank_factor=RERANK_FACTOR, subvectors=PQ_SUBVECTORS)
+    store.ann = create_ann_index(
+        INDEX_BACKEND, store, nlist=IVF_NLIST, nprobe=IVF_NPROBE, min_train_rows=IVF_MIN_TRAIN_ROWS
+    )
+
+partitions = PartitionManager(
+    VECTOR_DB_PATH,
+    os.path.splitext(METADATA_PATH)[0] + ".jsonl",
+    PARTITION_MEMORY_MB * 1024 * 1024,
+    configure=configure_store
+)
 
-# Initialize vector storage using sklearn
-EMBEDDING_DIM = 512
-embeddings_array = None
-nearest_neighbors = None
-metadata = []
+# Content-hash embedding cache (SHA-256 of the raw bytes -> embedding).
+# Embeddings do not depend on the wardrobe, so the cache is shared. They do
+# depend on the model, the inference profile and how uploads are decoded, so
+# the cache file is discarded when any of those changes.
+IMAGE_PREPROCESSING_VERSION = 1  # bump when upload decoding changes what CLIP sees
+image_embedding_cache = PersistentEmbeddingCache(
+    f"{VECTOR_DB_PATH}.imgcache", IMAGE_CACHE_SIZE, EMBEDDING_DIM,
+    fingerprint=f"{MODEL_NAME}|{inference_profile.name}|preprocessing-v{IMAGE_PREPROCESSING_VERSION}"
+)
 
 def load_or_create_index():
-    global embeddings_array, nearest_neighbors, metadata
-    os.makedirs(os.path.dirname(VECTOR_DB_PATH) or "./data", exist_ok=True)
-    
-    if os.path.exists(f"{VECTOR_DB_PATH}.pkl"):
-        logger.info("Loading existing embeddings")
-        with open(f"{VECTOR_DB_PATH}.pkl", 'rb') as f:
-            embeddings_array = pickle.load(f)
-        if os.path.exists(METADATA_PATH):
-            with open(METADATA_PATH, 'r') as f:
-                metadata = json.load(f)
-        # Rebuild nearest neighbors index
-        if len(embeddings_array) > 0:
-            nearest_neighbors = NearestNeighbors(n_neighbors=min(10, len(embeddings_array)), metric='cosine')
-            nearest_neighbors.fit(embeddings_array)
-    else:
-        logger.info("Creating new embeddings storage")
-        embeddings_array = np.array([]).reshape(0, EMBEDDING_DIM)
-        metadata = []
-        save_index()
-
-def save_index():
-    with open(f"{VECTOR_DB_PATH}.pkl", 'wb') as f:
-        pickle.dump(embeddings_array, f)
-    with open(METADATA_PATH, 'w') as f:
-        json.dump(metadata, f)
-
-load_or_create_index()
-
-class ItemMetadata(BaseModel):
-    item_id: str
-    category: Optional[str] = None
-    color: Optional[str] = None
-    style: Optional[str] = None
-    description: Optional[str] = None
+    image_embedding_cache.load()
+    partitions.get(None)
 
 class SimilarityResult(BaseModel):
     item_id: str
@@ -88,30 +140,222 @@ class SimilarityResult(BaseModel):
 class SearchRequest(BaseModel):
     query_text: Optional[str] = None
     top_k: int = 5
+    wardrobe_id: Optional[str] = None
+    category: Optional[str] = None
+    color: Optional[str] = None
+    style: Optional[str] = None
+
+class EmbedTextRequest(BaseModel):
+    texts: List[str]
+
+class OutfitRequest(BaseModel):
+    item_id: Optional[str] = None
+    query_text: Optional[str] = None
+    top_n: int = 5
+    include_accessory: bool = True
+    wardrobe_id: Optional[str] = None
+
+def get_image_embeddings(images: List[Image.Image], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """Generate CLIP embeddings for a list of images, one forward pass per mini-batch."""
+    batches = []
+    for start in range(0, len(images), batch_size):
+        inputs = processor(images=images[start:start + batch_size], return_tensors="pt").to(device)
+        with torch.inference_mode():
+            image_features = model.get_image_features(**inputs)
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        batches.append(image_features.cpu().numpy())
+    if not batches:
+        return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.concatenate(batches)
 
 def get_image_embedding(image: Image.Image) -> np.ndarray:
     """Generate CLIP embedding for an image."""
-    inputs = processor(images=image, return_tensors="pt").to(device)
-    with torch.no_grad():
-        image_features = model.get_image_features(**inputs)
-        image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-    return image_features.cpu().numpy()[0]
-
-def get_text_embedding(text: str) -> np.ndarray:
-    """Generate CLIP embedding for text."""
-    inputs = processor(text=[text], return_tensors="pt", padding=True).to(device)
-    with torch.no_grad():
-        text_features = model.get_text_features(**inputs)
-        text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-    return text_features.cpu().numpy()[0]
+    return get_image_embeddings([image])[0]
+
+def decode_image(image_data: bytes) -> Image.Image:
+    """Decode uploaded bytes into an upright RGB image, no larger than CLIP needs."""
+    return preprocess_image(image_data, min_side=CLIP_IMAGE_SIDE)[0]
+
+def get_text_embeddings(texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """Generate CLIP embeddings for a list of texts, one forward pass per mini-batch."""
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        inputs = processor(text=texts[start:start + batch_size], return_tensors="pt", padding=True).to(device)
+        with torch.inference_mode():
+            text_features = model.get_text_features(**inputs)
+            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+        batches.append(text_features.cpu().numpy())
+    if not batches:
+        return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.concatenate(batches)
+
+# Inference scheduler
+# Handlers never call the model directly: concurrent requests are queued and
+# run as micro-batches on a dedicated worker thread, keeping the event loop free.
+scheduler = InferenceScheduler(max_batch_size=EMBED_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS)
+scheduler.register("image", get_image_embeddings)
+scheduler.register("text", get_text_embeddings)
+
+# Upload decoding (draft-mode JPEG decode, EXIF orientation) in worker processes
+preprocessor = ImagePreprocessor(DECODE_WORKERS)
+
+@app.on_event("startup")
+async def start_scheduler():
+    # Fork decode workers before the other background threads start
+    preprocessor.start()
+    scheduler.start()
+    committer.start()
+    startup.start(
+        concurrent={"model": load_model, "index": load_or_create_index},
+        sequential={"warmup": lambda: inference_profile.warm_up(
+            get_image_embeddings, get_text_embeddings, CLIP_IMAGE_SIDE
+        )},
+    )
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await startup.stop()
+    scheduler.stop()
+    partitions.close()
+    committer.stop()
+    preprocessor.stop()
+
+# Text embedding cache
+# Popular queries repeat constantly; a hit skips tokenization and the model.
+text_embedding_cache = LRUCache(TEXT_CACHE_SIZE)
+
+async def embed_text_query(text: str) -> np.ndarray:
+    """Embed a search query, serving repeated queries from the LRU cache."""
+    key = (MODEL_NAME, normalize_query(text))
+    embedding = text_embedding_cache.get(key)
+    if embedding is None:
+        embedding = await scheduler.submit("text", text)
+        text_embedding_cache.put(key, embedding)
+    return embedding
+
+async def embed_text_queries(texts: List[str]) -> np.ndarray:
+    """Embed several queries; cache misses go to the model together in one batch."""
+    keys = [(MODEL_NAME, normalize_query(text)) for text in texts]
+    embeddings = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    misses: Dict[tuple, List[int]] = {}
+    for i, key in enumerate(keys):
+        cached = text_embedding_cache.get(key)
+        if cached is not None:
+            embeddings[i] = cached
+        else:
+            misses.setdefault(key, []).append(i)
+    
+    if misses:
+        computed = await scheduler.submit_many("text", [texts[positions[0]] for positions in misses.values()])
+        for (key, positions), embedding in zip(misses.items(), computed):
+            embeddings[positions] = embedding
+            text_embedding_cache.put(key, embedding)
+    return embeddings
+
+async def decode_image_async(image_data: bytes) -> Image.Image:
+    """Decode an image in the preprocessing pool instead of on the event loop."""
+    image, _ = await preprocessor.run(image_data, min_side=CLIP_IMAGE_SIDE)
+    return image
+
+async def embed_image_bytes(image_data: List[bytes]) -> np.ndarray:
+    """
+    Embed raw image uploads, reusing cached vectors for previously seen bytes.
+    Only cache misses are decoded and sent through CLIP.
+    """
+    hashes = [content_hash(data) for data in image_data]
+    embeddings = np.empty((len(image_data), EMBEDDING_DIM), dtype=np.float32)
+    misses: Dict[str, List[int]] = {}
+    for i, digest in enumerate(hashes):
+        cached = image_embedding_cache.get(digest)
+        if cached is not None:
+            embeddings[i] = cached
+        else:
+            misses.setdefault(digest, []).append(i)
+    
+    if misses:
+        first_positions = [positions[0] for positions in misses.values()]
+        images = await asyncio.gather(*(decode_image_async(image_data[i]) for i in first_positions))
+        computed = await scheduler.submit_many("image", list(images))
+        for (digest, positions), embedding in zip(misses.items(), computed):
+            embeddings[positions] = embedding
+            image_embedding_cache.put(digest, embedding)
+    return embeddings
+
+async def wait_durable(store):
+    """Hold a write's response until its group commit has fsynced it."""
+    ticket = store.commit_ticket
+    if not committer.durable(ticket):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, store.wait_durable, ticket)
+
+async def enforce_partition_budget(wardrobe_id: Optional[str]):
+    """After a partition grew, evict others if the total is over budget (closing them syncs their logs)."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, partitions.enforce_budget, wardrobe_id)
+
+def build_results(hits) -> List[SimilarityResult]:
+    """Turn (metadata, similarity) pairs from the store into API results."""
+    return [
+        SimilarityResult(
+            item_id=item["item_id"],
+            similarity_score=score,
+            metadata=item
+        )
+        for item, score in hits
+    ]
+
+def next_item_ids(store, count: int) -> List[str]:
+    """Generate default item ids that are not already in use in ``store``."""
+    ids = []
+    n = store.live_count
+    while len(ids) < count:
+        candidate = f"item_{n}"
+        if candidate not in store.id_rows:
+            ids.append(candidate)
+        n += 1
+    return ids
+
+def open_partition(wardrobe_id: Optional[str]):
+    """Pin the wardrobe's partition for a request; invalid ids are a 400."""
+    try:
+        validate_wardrobe_id(wardrobe_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return partitions.use(wardrobe_id)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is serving; fails only if startup failed."""
+    if startup.error:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": startup.error})
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: model and index are loaded and the model is warm."""
+    stats = startup.stats()
+    if not startup.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", **stats})
+    return {"status": "ready", **stats}
 
 @app.get("/")
 async def root():
+    default = (await partitions.get_async(None)).store
     return {
         "service": "CLIP Similarity Search Service",
         "model": MODEL_NAME,
-        "total_items": len(metadata),
-        "device": device
+        "total_items": default.live_count,
+        "device": device,
+        "startup": startup.stats(),
+        "inference_profile": inference_profile.stats(),
+        "index": default.ann.stats(),
+        "storage": default.storage_stats(),
+        "partitions": partitions.stats(),
+        "durability": committer.stats(),
+        "inference": scheduler.stats,
+        "preprocessing": preprocessor.stats(),
+        "text_cache": text_embedding_cache.stats(),
+        "image_cache": image_embedding_cache.stats()
     }
 
 @app.post("/upload", response_model=dict)
@@ -121,131 +365,360 @@ async def upload_item(
     category: Optional[str] = None,
     color: Optional[str] = None,
     style: Optional[str] = None,
-    description: Optional[str] = None
+    description: Optional[str] = None,
+    skip_duplicates: bool = False,
+    wardrobe_id: Optional[str] = None
 ):
     """Upload a clothing item and generate its embedding."""
-    global embeddings_array, nearest_neighbors
     try:
-        # Read and process image
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data)).convert("RGB")
-        
-        # Generate embedding
-        embedding = get_image_embedding(image)
-        
-        # Add to embeddings array
-        embeddings_array = np.vstack([embeddings_array, embedding.reshape(1, -1)])
-        
-        # Store metadata
-        if item_id is None:
-            item_id = f"item_{len(metadata)}"
-        
-        item_metadata = {
-            "item_id": item_id,
-            "category": category,
-            "color": color,
-            "style": style,
-            "description": description,
-            "filename": file.filename
-        }
-        metadata.append(item_metadata)
-        
-        # Rebuild nearest neighbors index
-        nearest_neighbors = NearestNeighbors(n_neighbors=min(10, len(embeddings_array)), metric='cosine')
-        nearest_neighbors.fit(embeddings_array)
-        
-        # Save index and metadata
-        save_index()
-        
-        logger.info(f"Added item {item_id} to index")
-        return {
-            "success": True,
-            "item_id": item_id,
-            "total_items": len(metadata)
-        }
+        async with open_partition(wardrobe_id) as partition:
+            store = partition.store
+            
+            # Read image and check whether these exact bytes are already indexed
+            image_data = await file.read()
+            digest = content_hash(image_data)
+            existing_id = partition.content_index.get(digest)
+            if existing_id is not None and skip_duplicates:
+                return {
+                    "success": True,
+                    "item_id": existing_id,
+                    "duplicate": True,
+                    "total_items": store.live_count
+                }
+            
+            # Generate embedding (served from the content-hash cache when possible)
+            embedding = (await embed_image_bytes([image_data]))[0]
+            
+            # Store metadata
+            if item_id is None:
+                item_id = next_item_ids(store, 1)[0]
+            
+            item_metadata = {
+                "item_id": item_id,
+                "category": category,
+                "color": color,
+                "style": style,
+                "description": description,
+                "filename": file.filename,
+                "content_hash": digest
+            }
+            
+            # Append to the store; the item is searchable immediately. Off the
+            # event loop: with CLIP_DURABILITY=always the write fsyncs inline
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, store.add, embedding, item_metadata)
+            partition.content_index.setdefault(digest, item_id)
+            await wait_durable(store)
+            await enforce_partition_budget(wardrobe_id)
+            
+            logger.info(f"Added item {item_id} to index {wardrobe_id or 'default'}")
+            return {
+                "success": True,
+                "item_id": item_id,
+                "duplicate": existing_id is not None,
+                "total_items": store.live_count
+            }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading item: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/search/image", response_model=List[SimilarityResult])
-async def search_by_image(file: UploadFile = File(...), top_k: int = 5):
-    """Search for similar items using an image."""
+@app.post("/upload/batch", response_model=dict)
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    items: Optional[str] = Form(None),
+    skip_duplicates: bool = Form(False),
+    wardrobe_id: Optional[str] = Form(None)
+):
+    """
+    Upload many clothing items at once.
+    `items` is an optional JSON array of per-file metadata objects
+    (item_id, category, color, style, description), aligned with `files`.
+    With `skip_duplicates`, files whose bytes are already indexed (or repeat
+    earlier in the batch) are not added and report the existing item_id.
+    """
     try:
-        if len(metadata) == 0:
-            return []
-        
-        # Read and process image
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data)).convert("RGB")
-        
-        # Generate embedding
-        query_embedding = get_image_embedding(image)
-        
-        # Search using nearest neighbors
-        k = min(top_k, len(embeddings_array))
-        distances, indices = nearest_neighbors.kneighbors([query_embedding], n_neighbors=k)
-        
-        # Prepare results
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx < len(metadata):
-                # Convert cosine distance to similarity score (0-1, higher is better)
-                similarity_score = 1.0 - float(dist)
-                results.append(SimilarityResult(
-                    item_id=metadata[idx]["item_id"],
-                    similarity_score=similarity_score,
-                    metadata=metadata[idx]
-                ))
+        item_fields = json.loads(items) if items else []
+        if (not isinstance(item_fields, list) or len(item_fields) > len(files)
+                or not all(isinstance(fields, dict) for fields in item_fields)):
+            raise HTTPException(status_code=400, detail="items must be a JSON array with at most one entry per file")
+        item_fields += [{}] * (len(files) - len(item_fields))
         
-        return results
+        async with open_partition(wardrobe_id) as partition:
+            store = partition.store
+            
+            # Read all files concurrently and hash their contents
+            image_data = await asyncio.gather(*(file.read() for file in files))
+            hashes = [content_hash(data) for data in image_data]
+            
+            item_ids: List[Optional[str]] = [None] * len(files)
+            new_positions = []
+            seen: Dict[str, str] = {}
+            default_ids = iter(next_item_ids(store, len(files)))
+            for i, (file, fields, digest) in enumerate(zip(files, item_fields, hashes)):
+                existing_id = partition.content_index.get(digest) or seen.get(digest)
+                if existing_id is not None and skip_duplicates:
+                    item_ids[i] = existing_id
+                    continue
+                item_ids[i] = fields.get("item_id") or next(default_ids)
+                seen.setdefault(digest, item_ids[i])
+                new_positions.append(i)
+            
+            # Embed new items; cache misses are decoded concurrently and encoded
+            # through the scheduler in CLIP_EMBED_BATCH_SIZE mini-batches
+            embeddings = await embed_image_bytes([image_data[i] for i in new_positions])
+            
+            # Build metadata and append everything with a single persist
+            batch_metadata = []
+            for i in new_positions:
+                fields = item_fields[i]
+                batch_metadata.append({
+                    "item_id": item_ids[i],
+                    "category": fields.get("category"),
+                    "color": fields.get("color"),
+                    "style": fields.get("style"),
+                    "description": fields.get("description"),
+                    "filename": files[i].filename,
+                    "content_hash": hashes[i]
+                })
+            if batch_metadata:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, store.add_many, embeddings, batch_metadata)
+            for item in batch_metadata:
+                partition.content_index.setdefault(item["content_hash"], item["item_id"])
+            await wait_durable(store)
+            if batch_metadata:
+                await enforce_partition_budget(wardrobe_id)
+            
+            logger.info(f"Added {len(batch_metadata)} items to index {wardrobe_id or 'default'}")
+            return {
+                "success": True,
+                "item_ids": item_ids,
+                "skipped_duplicates": len(files) - len(batch_metadata),
+                "total_items": store.live_count
+            }
+    except HTTPException:
+        raise
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"items is not valid JSON: {e}")
+    except Exception as e:
+        logger.error(f"Error uploading batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/image", response_model=List[SimilarityResult])
+async def search_by_image(
+    file: UploadFile = File(...),
+    top_k: int = 5,
+    category: Optional[str] = None,
+    color: Optional[str] = None,
+    style: Optional[str] = None,
+    wardrobe_id: Optional[str] = None
+):
+    """Search for similar items using an image, optionally within a wardrobe and category/color/style."""
+    try:
+        async with open_partition(wardrobe_id) as partition:
+            if partition.store.live_count == 0:
+                return []
+            
+            # Read image and embed it (served from the content-hash cache when possible)
+            image_data = await file.read()
+            query_embedding = (await embed_image_bytes([image_data]))[0]
+            
+            # Cosine search, restricted to matching rows by the inverted indexes
+            filters = {"category": category, "color": color, "style": style}
+            return build_results(partition.store.search_items(query_embedding, top_k, filters))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error searching by image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/search/text", response_model=List[SimilarityResult])
 async def search_by_text(request: SearchRequest):
-    """Search for items using text description."""
+    """Search for items using text description, optionally within a wardrobe and category/color/style."""
     try:
-        if len(metadata) == 0:
-            return []
-        
-        if not request.query_text:
-            raise HTTPException(status_code=400, detail="query_text is required")
-        
-        # Generate text embedding
-        query_embedding = get_text_embedding(request.query_text)
+        async with open_partition(request.wardrobe_id) as partition:
+            if partition.store.live_count == 0:
+                return []
+            
+            if not request.query_text:
+                raise HTTPException(status_code=400, detail="query_text is required")
+            
+            # Generate text embedding
+            query_embedding = await embed_text_query(request.query_text)
+            
+            # Cosine search, restricted to matching rows by the inverted indexes
+            filters = {"category": request.category, "color": request.color, "style": request.style}
+            return build_results(partition.store.search_items(query_embedding, request.top_k, filters))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching by text: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/embed/text", response_model=dict)
+async def embed_texts(request: EmbedTextRequest):
+    """Return normalized CLIP text embeddings (for other services ranking by relevance)."""
+    try:
+        if len(request.texts) > MAX_EMBED_TEXTS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_EMBED_TEXTS} texts per request")
+        embeddings = await embed_text_queries(request.texts)
+        return {
+            "model": MODEL_NAME,
+            "dim": EMBEDDING_DIM,
+            "embeddings": np.round(embeddings, 5).tolist()
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error embedding texts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/batch", response_model=List[List[SimilarityResult]])
+async def search_batch(
+    queries: str = Form(...),
+    files: List[UploadFile] = File(None),
+    top_k: int = Form(5),
+    wardrobe_id: Optional[str] = Form(None)
+):
+    """
+    Run many searches in one request; results come back in query order.
+    `queries` is a JSON array of objects, each with exactly one of
+    `text`, `image` (index into `files`) or `item_id` (an indexed item,
+    which is left out of its own results), plus optional category/color/style.
+    New texts and images are embedded in one batch each, and all queries are
+    scored against the index together as a single matrix product.
+    """
+    try:
+        specs = json.loads(queries)
+        files = files or []
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            raise HTTPException(status_code=400, detail="queries must be a JSON array of objects")
+        kinds = []
+        for i, spec in enumerate(specs):
+            given = [kind for kind in ("text", "image", "item_id") if spec.get(kind) is not None]
+            if len(given) != 1:
+                raise HTTPException(status_code=400, detail=f"Query {i} needs exactly one of text, image or item_id")
+            if given[0] == "image" and not (isinstance(spec["image"], int) and 0 <= spec["image"] < len(files)):
+                raise HTTPException(status_code=400, detail=f"Query {i} refers to a missing file")
+            kinds.append(given[0])
         
-        # Search using nearest neighbors
-        k = min(request.top_k, len(embeddings_array))
-        distances, indices = nearest_neighbors.kneighbors([query_embedding], n_neighbors=k)
+        async with open_partition(wardrobe_id) as partition:
+            store = partition.store
+            embeddings = np.empty((len(specs), EMBEDDING_DIM), dtype=np.float32)
+            
+            # Existing items reuse their stored vectors
+            for i, kind in enumerate(kinds):
+                if kind == "item_id":
+                    vector = store.get_item_vector(specs[i]["item_id"])
+                    if vector is None:
+                        raise HTTPException(status_code=404, detail=f"Item {specs[i]['item_id']} not found")
+                    embeddings[i] = vector
+            
+            # New inputs are embedded with one batched call per modality
+            text_positions = [i for i, kind in enumerate(kinds) if kind == "text"]
+            image_positions = [i for i, kind in enumerate(kinds) if kind == "image"]
+            image_data = await asyncio.gather(*(file.read() for file in files))
+            text_embeddings, image_embeddings = await asyncio.gather(
+                embed_text_queries([str(specs[i]["text"]) for i in text_positions]),
+                embed_image_bytes([image_data[specs[i]["image"]] for i in image_positions])
+            )
+            embeddings[text_positions] = text_embeddings
+            embeddings[image_positions] = image_embeddings
+            
+            # Item queries ask for one extra hit to make room for dropping themselves
+            filters = [{field: spec.get(field) for field in ("category", "color", "style")} for spec in specs]
+            extra = 1 if "item_id" in kinds else 0
+            hits = store.search_items_many(embeddings, top_k + extra, filters)
+            results = []
+            for spec, kind, query_hits in zip(specs, kinds, hits):
+                if kind == "item_id":
+                    query_hits = [hit for hit in query_hits if hit[0]["item_id"] != spec["item_id"]]
+                results.append(build_results(query_hits[:top_k]))
+            return results
+    except HTTPException:
+        raise
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"queries is not valid JSON: {e}")
+    except Exception as e:
+        logger.error(f"Error in batch search: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/outfits/complete")
+async def complete_outfit(request: OutfitRequest):
+    """
+    Complete the look: the best top + bottom + shoes (+ optional accessory)
+    outfits around an anchor item or a text prompt, from one wardrobe.
+    """
+    try:
+        if (request.item_id is None) == (request.query_text is None):
+            raise HTTPException(status_code=400, detail="Give exactly one of item_id or query_text")
         
-        # Prepare results
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx < len(metadata):
-                similarity_score = 1.0 - float(dist)
-                results.append(SimilarityResult(
-                    item_id=metadata[idx]["item_id"],
-                    similarity_score=similarity_score,
-                    metadata=metadata[idx]
-                ))
+        async with open_partition(request.wardrobe_id) as partition:
+            anchor_item = None
+            if request.item_id is not None:
+                anchor_item = partition.store.get_item(request.item_id)
+                anchor = partition.store.get_item_vector(request.item_id)
+                if anchor_item is None or anchor is None:
+                    raise HTTPException(status_code=404, detail=f"Item {request.item_id} not found")
+            else:
+                anchor = await embed_text_query(request.query_text)
+            
+            start = time.perf_counter()
+            outfits = partition.outfits.complete(
+                anchor, anchor_item, top_n=request.top_n, include_optional=request.include_accessory
+            )
+            elapsed_ms = (time.perf_counter() - start) * 1000
         
-        return results
+        return {
+            "anchor": anchor_item or {"query_text": request.query_text},
+            "outfits": [
+                {
+                    "score": score,
+                    "items": [
+                        {"slot": slot, "item_id": item["item_id"], "metadata": item}
+                        for slot, item in items
+                    ]
+                }
+                for score, items in outfits
+            ],
+            "search_ms": round(elapsed_ms, 2)
+        }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error searching by text: {e}")
+        logger.error(f"Error completing outfit: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/items", response_model=List[dict])
-async def list_items():
-    """List all items in the database."""
-    return metadata
+async def list_items(wardrobe_id: Optional[str] = None):
+    """List all items in the database (or in one wardrobe)."""
+    async with open_partition(wardrobe_id) as partition:
+        return partition.store.live_items()
 
 @app.delete("/items/{item_id}")
-async def delete_item(item_id: str):
-    """Delete an item from the database."""
-    # Note: FAISS doesn't support deletion easily, so we'd need to rebuild the index
-    # This is a simplified version
-    raise HTTPException(status_code=501, detail="Deletion not implemented yet")
+async def delete_item(item_id: str, wardrobe_id: Optional[str] = None):
+    """
+    Delete an item from the database.
+    The row is tombstoned and disappears from search immediately; storage is
+    reclaimed later by a background compaction, never on this request.
+    """
+    async with open_partition(wardrobe_id) as partition:
+        loop = asyncio.get_running_loop()
+        deleted = await loop.run_in_executor(None, partition.store.delete, item_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail=f"Item {item_id} not found")
+        for item in deleted:
+            if partition.content_index.get(item.get("content_hash")) == item_id:
+                del partition.content_index[item["content_hash"]]
+        await wait_durable(partition.store)
+        logger.info(f"Deleted item {item_id} from index {wardrobe_id or 'default'}")
+        return {
+            "success": True,
+            "item_id": item_id,
+            "total_items": partition.store.live_count
+        }
 
 if __name__ == "__main__":
     import uvicorn
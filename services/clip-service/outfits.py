@@ -0,0 +1,135 @@
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from inverted_index import normalize_value
+
+# Wardrobe categories (as offered by the upload form) that make up an outfit
+OUTFIT_SLOTS = ("top", "bottom", "shoes", "accessory")
+OPTIONAL_SLOTS = ("accessory",)
+
+
+class OutfitBuilder:
+    """
+    "Complete the look": assembles whole outfits from one store.
+
+    An outfit is scored as
+    ``anchor_weight * mean(anchor . item) + (1 - anchor_weight) * mean(item_i . item_j)``,
+    i.e. how well its items match the anchor (an item or a text prompt) and
+    how well they match each other. Slots are filled one category at a time
+    with a beam search: each category contributes only its
+    ``candidates_per_slot`` items closest to the anchor, every beam is
+    extended with every candidate in one matrix product (the pairwise term
+    of a new item against a beam is its dot product with the sum of the
+    beam's vectors), and the best ``beam_width`` partial outfits survive.
+
+    Per-category vector blocks are built once and reused until the store
+    changes (an add, a delete or a compaction).
+    """
+
+    def __init__(self, store, slots: Sequence[str] = OUTFIT_SLOTS, optional: Sequence[str] = OPTIONAL_SLOTS,
+                 candidates_per_slot: int = 64, beam_width: int = 32, anchor_weight: float = 0.5):
+        self.store = store
+        self.slots = tuple(slots)
+        self.optional = set(optional)
+        self.candidates_per_slot = candidates_per_slot
+        self.beam_width = beam_width
+        self.anchor_weight = anchor_weight
+        self._blocks: Dict[str, Tuple[np.ndarray, List[dict]]] = {}
+        self._blocks_version = None
+        self._lock = threading.Lock()
+
+    def _category_blocks(self) -> Dict[str, Tuple[np.ndarray, List[dict]]]:
+        with self._lock:
+            version = self.store.version
+            if version != self._blocks_version:
+                self._blocks = {slot: self.store.category_block(slot) for slot in self.slots}
+                self._blocks_version = version
+            return self._blocks
+
+    def complete(self, anchor: np.ndarray, anchor_item: Optional[dict] = None, top_n: int = 5,
+                 include_optional: bool = True) -> List[Tuple[float, List[Tuple[str, dict]]]]:
+        """
+        Best ``top_n`` outfits for an anchor vector, as (score, [(slot, item)])
+        pairs, best first. With ``anchor_item``, the anchor is itself worn: it
+        fills its category's slot and is never offered as a candidate.
+        """
+        anchor = np.asarray(anchor, dtype=np.float32)
+        blocks = self._category_blocks()
+        anchor_slot = normalize_value((anchor_item or {}).get("category"))
+        anchor_id = (anchor_item or {}).get("item_id")
+
+        # Beam state: one row per partial outfit
+        members = np.empty((1, 0), dtype=np.int64)
+        if anchor_item is not None:
+            vector_sum = anchor[None, :].copy()
+            item_count = np.ones(1)
+        else:
+            vector_sum = np.zeros((1, len(anchor)), dtype=np.float32)
+            item_count = np.zeros(1)
+        anchor_sum = np.zeros(1)
+        anchor_count = np.zeros(1)
+        pair_sum = np.zeros(1)
+        scores = np.zeros(1)
+        slots = []
+
+        for slot in self.slots:
+            if slot == anchor_slot or (slot in self.optional and not include_optional):
+                continue
+            vectors, items = blocks[slot]
+            if anchor_id is not None and len(items):
+                keep = np.array([item["item_id"] != anchor_id for item in items])
+                vectors, items = vectors[keep], [item for item, kept in zip(items, keep) if kept]
+            if not len(items):
+                continue
+
+            # Shortlist the category by similarity to the anchor
+            affinity = vectors @ anchor
+            shortlist = np.argpartition(-affinity, min(self.candidates_per_slot, len(items)) - 1)
+            shortlist = shortlist[:self.candidates_per_slot]
+            candidates, affinity = vectors[shortlist], affinity[shortlist]
+
+            # Extend every beam with every candidate at once: (beams, candidates)
+            new_anchor_sum = anchor_sum[:, None] + affinity[None, :]
+            new_pair_sum = pair_sum[:, None] + vector_sum @ candidates.T
+            new_count = item_count[:, None] + 1
+            extended = _outfit_score(new_anchor_sum, (anchor_count + 1)[:, None], new_pair_sum, new_count,
+                                     self.anchor_weight)
+            if slot in self.optional:
+                # Leaving the slot empty is one more "candidate" per beam
+                extended = np.concatenate([extended, scores[:, None]], axis=1)
+
+            flat = extended.ravel()
+            keep = min(self.beam_width, len(flat))
+            best = np.argpartition(-flat, keep - 1)[:keep]
+            beam, choice = np.divmod(best, extended.shape[1])
+            skipped = choice == len(candidates)
+            choice = np.where(skipped, 0, choice)
+            taken = ~skipped
+
+            members = np.concatenate([members[beam], np.where(skipped, -1, shortlist[choice])[:, None]], axis=1)
+            vector_sum = vector_sum[beam] + candidates[choice] * taken[:, None]
+            anchor_sum = np.where(taken, new_anchor_sum[beam, choice], anchor_sum[beam])
+            anchor_count = anchor_count[beam] + taken
+            pair_sum = np.where(taken, new_pair_sum[beam, choice], pair_sum[beam])
+            item_count = item_count[beam] + taken
+            scores = flat[best]
+            slots.append((slot, items))
+
+        if not slots:
+            return []
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        outfits = []
+        for beam in order:
+            outfit = [(anchor_slot, anchor_item)] if anchor_item is not None else []
+            outfit += [(slot, items[row]) for (slot, items), row in zip(slots, members[beam]) if row >= 0]
+            outfits.append((float(scores[beam]), outfit))
+        return outfits
+
+
+def _outfit_score(anchor_sum, anchor_count, pair_sum, item_count, anchor_weight: float):
+    pairs = item_count * (item_count - 1) / 2
+    anchor_mean = anchor_sum / np.maximum(anchor_count, 1)
+    pair_mean = pair_sum / np.maximum(pairs, 1)
+    return anchor_weight * anchor_mean + (1 - anchor_weight) * pair_mean
@@ -0,0 +1,199 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import logging
+import os
+import re
+import threading
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from outfits import OutfitBuilder
+from vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+WARDROBE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def validate_wardrobe_id(key: Optional[str]):
+    """Wardrobe ids become directory names, so only a safe charset is accepted."""
+    if key is not None and not WARDROBE_ID_PATTERN.match(key):
+        raise ValueError("wardrobe_id must be 1-64 letters, digits, '-' or '_'")
+
+
+class Partition:
+    """One wardrobe's store plus state derived from it: the content-hash ->
+    item_id map used for dedup and the outfit builder's category blocks."""
+
+    def __init__(self, key: Optional[str], store: VectorStore):
+        self.key = key
+        self.store = store
+        self.content_index: Dict[str, str] = {}
+        self.outfits = OutfitBuilder(store)
+        self.pins = 0
+
+    def load(self):
+        self.store.load()
+        self.content_index.clear()
+        for item in self.store.live_items():
+            if item.get("content_hash"):
+                self.content_index[item["content_hash"]] = item["item_id"]
+
+
+class PartitionManager:
+    """
+    Per-wardrobe index partitions, loaded lazily and evicted LRU.
+
+    The default partition (no wardrobe id) uses the configured store paths;
+    every other wardrobe gets its own directory under ``root/wardrobes``.
+    Partitions are opened on first use, without holding the manager lock:
+    concurrent requests for a cold wardrobe share one load, and requests for
+    other wardrobes are not held up by it. After each load, least-recently-
+    used partitions that are neither pinned by an in-flight request nor
+    in use by a background thread are closed until the total resident size
+    fits ``memory_budget_bytes``; ``enforce_budget`` does the same after a
+    partition grows.
+    """
+
+    def __init__(self, default_base_path: str, default_metadata_path: str,
+                 memory_budget_bytes: int, configure: Optional[Callable[[VectorStore], None]] = None):
+        self.default_base_path = default_base_path
+        self.default_metadata_path = default_metadata_path
+        self.root = os.path.join(os.path.dirname(default_base_path) or ".", "wardrobes")
+        self.memory_budget_bytes = memory_budget_bytes
+        self.configure = configure
+        self._partitions: "collections.OrderedDict[Optional[str], Partition]" = collections.OrderedDict()
+        # key -> future of a load in progress
+        self._loading: Dict[Optional[str], concurrent.futures.Future] = {}
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _paths(self, key: Optional[str]):
+        if key is None:
+            return self.default_base_path, self.default_metadata_path
+        directory = os.path.join(self.root, key)
+        return os.path.join(directory, "embeddings"), os.path.join(directory, "metadata.jsonl")
+
+    def _claim(self, key: Optional[str]) -> Tuple[concurrent.futures.Future, bool]:
+        """
+        A future for ``key``'s partition: already resolved if it is loaded,
+        else the load in progress. The flag is True when the caller has to
+        run the load (``_load``) itself.
+        """
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is not None:
+                self._partitions.move_to_end(key)
+                future = concurrent.futures.Future()
+                future.set_result(partition)
+                return future, False
+            future = self._loading.get(key)
+            if future is not None:
+                return future, False
+            future = self._loading[key] = concurrent.futures.Future()
+            return future, True
+
+    def _load(self, key: Optional[str], future: concurrent.futures.Future):
+        """Open a partition without the manager lock, then insert it and evict under it."""
+        try:
+            base_path, metadata_path = self._paths(key)
+            store = VectorStore(base_path, metadata_path)
+            if self.configure is not None:
+                self.configure(store)
+            partition = Partition(key, store)
+            partition.load()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._partitions[key] = partition
+            del self._loading[key]
+            self.loads += 1
+            evicted = self._evict(keep=key)
+        logger.info(f"Loaded wardrobe partition {key or 'default'} ({store.live_count} items)")
+        future.set_result(partition)
+        self._close(evicted)
+
+    def get(self, key: Optional[str]) -> Partition:
+        """Return the partition for ``key``, loading it in the calling thread if needed."""
+        validate_wardrobe_id(key)
+        future, owner = self._claim(key)
+        if owner:
+            self._load(key, future)
+        return future.result()
+
+    async def get_async(self, key: Optional[str]) -> Partition:
+        """Like ``get``, but a load runs in the event loop's default executor."""
+        validate_wardrobe_id(key)
+        future, owner = self._claim(key)
+        if owner:
+            asyncio.get_running_loop().run_in_executor(None, self._load, key, future)
+        # Shielded: a cancelled request must not cancel a load other requests wait on
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    @contextlib.asynccontextmanager
+    async def use(self, key: Optional[str]) -> AsyncIterator[Partition]:
+        """Pin a partition for the duration of a request so it cannot be evicted."""
+        while True:
+            partition = await self.get_async(key)
+            with self._lock:
+                # Another load may have evicted it before it could be pinned
+                if self._partitions.get(key) is partition:
+                    partition.pins += 1
+                    break
+        try:
+            yield partition
+        finally:
+            with self._lock:
+                partition.pins -= 1
+
+    def enforce_budget(self, keep: Optional[str]):
+        """Evict partitions other than ``keep`` until the resident size fits the budget again."""
+        with self._lock:
+            evicted = self._evict(keep)
+        self._close(evicted)
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(p.store.memory_bytes() for p in self._partitions.values())
+
+    def _evict(self, keep: Optional[str]) -> List[Partition]:
+        """Drop LRU partitions over the budget; returns them for the caller to close outside the lock."""
+        evicted = []
+        total = self.memory_bytes()
+        for key in list(self._partitions):
+            if total <= self.memory_budget_bytes:
+                break
+            partition = self._partitions[key]
+            if key == keep or partition.pins or partition.store.busy:
+                continue
+            total -= partition.store.memory_bytes()
+            del self._partitions[key]
+            self.evictions += 1
+            evicted.append(partition)
+        return evicted
+
+    def _close(self, evicted: List[Partition]):
+        for partition in evicted:
+            partition.store.close()
+            logger.info(f"Evicted wardrobe partition {partition.key or 'default'}")
+
+    def close(self):
+        with self._lock:
+            for partition in self._partitions.values():
+                partition.store.close()
+            self._partitions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": len(self._partitions),
+                "memory_bytes": self.memory_bytes(),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,69 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTracker:
+    """
+    Background startup with per-phase timings.
+
+    The server starts accepting connections before anything heavy is loaded:
+    ``run`` is scheduled as a task from the startup hook, loads its
+    independent phases (the model and the index) concurrently in worker
+    threads, then runs the dependent ones in order. Liveness only needs the
+    process to be up; readiness flips once every phase has finished, and a
+    failed phase is recorded (and fails liveness, so the container restarts).
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        yield
+        self.phases[name] = (time.perf_counter() - start) * 1000
+        logger.info(f"Startup phase '{name}' took {self.phases[name]:.0f} ms")
+
+    def _timed(self, name: str, fn: Callable[[], None]):
+        with self.phase(name):
+            fn()
+
+    async def run(self, concurrent: Dict[str, Callable[[], None]], sequential: Dict[str, Callable[[], None]]):
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(None, self._timed, name, fn)
+                                   for name, fn in concurrent.items()))
+            for name, fn in sequential.items():
+                await loop.run_in_executor(None, self._timed, name, fn)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            logger.exception("Startup failed")
+            return
+        self.phases["total"] = (time.perf_counter() - self.started_at) * 1000
+        self.ready = True
+        logger.info(f"Ready after {self.phases['total']:.0f} ms")
+
+    def start(self, concurrent: Dict[str, Callable[[], None]], sequential: Dict[str, Callable[[], None]]):
+        self._task = asyncio.get_running_loop().create_task(self.run(concurrent, sequential))
+
+    async def stop(self):
+        """Wait for an unfinished startup, so shutdown does not race the loaders."""
+        if self._task is not None and not self._task.done():
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "uptime_s": round(time.perf_counter() - self.started_at, 1),
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases.items()},
+        }
@@ -0,0 +1,265 @@
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCORE_CHUNK_ROWS = 4096
+CODEC_NAMES = ("float32", "float16", "int8", "pq")
+
+
+class VectorCodec:
+    """
+    Compressed in-memory representation of the store's embeddings.
+
+    The float32 vectors on disk stay the source of truth: codes are rebuilt
+    from them on load, scanned to pick candidates, and the best
+    ``rerank_factor * top_k`` candidates are re-scored exactly against the
+    float32 rows (``rerank_factor=0`` returns the approximate scores as is).
+    Codecs that need training stay inactive, and the store keeps scanning
+    float32, until it holds ``min_train_rows`` rows.
+    """
+
+    name = "float32"
+
+    def __init__(self, dim: int, rerank_factor: int = 4, min_train_rows: int = 0):
+        self.dim = dim
+        self.rerank_factor = rerank_factor
+        self.min_train_rows = min_train_rows
+
+    @property
+    def trained(self) -> bool:
+        return True
+
+    @property
+    def code_shape(self) -> tuple:
+        return (self.dim,)
+
+    code_dtype = np.float32
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return int(np.prod(self.code_shape)) * np.dtype(self.code_dtype).itemsize
+
+    def train(self, vectors: np.ndarray):
+        pass
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> bool:
+        return True
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors),) + self.code_shape, dtype=self.code_dtype)
+        for start in range(0, len(vectors), SCORE_CHUNK_ROWS):
+            chunk = np.asarray(vectors[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            codes[start:start + len(chunk)] = self._encode_chunk(chunk)
+        return codes
+
+    def scores(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """
+        Approximate inner products of every code row with a query of shape
+        (dim,), giving (rows,), or with a batch of shape (n, dim), giving (rows, n).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        prepared = self._prepare(queries.reshape(-1, self.dim))
+        scores = np.empty((len(codes), len(queries) if queries.ndim == 2 else 1), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start:start + SCORE_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = self._score_chunk(chunk, prepared)
+        return scores if queries.ndim == 2 else scores[:, 0]
+
+    def _encode_chunk(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors
+
+    def _prepare(self, queries: np.ndarray):
+        return queries
+
+    def _score_chunk(self, codes: np.ndarray, queries) -> np.ndarray:
+        return codes @ queries.T
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.name,
+            "trained": self.trained,
+            "bytes_per_vector": self.bytes_per_vector,
+            "rerank_factor": self.rerank_factor,
+        }
+
+
+class Float16Codec(VectorCodec):
+    """Half precision: 2 bytes per dimension, no training."""
+
+    name = "float16"
+    code_dtype = np.float16
+
+    def _encode_chunk(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.astype(np.float16)
+
+    def _score_chunk(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        # numpy has no fast float16 matmul; widen one chunk at a time
+        return codes.astype(np.float32) @ queries.T
+
+
+class Int8Codec(VectorCodec):
+    """
+    Scalar quantization: each dimension is mapped linearly from its trained
+    [min, max] range onto 256 levels, 1 byte per dimension. Scores are
+    computed on the codes directly, ``q.x ~= q.offset + (q * scale).code``.
+    """
+
+    name = "int8"
+    code_dtype = np.int8
+
+    def __init__(self, dim: int, rerank_factor: int = 4, min_train_rows: int = 1024):
+        super().__init__(dim, rerank_factor, min_train_rows)
+        self.offset = None
+        self.scale = None
+
+    @property
+    def trained(self) -> bool:
+        return self.scale is not None
+
+    def train(self, vectors: np.ndarray):
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        self.scale = np.maximum((high - low) / 255, 1e-8).astype(np.float32)
+        # Codes are stored signed, so level 0 is -128
+        self.offset = (low + 128 * self.scale).astype(np.float32)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> bool:
+        if state["scale"].shape != (self.dim,):
+            return False
+        self.offset = state["offset"].astype(np.float32)
+        self.scale = state["scale"].astype(np.float32)
+        return True
+
+    def _encode_chunk(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((vectors - self.offset) / self.scale), -128, 127).astype(np.int8)
+
+    def _prepare(self, queries: np.ndarray):
+        return (queries * self.scale).T, queries @ self.offset
+
+    def _score_chunk(self, codes: np.ndarray, prepared) -> np.ndarray:
+        weights, bias = prepared
+        return codes.astype(np.float32) @ weights + bias
+
+
+class PQCodec(VectorCodec):
+    """
+    Product quantization: the vector is split into ``subvectors`` slices and
+    each slice is replaced by the id of its nearest of 256 k-means centroids,
+    1 byte per slice. A query builds a (subvectors, 256) table of slice inner
+    products once, and every row is scored with table lookups.
+    """
+
+    name = "pq"
+    code_dtype = np.uint8
+    centroids_per_subvector = 256
+
+    def __init__(self, dim: int, rerank_factor: int = 20, min_train_rows: int = 4096,
+                 subvectors: int = 64, iterations: int = 10, sample_size: int = 16384):
+        if dim % subvectors:
+            raise ValueError(f"PQ needs the dimension ({dim}) to be a multiple of subvectors ({subvectors})")
+        super().__init__(dim, rerank_factor, max(min_train_rows, self.centroids_per_subvector))
+        self.subvectors = subvectors
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.codebooks = None
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def code_shape(self) -> tuple:
+        return (self.subvectors,)
+
+    def _slices(self, vectors: np.ndarray) -> np.ndarray:
+        """(rows, dim) -> (subvectors, rows, dim // subvectors)"""
+        return vectors.reshape(len(vectors), self.subvectors, -1).transpose(1, 0, 2)
+
+    def train(self, vectors: np.ndarray):
+        rng = np.random.default_rng(0)
+        if len(vectors) > self.sample_size:
+            vectors = vectors[rng.choice(len(vectors), size=self.sample_size, replace=False)]
+        self.codebooks = np.stack([
+            kmeans(np.ascontiguousarray(part), self.centroids_per_subvector, self.iterations, rng)
+            for part in self._slices(np.asarray(vectors, dtype=np.float32))
+        ])
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> bool:
+        codebooks = state["codebooks"]
+        if codebooks.shape[0] != self.subvectors or codebooks.shape[0] * codebooks.shape[2] != self.dim:
+            return False
+        self.codebooks = codebooks.astype(np.float32)
+        return True
+
+    def _encode_chunk(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for j, part in enumerate(self._slices(vectors)):
+            codes[:, j] = nearest_centroid(part, self.codebooks[j])
+        return codes
+
+    def _prepare(self, queries: np.ndarray):
+        # Inner product of every query slice with every centroid of its slice
+        slices = queries.reshape(len(queries), self.subvectors, -1)
+        tables = np.einsum("mkd,qmd->qmk", self.codebooks, slices)
+        return tables.reshape(len(queries), -1).astype(np.float32)
+
+    def _score_chunk(self, codes: np.ndarray, tables: np.ndarray) -> np.ndarray:
+        lookup = codes.astype(np.intp) + np.arange(self.subvectors) * self.centroids_per_subvector
+        return np.stack([np.take(table, lookup).sum(axis=1) for table in tables], axis=1)
+
+
+def nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (L2) for every row."""
+    distances = (centroids * centroids).sum(axis=1) - 2 * (vectors @ centroids.T)
+    return np.argmin(distances, axis=1)
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Plain (L2) k-means; slices of unit vectors are not unit vectors themselves."""
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearest_centroid(vectors, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        empty = np.nonzero(~nonempty)[0]
+        if len(empty):
+            # Reseed empty clusters on random points
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+    return centroids
+
+
+def create_codec(name: str, dim: int, rerank_factor: Optional[int] = None,
+                 subvectors: int = 64) -> Optional[VectorCodec]:
+    """
+    Build the storage codec named by config, or None for float32 (scan the
+    vectors as stored). ``rerank_factor`` overrides the codec's default.
+    """
+    name = name.lower()
+    if name == "float32":
+        return None
+    if name == "float16":
+        codec = Float16Codec(dim)
+    elif name == "int8":
+        codec = Int8Codec(dim)
+    elif name == "pq":
+        codec = PQCodec(dim, subvectors=subvectors)
+    else:
+        raise ValueError(f"Unknown vector codec '{name}' (expected one of {', '.join(CODEC_NAMES)})")
+    if rerank_factor is not None:
+        codec.rerank_factor = rerank_factor
+    return codec
@@ -0,0 +1,901 @@
+import glob
+import json
+import logging
+import os
+import pickle
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from durability import fsync_directory
+from inverted_index import InvertedIndex
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+SEGMENT_ROWS = int(os.getenv("VECTOR_SEGMENT_ROWS", "4096"))
+COMPACT_TOMBSTONE_RATIO = float(os.getenv("VECTOR_COMPACT_TOMBSTONE_RATIO", "0.2"))
+INITIAL_CAPACITY = 256
+# Rough in-memory cost of one metadata dict, for memory accounting
+METADATA_BYTES_PER_ROW = 512
+
+
+class VectorStore:
+    """
+    Append-only embedding store.
+
+    Sealed rows live in immutable ``.npy`` segments that are memory-mapped on
+    load. New rows go into a preallocated, growable float32 buffer (the active
+    segment) and are appended to a raw ``.tail.f32`` file, so adding an item
+    costs O(1) amortized and is searchable immediately. Once the active segment
+    reaches ``segment_rows`` it is sealed into a new ``.npy`` segment.
+
+    Metadata is an append-only JSON-lines log, one line per row, and is
+    indexed by attribute (category, color, style) for filtered search.
+
+    The tail, metadata and tombstone logs are the write-ahead log: every write
+    is flushed before it returns, and the optional ``committer`` (see
+    durability.py) decides when they are fsynced. Sealed segments and the
+    manifest are checkpoints, written to a temp file, fsynced and renamed
+    into place; on load the logs are replayed on top of them.
+
+    Deletes append the row to a tombstone log and are hidden from search at
+    once. When tombstones pass ``compact_ratio`` of the rows, a background
+    thread writes the live rows into a new generation of files and switches
+    to it by atomically replacing a small manifest.
+
+    With a ``codec`` (see vector_codecs.py) attached, searches scan compact
+    in-memory codes instead of the float32 segments and re-rank the best
+    candidates exactly; the segments are then only paged in for re-ranking.
+    The codec is trained and the rows encoded when the store is opened or, once
+    it is large enough, by a background thread; until the codes are swapped
+    in, searches scan float32.
+    """
+
+    def __init__(self, base_path: str, metadata_path: str, dim: int = EMBEDDING_DIM,
+                 segment_rows: int = SEGMENT_ROWS, compact_ratio: float = COMPACT_TOMBSTONE_RATIO):
+        self.base_path = base_path
+        self.metadata_path = metadata_path
+        self.dim = dim
+        self.segment_rows = segment_rows
+        self.compact_ratio = compact_ratio
+        self.generation = 0
+        self.segments: List[np.ndarray] = []
+        self.metadata: List[dict] = []
+        self.index = InvertedIndex()
+        # item_id -> live rows with that id
+        self.id_rows: Dict[str, List[int]] = {}
+        # Optional approximate index (see ann_index.py); None means exact scans
+        self.ann = None
+        # Optional compressed codes for scanning (see vector_codecs.py); None scans float32
+        self.codec = None
+        self._codes: Optional[np.ndarray] = None
+        self._preparing_codec = False
+        # Optional fsync policy (see durability.py); None leaves it to the OS
+        self.committer = None
+        self.commit_ticket = 0
+        self.deleted_count = 0
+        self._deleted = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._buffer = np.empty((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._buffer_rows = 0
+        self._tail_file = None
+        self._metadata_file = None
+        self._tombstone_file = None
+        self._compacting = False
+        self._lock = threading.RLock()
+
+    # Paths
+
+    @property
+    def manifest_path(self) -> str:
+        return f"{self.base_path}.manifest.json"
+
+    def _prefix(self, generation: int) -> str:
+        # Generation 0 keeps the original, unsuffixed file names
+        return self.base_path if generation == 0 else f"{self.base_path}.g{generation}"
+
+    def _metadata_log_path(self, generation: int) -> str:
+        if generation == 0:
+            return self.metadata_path
+        stem, ext = os.path.splitext(self.metadata_path)
+        return f"{stem}.g{generation}{ext}"
+
+    def _tail_path(self, generation: int) -> str:
+        return f"{self._prefix(generation)}.tail.f32"
+
+    def _tombstone_path(self, generation: int) -> str:
+        return f"{self._prefix(generation)}.tombstones"
+
+    def _segment_path(self, index: int, generation: int) -> str:
+        return f"{self._prefix(generation)}.seg{index:05d}.npy"
+
+    def _segment_paths(self, generation: int) -> List[str]:
+        pattern = f"{glob.escape(self._prefix(generation))}.seg[0-9][0-9][0-9][0-9][0-9].npy"
+        return sorted(glob.glob(pattern))
+
+    def _generation_files(self, generation: int) -> List[str]:
+        paths = self._segment_paths(generation) + [
+            self._tail_path(generation),
+            self._tombstone_path(generation),
+            self._metadata_log_path(generation),
+        ]
+        return [path for path in paths if os.path.exists(path)]
+
+    @property
+    def tail_path(self) -> str:
+        return self._tail_path(self.generation)
+
+    @property
+    def codec_path(self) -> str:
+        return f"{self.base_path}.codec.npz"
+
+    # Loading
+
+    def load(self):
+        """Open segments with mmap, replay the tail file, metadata and tombstone logs."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.base_path) or ".", exist_ok=True)
+            self.generation = self._read_manifest()
+            if self.generation == 0:
+                self._migrate_legacy()
+            self._remove_stale_generations()
+            self._open_generation()
+
+    def _read_manifest(self) -> int:
+        if not os.path.exists(self.manifest_path):
+            return 0
+        with open(self.manifest_path, "r") as f:
+            return int(json.load(f)["generation"])
+
+    def _write_manifest(self, generation: int):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"generation": generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        fsync_directory(self.manifest_path)
+
+    def _remove_stale_generations(self):
+        """Delete files left by an older generation or an interrupted compaction."""
+        stale = set()
+        if self.generation != 0:
+            stale.add(0)
+        stem, ext = os.path.splitext(self.metadata_path)
+        candidates = glob.glob(f"{glob.escape(self.base_path)}.g*") + glob.glob(f"{glob.escape(stem)}.g*{ext}")
+        for path in candidates:
+            match = re.search(r"\.g(\d+)[.]", os.path.basename(path))
+            if match and int(match.group(1)) != self.generation:
+                stale.add(int(match.group(1)))
+        for generation in stale:
+            for path in self._generation_files(generation):
+                os.remove(path)
+
+    def _open_generation(self):
+        """Read the current generation's files into memory and open its logs."""
+        self.close()
+        generation = self.generation
+        paths = self._segment_paths(generation)
+        self.segments = [np.load(path, mmap_mode="r") for path in paths]
+        for path, segment in zip(paths, self.segments):
+            if segment.ndim != 2 or segment.shape[1] != self.dim:
+                raise ValueError(f"Segment {path} has shape {segment.shape}, expected (*, {self.dim})")
+
+        tail = self._read_tail()
+        self._buffer_rows = 0
+        self._ensure_capacity(len(tail))
+        self._buffer[:len(tail)] = tail
+        self._buffer_rows = len(tail)
+
+        self.metadata, offsets = self._read_metadata_log()
+        self._reconcile(offsets)
+
+        self._deleted = np.zeros(max(len(self.metadata), INITIAL_CAPACITY), dtype=bool)
+        self._deleted[self._read_tombstones()] = True
+        self.deleted_count = int(self._deleted.sum())
+
+        self.index, self.id_rows = _build_indexes(self.metadata, self._deleted)
+        if self.codec is not None:
+            self._load_codec()
+            self._encode_all()
+            self.maybe_prepare_codec()
+        if self.ann is not None:
+            self.ann.rebuild()
+
+        self._open_logs()
+        logger.info(
+            f"Loaded {len(self)} embeddings ({self.deleted_count} deleted) from "
+            f"{len(self.segments)} segments and {self._buffer_rows} tail rows, generation {generation}"
+        )
+
+    def _open_logs(self):
+        generation = self.generation
+        self._tail_file = open(self._tail_path(generation), "ab")
+        self._metadata_file = open(self._metadata_log_path(generation), "a", encoding="utf-8")
+        self._tombstone_file = open(self._tombstone_path(generation), "ab")
+
+    def _read_tail(self) -> np.ndarray:
+        if not os.path.exists(self.tail_path):
+            return np.empty((0, self.dim), dtype=np.float32)
+        raw = np.fromfile(self.tail_path, dtype=np.float32)
+        rows = raw.size // self.dim
+        if raw.size != rows * self.dim:
+            # A crash in the middle of an append leaves a partial row behind.
+            logger.warning("Discarding partial row at the end of the tail file")
+            with open(self.tail_path, "r+b") as f:
+                f.truncate(rows * self.dim * 4)
+        return raw[:rows * self.dim].reshape(rows, self.dim)
+
+    def _read_metadata_log(self) -> Tuple[List[dict], List[int]]:
+        """Return parsed records and the byte offset at which each record ends."""
+        records, offsets = [], []
+        path = self._metadata_log_path(self.generation)
+        if not os.path.exists(path):
+            return records, offsets
+        offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Discarding unreadable metadata record at byte {offset}")
+                    break
+                offset += len(line)
+                records.append(record)
+                offsets.append(offset)
+        return records, offsets
+
+    def _read_tombstones(self) -> np.ndarray:
+        path = self._tombstone_path(self.generation)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=np.int64)
+        raw = np.fromfile(path, dtype=np.int64)
+        return raw[(raw >= 0) & (raw < len(self.metadata))]
+
+    def _reconcile(self, metadata_offsets: List[int]):
+        """Trim vectors and metadata to the rows both logs agree on."""
+        sealed_rows = sum(len(s) for s in self.segments)
+        vector_rows = sealed_rows + self._buffer_rows
+        rows = min(vector_rows, len(self.metadata))
+
+        if vector_rows > rows:
+            logger.warning(f"Dropping {vector_rows - rows} embeddings without metadata")
+            keep_tail = max(rows - sealed_rows, 0)
+            self._buffer_rows = keep_tail
+            with open(self.tail_path, "ab") as f:
+                f.truncate(keep_tail * self.dim * 4)
+            while sealed_rows > rows:
+                index = len(self.segments) - 1
+                segment = self.segments.pop()
+                sealed_rows -= len(segment)
+                keep = rows - sealed_rows
+                if keep > 0:
+                    path = self._write_segment(index, np.array(segment[:keep]), self.generation)
+                    self.segments.append(np.load(path, mmap_mode="r"))
+                    sealed_rows += keep
+                else:
+                    del segment
+                    os.remove(self._segment_path(index, self.generation))
+
+        path = self._metadata_log_path(self.generation)
+        end = metadata_offsets[rows - 1] if rows else 0
+        if len(self.metadata) > rows or (os.path.exists(path) and os.path.getsize(path) != end):
+            logger.warning(f"Truncating metadata log to {rows} records")
+            self.metadata = self.metadata[:rows]
+            with open(path, "ab") as f:
+                f.truncate(end)
+
+    def _migrate_legacy(self):
+        """Convert a pickled embeddings array and metadata.json to the segment layout once."""
+        legacy_vectors = f"{self.base_path}.pkl"
+        legacy_metadata = os.path.splitext(self.metadata_path)[0] + ".json"
+        if not os.path.exists(legacy_vectors) or self._segment_paths(0) or os.path.exists(self._tail_path(0)):
+            return
+
+        logger.info(f"Migrating legacy index {legacy_vectors} to segmented storage")
+        with open(legacy_vectors, "rb") as f:
+            vectors = np.asarray(pickle.load(f), dtype=np.float32).reshape(-1, self.dim)
+        records = []
+        if os.path.exists(legacy_metadata):
+            with open(legacy_metadata, "r") as f:
+                records = json.load(f)
+
+        rows = min(len(vectors), len(records))
+        for index, start in enumerate(range(0, rows, self.segment_rows)):
+            self._write_segment(index, vectors[start:start + self.segment_rows], 0)
+        with open(self.metadata_path, "w", encoding="utf-8") as f:
+            for record in records[:rows]:
+                f.write(json.dumps(record) + "\n")
+
+        os.replace(legacy_vectors, legacy_vectors + ".migrated")
+        if os.path.exists(legacy_metadata):
+            os.replace(legacy_metadata, legacy_metadata + ".migrated")
+
+    def _load_codec(self):
+        """Restore a previously trained codec so restarts only re-encode rows."""
+        if self.codec.trained or not os.path.exists(self.codec_path):
+            return
+        with np.load(self.codec_path) as saved:
+            state = {key: saved[key] for key in saved.files}
+        if str(state.pop("name")) != self.codec.name or not self.codec.load_state(state):
+            logger.warning(f"Ignoring saved codec state in {self.codec_path}")
+
+    def _encode_all(self):
+        if not self.codec.trained:
+            self._codes = None
+            return
+        self._codes = np.empty((len(self._deleted),) + self.codec.code_shape, dtype=self.codec.code_dtype)
+        for first_row, block in self.blocks():
+            self._codes[first_row:first_row + len(block)] = self.codec.encode(block)
+
+    def maybe_prepare_codec(self) -> bool:
+        """Start training and encoding in the background once the store is large enough for the codec."""
+        with self._lock:
+            if (self.codec is None or self._codes is not None or self._preparing_codec
+                    or len(self) < self.codec.min_train_rows):
+                return False
+            self._preparing_codec = True
+        threading.Thread(target=self._prepare_codec_in_background, name="codec-training", daemon=True).start()
+        return True
+
+    def _prepare_codec_in_background(self):
+        prepared = True
+        try:
+            prepared = self.prepare_codec()
+        except Exception:
+            logger.exception("Codec training failed")
+        finally:
+            with self._lock:
+                self._preparing_codec = False
+            if not prepared:
+                self.maybe_prepare_codec()
+
+    def prepare_codec(self) -> bool:
+        """
+        Train the codec (unless restored) and encode a snapshot of the rows
+        without holding the lock, then encode the rows added meanwhile and
+        swap the codes in. Returns False if a compaction renumbered the rows
+        in between.
+        """
+        with self._lock:
+            generation = self.generation
+            capacity = len(self._deleted)
+            rows, blocks = self.snapshot()
+        if not self.codec.trained:
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(rng.choice(rows, size=min(rows, 65536), replace=False))
+            self.codec.train(gather_blocks(blocks, sample_rows, self.dim))
+            tmp_path = self.codec_path + ".tmp.npz"
+            np.savez(tmp_path, name=self.codec.name, **self.codec.state())
+            os.replace(tmp_path, self.codec_path)
+            logger.info(f"Trained {self.codec.name} codec on {len(sample_rows)} rows")
+        codes = np.empty((capacity,) + self.codec.code_shape, dtype=self.codec.code_dtype)
+        for first_row, block in blocks:
+            codes[first_row:first_row + len(block)] = self.codec.encode(block)
+
+        with self._lock:
+            if self.generation != generation:
+                return False
+            if len(self._deleted) > len(codes):
+                grown = np.empty((len(self._deleted),) + codes.shape[1:], dtype=codes.dtype)
+                grown[:rows] = codes[:rows]
+                codes = grown
+            if len(self) > rows:
+                codes[rows:len(self)] = self.codec.encode(self.gather(np.arange(rows, len(self))))
+            self._codes = codes
+            return True
+
+    # Writing
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= len(self._buffer):
+            return
+        capacity = len(self._buffer)
+        while capacity < rows:
+            capacity *= 2
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:self._buffer_rows] = self._buffer[:self._buffer_rows]
+        self._buffer = grown
+
+    def _write_segment(self, index: int, vectors: np.ndarray, generation: int) -> str:
+        path = self._segment_path(index, generation)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_directory(path)
+        return path
+
+    def _seal(self):
+        """Move the active segment into an immutable, memory-mapped .npy file."""
+        path = self._write_segment(len(self.segments), self._buffer[:self._buffer_rows], self.generation)
+        self.segments.append(np.load(path, mmap_mode="r"))
+        self._buffer_rows = 0
+        self._tail_file.truncate(0)
+        self._tail_file.seek(0)
+        logger.info(f"Sealed segment {path}")
+
+    def add(self, embedding: np.ndarray, item_metadata: dict) -> int:
+        """Append one embedding and its metadata. Returns the new row id."""
+        return self.add_many(embedding.reshape(1, -1), [item_metadata])[0]
+
+    def add_many(self, embeddings: np.ndarray, items: List[dict]) -> List[int]:
+        """Append a block of embeddings with one write per log."""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if len(embeddings) != len(items):
+            raise ValueError("embeddings and metadata must have the same length")
+
+        with self._lock:
+            first_row = len(self)
+            # Metadata goes first: on recovery, records without a vector are
+            # trimmed, which is cheaper than trimming sealed segments.
+            self._metadata_file.write("".join(json.dumps(item) + "\n" for item in items))
+            self._metadata_file.flush()
+
+            start = 0
+            while start < len(embeddings):
+                if self._buffer_rows >= self.segment_rows:
+                    self._seal()
+                take = min(self.segment_rows - self._buffer_rows, len(embeddings) - start)
+                chunk = embeddings[start:start + take]
+                self._ensure_capacity(self._buffer_rows + take)
+                self._buffer[self._buffer_rows:self._buffer_rows + take] = chunk
+                self._buffer_rows += take
+                self._tail_file.write(chunk.tobytes())
+                self._tail_file.flush()
+                start += take
+            if self._buffer_rows >= self.segment_rows:
+                self._seal()
+
+            self._index_rows(first_row, embeddings, items)
+            self._commit(self._metadata_file, self._tail_file)
+            if self._codes is None:
+                self.maybe_prepare_codec()
+            return list(range(first_row, first_row + len(items)))
+
+    def _index_rows(self, first_row: int, embeddings: np.ndarray, items: List[dict]):
+        """Make rows already written to the logs and buffer searchable: codes, indexes, ANN."""
+        if first_row + len(items) > len(self._deleted):
+            grown = np.zeros(max(2 * len(self._deleted), first_row + len(items)), dtype=bool)
+            grown[:first_row] = self._deleted[:first_row]
+            self._deleted = grown
+        if self._codes is not None:
+            if first_row + len(items) > len(self._codes):
+                grown = np.empty((len(self._deleted),) + self._codes.shape[1:], dtype=self._codes.dtype)
+                grown[:first_row] = self._codes[:first_row]
+                self._codes = grown
+            self._codes[first_row:first_row + len(items)] = self.codec.encode(embeddings)
+        for row, item in enumerate(items, start=first_row):
+            self.index.add(row, item)
+            self.id_rows.setdefault(item["item_id"], []).append(row)
+        self.metadata.extend(items)
+        if self.ann is not None:
+            self.ann.add(first_row, embeddings)
+
+    def delete(self, item_id: str) -> List[dict]:
+        """
+        Tombstone every live row with this item_id. Search skips them right
+        away; storage is reclaimed by a later compaction. Returns the metadata
+        of the deleted rows.
+        """
+        with self._lock:
+            rows = self.id_rows.pop(item_id, [])
+            if not rows:
+                return []
+            items = [self.metadata[row] for row in rows]
+            rows = np.asarray(rows, dtype=np.int64)
+            self._tombstone_file.write(rows.tobytes())
+            self._tombstone_file.flush()
+            self._commit(self._tombstone_file)
+            self._deleted[rows] = True
+            self.deleted_count += len(rows)
+        self.maybe_compact()
+        return items
+
+    def _commit(self, *files):
+        if self.committer is not None:
+            self.commit_ticket = self.committer.commit(*files)
+
+    def wait_durable(self, ticket: Optional[int] = None):
+        """Block until writes up to ``ticket`` (default: all so far) are fsynced."""
+        if self.committer is not None:
+            self.committer.wait(self.commit_ticket if ticket is None else ticket)
+
+    def maybe_compact(self) -> bool:
+        """Start a background compaction if the tombstone ratio is over the threshold."""
+        with self._lock:
+            if self._compacting or not len(self) or self.deleted_count / len(self) < self.compact_ratio:
+                return False
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, name="vector-store-compaction", daemon=True).start()
+        return True
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("Compaction failed")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        """
+        Rewrite the live rows into a new generation and switch to it.
+
+        The files, metadata, indexes, codes and ANN state of the new
+        generation are built from a snapshot without holding the lock; under
+        the lock only the rows added and deleted meanwhile are replayed
+        before the manifest and the in-memory references are swapped.
+        """
+        with self._lock:
+            rows, blocks = self.snapshot()
+            deleted = self._deleted[:rows].copy()
+            items = self.metadata[:rows]
+            # Rows below the snapshot are never rewritten, even when the array is grown
+            codes = self._codes
+            ann_snapshot = self.ann.snapshot() if self.ann is not None else None
+            generation = self.generation + 1
+
+        for path in self._generation_files(generation):
+            os.remove(path)
+        live = np.nonzero(~deleted)[0]
+        segments = []
+        for start in range(0, len(live), self.segment_rows):
+            chunk = live[start:start + self.segment_rows]
+            path = self._write_segment(len(segments), gather_blocks(blocks, chunk, self.dim), generation)
+            segments.append(np.load(path, mmap_mode="r"))
+        metadata = [items[row] for row in live]
+        with open(self._metadata_log_path(generation), "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(item) + "\n" for item in metadata))
+        new_deleted = np.zeros(max(len(live), INITIAL_CAPACITY), dtype=bool)
+        index, id_rows = _build_indexes(metadata, new_deleted)
+        if codes is not None:
+            new_codes = np.empty((len(new_deleted),) + codes.shape[1:], dtype=codes.dtype)
+            new_codes[:len(live)] = codes[live]
+            codes = new_codes
+        ann_state = self.ann.remap(ann_snapshot, live, rows) if self.ann is not None else None
+
+        with self._lock:
+            # Replay rows appended and deleted since the snapshot
+            added = np.arange(rows, len(self))
+            vectors = gather_blocks(list(self.blocks()), added, self.dim)
+            added_items = self.metadata[rows:]
+            if len(added):
+                with open(self._tail_path(generation), "wb") as f:
+                    f.write(vectors.tobytes())
+                with open(self._metadata_log_path(generation), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(item) + "\n" for item in added_items))
+            late = np.nonzero(self._deleted[:rows] & ~deleted)[0]
+            remapped = np.concatenate([
+                np.searchsorted(live, late),
+                len(live) + np.nonzero(self._deleted[rows:len(self)])[0],
+            ]).astype(np.int64)
+            with open(self._tombstone_path(generation), "wb") as f:
+                f.write(remapped.tobytes())
+            for path in (self._metadata_log_path(generation), self._tail_path(generation),
+                         self._tombstone_path(generation)):
+                if os.path.exists(path):
+                    with open(path, "rb+") as f:
+                        os.fsync(f.fileno())
+
+            previous = self.generation
+            self._write_manifest(generation)
+            self.close()
+            self.generation = generation
+            self.segments = segments
+            self.metadata = metadata
+            self.index, self.id_rows = index, id_rows
+            self._deleted = new_deleted
+            self._codes = codes
+            if self.ann is not None:
+                self.ann.install(ann_state)
+            self._buffer_rows = 0
+            self._ensure_capacity(len(vectors))
+            self._buffer[:len(vectors)] = vectors
+            self._buffer_rows = len(vectors)
+            self._index_rows(len(live), vectors, added_items)
+            self._deleted[remapped] = True
+            self.deleted_count = len(remapped)
+            for row in remapped:
+                item_rows = self.id_rows.get(self.metadata[row]["item_id"], [])
+                if row in item_rows:
+                    item_rows.remove(row)
+                    if not item_rows:
+                        del self.id_rows[self.metadata[row]["item_id"]]
+            self._open_logs()
+            if self._codes is None:
+                self.maybe_prepare_codec()
+            for path in self._generation_files(previous):
+                os.remove(path)
+            logger.info(f"Compacted {rows} rows to {len(live)} live rows, generation {generation}")
+
+    def close(self):
+        with self._lock:
+            for f in (self._tail_file, self._metadata_file, self._tombstone_file):
+                if f is not None:
+                    if self.committer is not None:
+                        self.committer.sync(f)
+                    f.close()
+            self._tail_file = self._metadata_file = self._tombstone_file = None
+
+    # Reading
+
+    def __len__(self) -> int:
+        """Number of rows, including tombstoned ones."""
+        return len(self.metadata)
+
+    @property
+    def live_count(self) -> int:
+        return len(self.metadata) - self.deleted_count
+
+    @property
+    def compacting(self) -> bool:
+        return self._compacting
+
+    @property
+    def busy(self) -> bool:
+        """A compaction, codec or ANN training thread is still working on the store."""
+        return self._compacting or self._preparing_codec or (self.ann is not None and self.ann.training)
+
+    @property
+    def version(self) -> tuple:
+        """Changes on every add, delete and compaction; for caches derived from the store."""
+        return self.generation, len(self.metadata), self.deleted_count
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate resident size: the scanned vectors (float32 segments in
+        full, or the codes when a codec is active), the active buffer and metadata.
+        """
+        rows = len(self)
+        if self._codes is not None:
+            scanned = self._codes[:rows].nbytes
+        else:
+            scanned = sum(segment.nbytes for segment in self.segments)
+        # Only filled rows: preallocated capacity is not per-item storage
+        buffered = self._buffer_rows * self.dim * self._buffer.itemsize
+        return scanned + buffered + self._deleted[:rows].nbytes + rows * METADATA_BYTES_PER_ROW
+
+    def storage_stats(self) -> dict:
+        """Codec in use and memory per item, for status reporting."""
+        with self._lock:
+            if self.codec is not None:
+                stats = self.codec.stats()
+            else:
+                stats = {"codec": "float32", "trained": True, "bytes_per_vector": self.dim * 4}
+            stats["active"] = self.codec is None or self._codes is not None
+            stats["preparing"] = self._preparing_codec
+            stats["memory_bytes"] = self.memory_bytes()
+            stats["memory_per_item"] = round(stats["memory_bytes"] / max(self.live_count, 1))
+            return stats
+
+    def live_items(self) -> List[dict]:
+        with self._lock:
+            return [item for row, item in enumerate(self.metadata) if not self._deleted[row]]
+
+    def blocks(self):
+        """Yield (first_row, block) for every segment plus the active buffer."""
+        offset = 0
+        for segment in self.segments:
+            yield offset, segment
+            offset += len(segment)
+        if self._buffer_rows:
+            yield offset, self._buffer[:self._buffer_rows]
+
+    @property
+    def lock(self) -> threading.RLock:
+        """The store's lock, for derived state (ann_index.py) built off it and swapped in under it."""
+        return self._lock
+
+    def snapshot(self) -> Tuple[int, list]:
+        """
+        (rows, [(first_row, block), ...]) as of now, readable without the
+        lock: segments are immutable and the active buffer is copied.
+        """
+        with self._lock:
+            sealed_rows = sum(len(segment) for segment in self.segments)
+            blocks = [(first_row, block if first_row < sealed_rows else block.copy())
+                      for first_row, block in self.blocks()]
+            return len(self), blocks
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of a normalized query against every stored row, or
+        only against ``rows`` (sorted row ids) when given. Deleted rows score -inf.
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            parts = []
+            for first_row, block in self.blocks():
+                if rows is None:
+                    parts.append(block @ query)
+                    continue
+                lo, hi = np.searchsorted(rows, [first_row, first_row + len(block)])
+                if hi > lo:
+                    parts.append(block[rows[lo:hi] - first_row] @ query)
+            scores = np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+            if rows is None:
+                scores = scores[:len(self)]
+                deleted = self._deleted[:len(scores)]
+            else:
+                deleted = self._deleted[rows]
+            if self.deleted_count:
+                scores[deleted] = -np.inf
+            return scores
+
+    def search(self, query: np.ndarray, top_k: int,
+               filters: Optional[Dict[str, Optional[str]]] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k search. Returns (row, similarity) pairs, best first.
+        With ``filters``, only rows matching every attribute are considered.
+        Uses the approximate index when one is attached, else an exact scan.
+        """
+        with self._lock:
+            rows = self.index.rows(filters) if filters else None
+            if rows is not None:
+                rows = rows[rows < len(self)]
+            if self.ann is not None:
+                return self.ann.search(query, top_k, rows)
+            return self.exact_search(query, top_k, rows)
+
+    def search_items(self, query: np.ndarray, top_k: int,
+                     filters: Optional[Dict[str, Optional[str]]] = None) -> List[Tuple[dict, float]]:
+        """Like ``search`` but returns (metadata, similarity), resolved under the lock
+        so a concurrent compaction cannot renumber rows in between."""
+        with self._lock:
+            return [(self.metadata[row], score) for row, score in self.search(query, top_k, filters)]
+
+    def exact_search(self, query: np.ndarray, top_k: int,
+                     rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Brute-force top-k over all rows, or over the sorted row ids in ``rows``.
+        With an active codec the scan runs on the codes and the best
+        ``rerank_factor * top_k`` candidates are re-scored against float32.
+        """
+        with self._lock:
+            if self._codes is not None:
+                return self._code_search(query, top_k, rows)
+            if rows is None:
+                return top_k_rows(self.scores(query), top_k)
+            scores = self.scores(query, rows)
+            return [(int(rows[i]), score) for i, score in top_k_rows(scores, top_k)]
+
+    def _code_search(self, query: np.ndarray, top_k: int,
+                     rows: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        codes = self._codes[:len(self)] if rows is None else self._codes[rows]
+        scores = self.codec.scores(codes, query)
+        if self.deleted_count:
+            scores[self._deleted[:len(self)] if rows is None else self._deleted[rows]] = -np.inf
+        rerank_factor = self.codec.rerank_factor
+        candidates = top_k_rows(scores, top_k * rerank_factor if rerank_factor else top_k)
+        if rows is not None:
+            candidates = [(int(rows[i]), score) for i, score in candidates]
+        if not rerank_factor or not candidates:
+            return candidates
+        return self._rerank(query, candidates, top_k)
+
+    def _rerank(self, query: np.ndarray, candidates: List[Tuple[int, float]],
+                top_k: int) -> List[Tuple[int, float]]:
+        """Re-score (row, approximate score) candidates exactly against the float32 rows."""
+        candidate_rows = np.sort(np.array([row for row, _ in candidates], dtype=np.int64))
+        exact = self.scores(query, candidate_rows)
+        return [(int(candidate_rows[i]), score) for i, score in top_k_rows(exact, top_k)]
+
+    def search_many(self, queries: np.ndarray, top_k: int,
+                    filters: Optional[List[Optional[Dict[str, Optional[str]]]]] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k for a batch of queries at once. Every query is scored in one
+        matrix product per segment (or one pass over the codes), and each
+        column's top-k is taken with argpartition. ``filters`` holds one
+        optional filter dict per query. This is always a full scan: batching
+        turns many vector-matrix products into one matrix-matrix product,
+        which beats probing the ANN index query by query.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            rows = len(self)
+            if not rows or not len(queries) or top_k <= 0:
+                return [[] for _ in queries]
+            if self._codes is not None:
+                scores = self.codec.scores(self._codes[:rows], queries)
+                rerank_factor = self.codec.rerank_factor
+            else:
+                scores = np.concatenate([block @ queries.T for _, block in self.blocks()])[:rows]
+                rerank_factor = 0
+            if self.deleted_count:
+                scores[self._deleted[:rows]] = -np.inf
+            for column, query_filters in enumerate(filters or []):
+                allowed = self.index.rows(query_filters) if query_filters else None
+                if allowed is not None:
+                    excluded = np.ones(rows, dtype=bool)
+                    excluded[allowed[allowed < rows]] = False
+                    scores[excluded, column] = -np.inf
+
+            k = min(top_k * rerank_factor if rerank_factor else top_k, rows)
+            candidates = np.argpartition(-scores, k - 1, axis=0)[:k]
+            results = []
+            for column, query in enumerate(queries):
+                column_rows = candidates[:, column]
+                column_scores = scores[column_rows, column]
+                order = np.argsort(-column_scores, kind="stable")
+                hits = [(int(column_rows[i]), float(column_scores[i]))
+                        for i in order if column_scores[i] != -np.inf]
+                if rerank_factor and hits:
+                    hits = self._rerank(query, hits, top_k)
+                results.append(hits)
+            return results
+
+    def search_items_many(self, queries: np.ndarray, top_k: int,
+                          filters: Optional[List[Optional[Dict[str, Optional[str]]]]] = None
+                          ) -> List[List[Tuple[dict, float]]]:
+        """Like ``search_many`` but returns (metadata, similarity), resolved under the lock."""
+        with self._lock:
+            return [[(self.metadata[row], score) for row, score in hits]
+                    for hits in self.search_many(queries, top_k, filters)]
+
+    def gather(self, rows: np.ndarray) -> np.ndarray:
+        """Copy the vectors for the sorted row ids in ``rows`` into one array."""
+        with self._lock:
+            return gather_blocks(list(self.blocks()), rows, self.dim)
+
+    def get_vector(self, row: int) -> Optional[np.ndarray]:
+        if not 0 <= row < len(self):
+            return None
+        return self.gather(np.array([row]))[0]
+
+    def category_block(self, category: str) -> Tuple[np.ndarray, List[dict]]:
+        """Vectors and metadata of every live row in one category."""
+        with self._lock:
+            rows = self.index.rows({"category": category})
+            rows = rows[rows < len(self)]
+            rows = rows[~self._deleted[rows]]
+            return self.gather(rows), [self.metadata[row] for row in rows]
+
+    def get_item(self, item_id: str) -> Optional[dict]:
+        """Metadata of a live item (its latest row), or None."""
+        with self._lock:
+            rows = self.id_rows.get(item_id)
+            return self.metadata[rows[-1]] if rows else None
+
+    def get_item_vector(self, item_id: str) -> Optional[np.ndarray]:
+        """Stored embedding of a live item (its latest row), or None."""
+        with self._lock:
+            rows = self.id_rows.get(item_id)
+            return self.get_vector(rows[-1]) if rows else None
+
+
+def _build_indexes(metadata: List[dict], deleted: np.ndarray) -> Tuple[InvertedIndex, Dict[str, List[int]]]:
+    """Attribute index over every row, and item_id -> rows over the live ones."""
+    index = InvertedIndex()
+    id_rows: Dict[str, List[int]] = {}
+    for row, item in enumerate(metadata):
+        index.add(row, item)
+        if not deleted[row]:
+            id_rows.setdefault(item["item_id"], []).append(row)
+    return index, id_rows
+
+
+def gather_blocks(blocks, rows: np.ndarray, dim: int) -> np.ndarray:
+    """Copy the sorted row ids in ``rows`` out of (first_row, block) pairs."""
+    parts = []
+    for first_row, block in blocks:
+        lo, hi = np.searchsorted(rows, [first_row, first_row + len(block)])
+        if hi > lo:
+            parts.append(np.asarray(block[rows[lo:hi] - first_row]))
+    return np.concatenate(parts) if parts else np.empty((0, dim), dtype=np.float32)
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+    """Pick the top-k entries of a score vector with argpartition, skipping -inf (deleted)."""
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return []
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    order = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return [(int(row), float(scores[row])) for row in order if scores[row] != -np.inf]
@@ -0,0 +1,107 @@
+"""
+Generation throughput with micro-batching of compatible queued jobs.
+
+    python benchmarks/bench_batching.py --jobs 8 --batch-sizes 1,2,4
+    DIFFUSION_MODEL_NAME=/path/to/model python benchmarks/bench_batching.py --size 256 --steps 20
+
+Submits a burst of img2img jobs that share steps, strength and guidance
+(different prompts and seeds) to a ``JobQueue`` per batch size, runs them
+through the service's ``img2img_batch``, and reports images/minute, mean
+job latency and the number of pipeline calls. Each job is seeded, so the
+images of every batched run are compared with the unbatched ones too
+(max absolute pixel difference; batching should not change results).
+
+With DIFFUSION_MODEL_NAME unset, the tiny random-weight pipeline from
+tiny_pipeline.py is generated and used, which is enough to see the
+batching speedup on a CPU.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tiny_pipeline import use_tiny_pipeline_by_default  # noqa: E402
+
+use_tiny_pipeline_by_default()
+import main  # noqa: E402
+from job_queue import Job, JobQueue  # noqa: E402
+
+PROMPTS = [
+    "person wearing a red summer dress", "person wearing a navy blazer and chinos",
+    "person wearing a black leather jacket", "person wearing a white linen shirt",
+    "person wearing a grey wool coat", "person wearing a green knit sweater",
+]
+
+
+def person(i: int, size: int) -> Image.Image:
+    rng = np.random.default_rng(i)
+    small = rng.integers(0, 255, (8, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((size, size), Image.BILINEAR)
+
+
+def run(args, batch_size: int):
+    queue = JobQueue(max_depth=args.jobs, max_batch_size=batch_size)
+    submitted = []
+    for i in range(args.jobs):
+        params = {
+            "prompt": PROMPTS[i % len(PROMPTS)],
+            "image": person(i, args.size),
+            "strength": 0.7,
+            "guidance_scale": 7.5,
+            "num_inference_steps": args.steps,
+            "scheduler": "default",
+            "seed": i,
+        }
+        submitted.append(queue.submit("bench", main.img2img_batch, "normal", params, ("img2img", args.steps)))
+    # The whole burst is queued before the worker starts, as under load
+    start = time.perf_counter()
+    queue.start()
+    while not all(job.finished for job in submitted):
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    stats = queue.stats()
+    queue.stop()
+    failed = [job.error for job in submitted if job.state != "succeeded"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} job(s) failed: {failed[0]}")
+    latency = np.mean([job.finished_at - job.submitted_at for job in submitted])
+    images = [np.asarray(Image.open(io.BytesIO(job.result)), dtype=np.int16) for job in submitted]
+    return {"elapsed": elapsed, "latency": latency, "batches": stats["batches"], "images": images}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--batch-sizes", default="1,2,4")
+    parser.add_argument("--size", type=int, default=128)
+    parser.add_argument("--steps", type=int, default=10)
+    args = parser.parse_args()
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    main.load_img2img_pipeline().set_progress_bar_config(disable=True)
+    # Warm-up: first call pays for allocator and kernel setup
+    main.img2img_batch([Job("warm-up", main.img2img_batch, 1, {
+        "prompt": PROMPTS[0], "image": person(0, args.size), "strength": 0.7,
+        "guidance_scale": 7.5, "num_inference_steps": 2, "scheduler": "default", "seed": 0,
+    })])
+
+    print(f"{main.MODEL_NAME} on {main.device}, {args.jobs} jobs, {args.size}x{args.size}, {args.steps} steps")
+    print(f"{'batch':>6}{'calls':>7}{'wall s':>9}{'img/min':>9}{'mean latency s':>16}{'max px diff':>13}")
+    reference = None
+    for batch_size in batch_sizes:
+        result = run(args, batch_size)
+        if reference is None:
+            reference = result["images"]
+        diff = max(int(np.abs(a - b).max()) for a, b in zip(reference, result["images"]))
+        print(f"{batch_size:>6}{result['batches']:>7}{result['elapsed']:>9.1f}"
+              f"{60 * args.jobs / result['elapsed']:>9.1f}{result['latency']:>16.1f}{diff:>13}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,111 @@
+"""
+/generate-outfit latency: text-to-image vs. the old img2img-on-a-blank-canvas path.
+
+    python benchmarks/bench_generate_outfit.py --steps 20 --runs 3
+    DIFFUSION_MODEL_NAME=/path/to/model python benchmarks/bench_generate_outfit.py --size 512
+
+Runs both paths at the same ``num_inference_steps`` on the shared
+pipeline components: txt2img from noise, and img2img at strength 0.9 on
+the flat grey canvas the endpoint used to build. Reports seconds per
+image, UNet and VAE-encoder calls per image, and how grey the results
+are (mean distance of each pixel from the canvas colour; lower = closer
+to the canvas).
+
+DIFFUSION_MODEL_NAME defaults to the tiny random-weight pipeline from
+tiny_pipeline.py. Its images are noise, so only the timings and call
+counts are meaningful there, not the canvas distance.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tiny_pipeline import use_tiny_pipeline_by_default  # noqa: E402
+
+use_tiny_pipeline_by_default()
+import main  # noqa: E402
+
+CANVAS = (240, 240, 240)
+PROMPTS = [
+    "stylish casual outfit with jeans and blazer, fashion photography",
+    "red evening dress with gold accessories, studio photo",
+    "streetwear hoodie, cargo pants and sneakers, full body",
+]
+
+
+class CallCounter:
+    def __init__(self, module: torch.nn.Module):
+        self.calls = 0
+        self._handle = module.register_forward_pre_hook(self._count)
+
+    def _count(self, module, args):
+        self.calls += 1
+
+    def remove(self):
+        self._handle.remove()
+
+
+def run_txt2img(prompt: str, args, generator):
+    return main.pipelines.get("txt2img")(
+        prompt=prompt, height=args.size, width=args.size, guidance_scale=7.5,
+        num_inference_steps=args.steps, generator=generator,
+    ).images[0]
+
+
+def run_blank_img2img(prompt: str, args, generator):
+    blank = Image.new("RGB", (args.size, args.size), color=CANVAS)
+    return main.pipelines.get("img2img")(
+        prompt=prompt, image=blank, strength=0.9, guidance_scale=7.5,
+        num_inference_steps=args.steps, generator=generator,
+    ).images[0]
+
+
+def measure(name: str, generate, args) -> dict:
+    pipeline = main.pipelines.get(name)
+    pipeline.set_progress_bar_config(disable=True)
+    unet, encoder = CallCounter(pipeline.unet), CallCounter(pipeline.vae.encoder)
+    generate(PROMPTS[0], argparse.Namespace(**{**vars(args), "steps": 2}), torch.Generator().manual_seed(0))
+    unet.calls = encoder.calls = 0
+    times, greyness = [], []
+    for run in range(args.runs):
+        prompt = PROMPTS[run % len(PROMPTS)]
+        start = time.perf_counter()
+        image = generate(prompt, args, torch.Generator().manual_seed(run))
+        times.append(time.perf_counter() - start)
+        greyness.append(np.abs(np.asarray(image, dtype=np.float32) - CANVAS).mean())
+    unet.remove()
+    encoder.remove()
+    return {
+        "s_per_image": float(np.mean(times)),
+        "unet_calls": unet.calls / args.runs,
+        "vae_encodes": encoder.calls / args.runs,
+        "canvas_distance": float(np.mean(greyness)),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {
+        "img2img on blank": measure("img2img", run_blank_img2img, args),
+        "txt2img": measure("txt2img", run_txt2img, args),
+    }
+    print(f"{main.MODEL_NAME} on {main.device}, {args.size}x{args.size}, {args.steps} steps, {args.runs} runs")
+    print(f"{'path':<18}{'s/image':>9}{'unet calls':>12}{'vae encodes':>13}{'canvas dist':>13}")
+    for name, result in results.items():
+        print(f"{name:<18}{result['s_per_image']:>9.2f}{result['unet_calls']:>12.0f}"
+              f"{result['vae_encodes']:>13.0f}{result['canvas_distance']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
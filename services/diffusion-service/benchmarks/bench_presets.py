@@ -0,0 +1,88 @@
+"""
+Try-on latency per sampler preset, and time to the first streamed preview.
+
+    python benchmarks/bench_presets.py --size 256 --runs 2
+    DIFFUSION_MODEL_NAME=/path/to/model python benchmarks/bench_presets.py --size 512
+
+Runs the /try-on/simple img2img path (strength 0.65) with the model's
+default scheduler at the endpoint's default 30 steps, then with every
+preset, decoding a latent preview at each step the way the streaming mode
+does. Reports denoising steps actually run, seconds per image, seconds
+until the first preview and the cost of one preview decode.
+
+The default model is the tiny random-weight pipeline from
+tiny_pipeline.py; step counts and preview costs carry over to a real
+checkpoint, absolute seconds do not.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tiny_pipeline import use_tiny_pipeline_by_default  # noqa: E402
+
+use_tiny_pipeline_by_default()
+import main  # noqa: E402
+from sampling import PRESETS, latent_preview, preview_jpeg  # noqa: E402
+
+PROMPT = "person wearing stylish casual outfit, jeans and t-shirt, high quality photo"
+
+
+def person(size: int) -> Image.Image:
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 255, (8, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((size, size), Image.BILINEAR)
+
+
+def measure(scheduler: str, steps: int, args) -> dict:
+    pipeline = main.load_img2img_pipeline(scheduler)
+    pipeline.set_progress_bar_config(disable=True)
+    image = person(args.size)
+    totals, firsts, decodes, ran = [], [], [], 0
+    for run in range(args.runs + 1):
+        marks = []
+
+        def callback(pipe, step, timestep, callback_kwargs):
+            decode_start = time.perf_counter()
+            preview_jpeg(latent_preview(callback_kwargs["latents"][0], main.PREVIEW_SIZE))
+            marks.append((time.perf_counter(), time.perf_counter() - decode_start))
+            return callback_kwargs
+
+        start = time.perf_counter()
+        pipeline(
+            prompt=PROMPT, image=image, strength=0.65, guidance_scale=7.5, num_inference_steps=steps,
+            generator=torch.Generator().manual_seed(run), callback_on_step_end=callback,
+            callback_on_step_end_tensor_inputs=["latents"],
+        )
+        if run == 0:
+            continue  # warm-up
+        totals.append(time.perf_counter() - start)
+        firsts.append(marks[0][0] - start)
+        decodes.extend(decode for _, decode in marks)
+        ran = len(marks)
+    return {"steps": ran, "total": np.mean(totals), "first": np.mean(firsts), "decode_ms": 1000 * np.mean(decodes)}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--runs", type=int, default=2)
+    args = parser.parse_args()
+
+    configs = [("default, 30 steps", "default", 30)]
+    configs += [(f"{name} ({scheduler}, {steps})", scheduler, steps) for name, (scheduler, steps) in PRESETS.items()]
+    print(f"{main.MODEL_NAME} on {main.device}, {args.size}x{args.size}, img2img strength 0.65, {args.runs} runs")
+    print(f"{'sampling':<24}{'steps run':>10}{'s/image':>9}{'first preview s':>17}{'preview ms':>12}")
+    for label, scheduler, steps in configs:
+        result = measure(scheduler, steps, args)
+        print(f"{label:<24}{result['steps']:>10}{result['total']:>9.2f}{result['first']:>17.2f}{result['decode_ms']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
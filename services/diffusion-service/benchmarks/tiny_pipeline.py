@@ -0,0 +1,89 @@
+"""
+Random-weight tiny Stable Diffusion checkpoints for CPU benchmarks.
+
+    python benchmarks/tiny_pipeline.py [directory]
+
+Writes a base model (UNet, VAE, text encoder, byte-level tokenizer,
+scheduler) and an inpainting UNet in the layout ``PipelineManager`` loads,
+without downloading anything. The weights are random, so the images are
+noise: the benchmarks using them measure scheduling, batching and
+pipeline overhead, not image quality. Benchmarks fall back to these when
+DIFFUSION_MODEL_NAME is not set.
+"""
+import json
+import os
+import sys
+import tempfile
+from typing import Tuple
+
+DEFAULT_DIR = os.path.join(tempfile.gettempdir(), "tiny-sd-pipeline")
+
+
+def _save_unet(path: str, in_channels: int):
+    from diffusers import UNet2DConditionModel
+
+    UNet2DConditionModel(
+        sample_size=16, in_channels=in_channels, out_channels=4, layers_per_block=1,
+        block_out_channels=(32, 64), down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"), cross_attention_dim=32,
+        attention_head_dim=4, norm_num_groups=8,
+    ).save_pretrained(path)
+
+
+def _save_base(root: str):
+    from diffusers import AutoencoderKL, PNDMScheduler
+    from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    _save_unet(os.path.join(root, "unet"), 4)
+    AutoencoderKL(
+        in_channels=3, out_channels=3, latent_channels=4, block_out_channels=(8, 8, 8, 8),
+        down_block_types=("DownEncoderBlock2D",) * 4, up_block_types=("UpDecoderBlock2D",) * 4,
+        norm_num_groups=4, layers_per_block=1,
+    ).save_pretrained(os.path.join(root, "vae"))
+    CLIPTextModel(CLIPTextConfig(
+        hidden_size=32, intermediate_size=64, num_attention_heads=4, num_hidden_layers=2,
+        vocab_size=1000, projection_dim=32,
+    )).save_pretrained(os.path.join(root, "text_encoder"))
+
+    # Byte-level vocabulary without merges: every character is its own token
+    tokenizer_dir = os.path.join(root, "tokenizer")
+    os.makedirs(tokenizer_dir, exist_ok=True)
+    characters = list(bytes_to_unicode().values())
+    tokens = characters + [c + "</w>" for c in characters] + ["<|startoftext|>", "<|endoftext|>"]
+    vocab_path = os.path.join(tokenizer_dir, "vocab.json")
+    merges_path = os.path.join(tokenizer_dir, "merges.txt")
+    with open(vocab_path, "w") as f:
+        json.dump({token: i for i, token in enumerate(tokens)}, f)
+    with open(merges_path, "w") as f:
+        f.write("#version: 0.2\n")
+    CLIPTokenizer(vocab_path, merges_path, model_max_length=77).save_pretrained(tokenizer_dir)
+
+    PNDMScheduler(skip_prk_steps=True, steps_offset=1).save_pretrained(os.path.join(root, "scheduler"))
+
+
+def ensure_tiny_pipeline(directory: str = DEFAULT_DIR) -> Tuple[str, str]:
+    """Create the checkpoints under ``directory`` unless present; returns (base, inpaint) paths."""
+    import torch
+
+    base, inpaint = os.path.join(directory, "base"), os.path.join(directory, "inpaint")
+    torch.manual_seed(0)
+    if not os.path.exists(os.path.join(base, "scheduler", "scheduler_config.json")):
+        _save_base(base)
+    if not os.path.exists(os.path.join(inpaint, "unet", "config.json")):
+        # Only the UNet: the text encoder, tokenizer and VAE come from the base model
+        _save_unet(os.path.join(inpaint, "unet"), 9)
+    return base, inpaint
+
+
+def use_tiny_pipeline_by_default():
+    """Point DIFFUSION_MODEL_NAME (and the inpainting model) at the tiny checkpoints unless set."""
+    if os.getenv("DIFFUSION_MODEL_NAME"):
+        return
+    base, inpaint = ensure_tiny_pipeline()
+    os.environ["DIFFUSION_MODEL_NAME"] = base
+    os.environ.setdefault("DIFFUSION_INPAINT_MODEL_NAME", inpaint)
+
+
+if __name__ == "__main__":
+    print("base: {}\ninpaint: {}".format(*ensure_tiny_pipeline(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DIR)))
@@ -0,0 +1,113 @@
+"""
+Decode and preprocess uploaded images off the event loop.
+
+Shared by clip-service and diffusion-service: each service is built from its
+own directory, so both keep an identical copy of this file.
+"""
+import asyncio
+import functools
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+STAGES = ("open", "decode", "orient", "convert", "resize", "queue", "total")
+
+
+def preprocess_image(data: bytes, min_side: Optional[int] = None, size: Optional[Tuple[int, int]] = None,
+                     mode: str = "RGB") -> Tuple[Image.Image, Dict[str, float]]:
+    """
+    Decode uploaded bytes into a ``mode`` image; returns it with per-stage
+    timings in milliseconds.
+
+    When the caller only needs a shortest side of ``min_side`` or an output
+    of ``size``, JPEGs are decoded at 1/2, 1/4 or 1/8 scale (PIL draft mode,
+    done by the JPEG decoder itself) instead of at full resolution. EXIF
+    orientation is applied, and with ``size`` the image is resized to it.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(stage: str):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = (now - start) * 1000
+        start = now
+
+    image = Image.open(io.BytesIO(data))
+    lap("open")
+    wanted = size or ((min_side, min_side) if min_side else None)
+    if wanted is not None and image.format == "JPEG":
+        # Orientation may swap the axes, so ask for the larger side both ways
+        side = max(wanted)
+        image.draft(None, (side, side))
+    image.load()
+    lap("decode")
+    image = ImageOps.exif_transpose(image)
+    lap("orient")
+    if image.mode != mode:
+        image = image.convert(mode)
+    lap("convert")
+    if size is not None and image.size != tuple(size):
+        image = image.resize(size)
+    lap("resize")
+    return image, timings
+
+
+def _warm_up(_):
+    return None
+
+
+class ImagePreprocessor:
+    """
+    Runs ``preprocess_image`` in a process pool, so decoding neither blocks
+    the event loop nor holds the service's GIL, and keeps per-stage timing
+    averages. ``queue`` is the time spent waiting for a worker and moving
+    bytes and pixels between processes. With ``workers=0`` it uses the
+    default thread pool instead.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.images = 0
+        self._totals = {stage: 0.0 for stage in STAGES}
+
+    def start(self):
+        if self.workers <= 0 or self._pool is not None:
+            return
+        # Forked workers start instantly and do not re-import the service's main
+        # module (which would load the model again); they only ever touch PIL.
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+        # Fork every worker now rather than on the first upload
+        list(self._pool.map(_warm_up, range(self.workers)))
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    async def run(self, data: bytes, **options) -> Tuple[Image.Image, Dict[str, float]]:
+        """Preprocess one upload (see ``preprocess_image`` for options)."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        image, timings = await loop.run_in_executor(self._pool, functools.partial(preprocess_image, data, **options))
+        total = (time.perf_counter() - start) * 1000
+        timings["queue"] = max(total - sum(timings.values()), 0.0)
+        timings["total"] = total
+        self.images += 1
+        for stage, elapsed in timings.items():
+            self._totals[stage] += elapsed
+        return image, timings
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "images": self.images,
+            "avg_ms": {stage: round(total / self.images, 2) if self.images else 0.0
+                       for stage, total in self._totals.items()},
+        }
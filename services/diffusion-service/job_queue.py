@@ -0,0 +1,316 @@
+import asyncio
+import heapq
+import io
+import itertools
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+
+class QueueFull(Exception):
+    """The queue is at its depth limit; ``retry_after`` is an estimate in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Generation queue is full, retry in about {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, kind: str, run: Callable[[List["Job"]], List[Image.Image]], priority: int, params: dict,
+                 batch_key: Optional[Hashable] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.run = run
+        self.priority = priority
+        self.params = params
+        self.batch_key = batch_key
+        self.batch_size: Optional[int] = None
+        # Denoising progress, reported by the pipeline's step callback
+        self.step: Optional[int] = None
+        self.steps: Optional[int] = None
+        self.state = "queued"
+        self.error: Optional[str] = None
+        self.result: Optional[bytes] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # (loop, queue) of every subscriber waiting for status events
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def watched(self) -> bool:
+        """Someone is subscribed to this job's events."""
+        return bool(self._subscribers)
+
+    def status(self, position: Optional[int] = None) -> dict:
+        status = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "priority": self.priority,
+            "submitted_at": self.submitted_at,
+        }
+        if position is not None:
+            status["position"] = position
+        if "seed" in self.params:
+            status["seed"] = self.params["seed"]
+        if self.batch_size is not None:
+            status["batch_size"] = self.batch_size
+        if self.steps is not None:
+            status["step"] = self.step
+            status["steps"] = self.steps
+        if self.started_at is not None:
+            status["queue_s"] = round(self.started_at - self.submitted_at, 3)
+        if self.finished_at is not None and self.started_at is not None:
+            status["run_s"] = round(self.finished_at - self.started_at, 3)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+class JobQueue:
+    """
+    Asynchronous generation jobs served by one worker thread.
+
+    The worker owns the diffusion pipelines, so only one generation runs at
+    a time and the event loop never waits on one. Handlers ``submit`` a job
+    with a priority and get its id back at once; jobs run highest priority
+    first, FIFO within a priority.
+
+    A job's ``run`` takes a list of jobs and returns one image per job.
+    Jobs submitted with the same ``batch_key`` (same pipeline and sampling
+    settings) are compatible: when one is picked, up to ``max_batch_size``
+    waiting jobs with its key (best priority first) are taken along and run
+    in a single call. Batches form from whatever queued up while the
+    previous generation ran, so nobody waits for a batch to fill.
+    Beyond ``max_depth`` waiting jobs ``submit`` raises ``QueueFull`` with a
+    retry-after estimated from recent run times. Results (PNG bytes) are
+    kept for ``result_ttl_s`` after a job finishes. Callers poll ``get`` or
+    ``subscribe`` to status events; the pipeline step callback reports
+    ``progress``, optionally with a preview image.
+    """
+
+    def __init__(self, max_depth: int = 16, result_ttl_s: float = 600.0, initial_estimate_s: float = 30.0,
+                 max_batch_size: int = 1):
+        self.max_depth = max_depth
+        self.max_batch_size = max_batch_size
+        self.result_ttl = result_ttl_s
+        self.avg_run_s = initial_estimate_s
+        self._heap: List[Tuple[int, int, Job]] = []
+        self._sequence = itertools.count()
+        self._jobs: Dict[str, Job] = {}
+        self._current: List[Job] = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.counters = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "batches": 0}
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._worker, name="diffusion-jobs", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, kind: str, run: Callable[[List[Job]], List[Image.Image]], priority: str = "normal",
+               params: Optional[dict] = None, batch_key: Optional[Hashable] = None) -> Job:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}' (expected one of {', '.join(PRIORITIES)})")
+        job = Job(kind, run, PRIORITIES[priority], params or {}, batch_key)
+        with self._cond:
+            self._expire()
+            if len(self._heap) >= self.max_depth:
+                self.counters["rejected"] += 1
+                # A slot frees up when the running job finishes
+                raise QueueFull(max(1, int(self.avg_run_s)))
+            heapq.heappush(self._heap, (job.priority, next(self._sequence), job))
+            self._jobs[job.id] = job
+            self.counters["submitted"] += 1
+            self._cond.notify_all()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> Optional[int]:
+        """0-based place among waiting jobs (None once it has started)."""
+        with self._cond:
+            return self._position_locked(job)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != "queued":
+                return False
+            self._heap = [entry for entry in self._heap if entry[2] is not job]
+            heapq.heapify(self._heap)
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            self.counters["cancelled"] += 1
+        self._publish(job)
+        return True
+
+    def subscribe(self, job: Job) -> asyncio.Queue:
+        """Status events for ``job`` on the calling event loop; the current status comes first."""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._cond:
+            queue.put_nowait(job.status(self._position_locked(job)))
+            if not job.finished:
+                job._subscribers.append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, job: Job, queue: asyncio.Queue):
+        with self._cond:
+            job._subscribers = [entry for entry in job._subscribers if entry[1] is not queue]
+
+    async def wait(self, job: Job, timeout: Optional[float] = None) -> Job:
+        """Wait until ``job`` has finished (or ``timeout`` passes)."""
+        queue = self.subscribe(job)
+        try:
+            async def finished():
+                while (await queue.get())["state"] not in FINISHED_STATES:
+                    pass
+            await asyncio.wait_for(finished(), timeout)
+        finally:
+            self.unsubscribe(job, queue)
+        return job
+
+    def _position_locked(self, job: Job) -> Optional[int]:
+        if job.state != "queued":
+            return None
+        key = next(((p, s) for p, s, queued in self._heap if queued is job), None)
+        return sum(1 for entry in self._heap if entry[:2] < key) if key else None
+
+    def progress(self, job: Job, step: int, steps: int, preview: Optional[str] = None):
+        """
+        Record denoising progress of a running job (called from the worker).
+        Subscribers get a status event, or a "preview" event when ``preview``
+        (a base64 JPEG of the intermediate result) is given.
+        """
+        with self._cond:
+            job.step = step
+            job.steps = steps
+        self._publish(job, {"preview": preview} if preview else None)
+
+    def _publish(self, job: Job, extra: Optional[dict] = None):
+        with self._cond:
+            status = job.status(self._position_locked(job))
+            if extra:
+                status.update(extra)
+            subscribers = list(job._subscribers)
+            if job.finished:
+                job._subscribers.clear()
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, status)
+            except RuntimeError:
+                pass  # subscriber's loop has closed
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _take_batch(self) -> List[Job]:
+        """Pop the next job and every compatible waiting job that fits in its batch."""
+        _, _, job = heapq.heappop(self._heap)
+        group = [job]
+        if job.batch_key is not None and self.max_batch_size > 1:
+            for entry in sorted(self._heap):
+                if len(group) >= self.max_batch_size:
+                    break
+                if entry[2].batch_key == job.batch_key:
+                    group.append(entry[2])
+            if len(group) > 1:
+                self._heap = [entry for entry in self._heap if entry[2] not in group]
+                heapq.heapify(self._heap)
+        return group
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._heap or not self._running)
+                if not self._running:
+                    return
+                group = self._take_batch()
+                self._current = group
+                started_at = time.time()
+                for job in group:
+                    job.state = "running"
+                    job.started_at = started_at
+                    job.batch_size = len(group)
+            for job in group:
+                self._publish(job)
+            try:
+                images = group[0].run(group)
+                if len(images) != len(group):
+                    raise RuntimeError(f"Batch of {len(group)} jobs returned {len(images)} images")
+                for job, image in zip(group, images):
+                    buffer = io.BytesIO()
+                    image.save(buffer, format="PNG")
+                    job.result = buffer.getvalue()
+                state, error = "succeeded", None
+            except Exception as e:
+                logger.exception(f"Batch of {len(group)} {group[0].kind} job(s) failed")
+                state, error = "failed", str(e)
+            with self._cond:
+                finished_at = time.time()
+                for job in group:
+                    job.state = state
+                    job.error = error
+                    job.finished_at = finished_at
+                    # Release the inputs (decoded images) captured by the job
+                    job.run = None
+                    job.params = {key: value for key, value in job.params.items()
+                                  if not isinstance(value, Image.Image)}
+                    self.counters[state] += 1
+                self._current = []
+                self.counters["batches"] += 1
+                # Exponential moving average of run time, for retry-after estimates
+                self.avg_run_s = 0.8 * self.avg_run_s + 0.2 * (finished_at - started_at)
+            for job in group:
+                self._publish(job)
+            # Every waiting job moved up
+            with self._cond:
+                waiting = [entry[2] for entry in self._heap]
+            for waiting_job in waiting:
+                if waiting_job._subscribers:
+                    self._publish(waiting_job)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued": len(self._heap),
+                "running": [job.id for job in self._current],
+                "max_depth": self.max_depth,
+                "max_batch_size": self.max_batch_size,
+                "avg_run_s": round(self.avg_run_s, 2),
+                "retained_jobs": len(self._jobs),
+                **self.counters,
+            }
@@ -1,15 +1,21 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import torch
-from diffusers import StableDiffusionInpaintPipeline, StableDiffusionImg2ImgPipeline
 from PIL import Image
+import asyncio
 import io
 import os
+import json
+import random
 import logging
 import base64
+from image_preprocessing import ImagePreprocessor
+from job_queue import FINISHED_STATES, Job, JobQueue, QueueFull
+from pipeline_manager import PipelineManager
+from sampling import latent_preview, preview_jpeg, resolve_sampling
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,40 +33,223 @@ app.add_middleware(
 
 # Configuration
 MODEL_NAME = os.getenv("DIFFUSION_MODEL_NAME", "runwayml/stable-diffusion-v1-5")
+# Inpainting UNet; text encoder, tokenizer and VAE are shared with MODEL_NAME
+INPAINT_MODEL_NAME = os.getenv("DIFFUSION_INPAINT_MODEL_NAME", "runwayml/stable-diffusion-inpainting")
+# Device memory for model weights (0 = unlimited); least recently used UNets are evicted beyond it
+MEMORY_BUDGET_MB = float(os.getenv("DIFFUSION_MEMORY_BUDGET_MB", "0"))
+# "offload" evicted UNets to CPU memory (GPU only) or "unload" them
+UNET_EVICTION = os.getenv("DIFFUSION_UNET_EVICTION", "offload")
+# Processes decoding uploads (0 = threads in this process)
+DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Generation queue: waiting jobs beyond this are rejected with 429
+QUEUE_DEPTH = int(os.getenv("DIFFUSION_QUEUE_DEPTH", "16"))
+RESULT_TTL_SECONDS = float(os.getenv("DIFFUSION_RESULT_TTL_SECONDS", "600"))
+# Compatible queued requests (same pipeline, steps, strength, guidance) run as one batch
+MAX_BATCH_SIZE = int(os.getenv("DIFFUSION_MAX_BATCH_SIZE", "4"))
+# Streamed previews: every Nth denoising step (0 = none), longer side in pixels
+PREVIEW_EVERY = int(os.getenv("DIFFUSION_PREVIEW_EVERY", "1"))
+PREVIEW_SIZE = int(os.getenv("DIFFUSION_PREVIEW_SIZE", "128"))
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-# Initialize pipelines
-logger.info(f"Loading Stable Diffusion model: {MODEL_NAME} on {device}")
-img2img_pipeline = None
-inpaint_pipeline = None
-
-def load_img2img_pipeline():
-    global img2img_pipeline
-    if img2img_pipeline is None:
-        logger.info("Loading Img2Img pipeline...")
-        img2img_pipeline = StableDiffusionImg2ImgPipeline.from_pretrained(
-            MODEL_NAME,
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-            safety_checker=None 
-        ).to(device)
-        if device == "cuda":
-            img2img_pipeline.enable_attention_slicing()
-    return img2img_pipeline
-
-def load_inpaint_pipeline():
-    global inpaint_pipeline
-    if inpaint_pipeline is None:
-        logger.info("Loading Inpaint pipeline...")
-        # Use a model specifically trained for inpainting
-        inpaint_model = "runwayml/stable-diffusion-inpainting"
-        inpaint_pipeline = StableDiffusionInpaintPipeline.from_pretrained(
-            inpaint_model,
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-            safety_checker=None
-        ).to(device)
-        if device == "cuda":
-            inpaint_pipeline.enable_attention_slicing()
-    return inpaint_pipeline
+# SD 1.5 works at 512x512
+TARGET_SIZE = (512, 512)
+# Text-to-image resolution limits (each side a multiple of 8: the VAE downsamples by 8)
+MIN_RESOLUTION = 256
+MAX_RESOLUTION = int(os.getenv("DIFFUSION_MAX_RESOLUTION", "768"))
+
+# Pipelines are built on first use from components loaded once
+logger.info(f"Stable Diffusion model: {MODEL_NAME} (inpainting: {INPAINT_MODEL_NAME}) on {device}")
+pipelines = PipelineManager(
+    MODEL_NAME,
+    INPAINT_MODEL_NAME,
+    device=device,
+    dtype=torch.float16 if device == "cuda" else torch.float32,
+    memory_budget_mb=MEMORY_BUDGET_MB,
+    eviction=UNET_EVICTION
+)
+
+def load_img2img_pipeline(scheduler: str = "default"):
+    return pipelines.get("img2img", scheduler)
+
+def load_inpaint_pipeline(scheduler: str = "default"):
+    return pipelines.get("inpaint", scheduler)
+
+# Upload decoding (draft-mode JPEG decode, EXIF orientation, resize) in worker processes
+preprocessor = ImagePreprocessor(DECODE_WORKERS)
+
+# Generation jobs
+# Handlers decode their uploads, then hand the pipeline call to a single
+# worker thread that owns the pipelines; the event loop never runs one.
+jobs = JobQueue(QUEUE_DEPTH, RESULT_TTL_SECONDS, max_batch_size=MAX_BATCH_SIZE)
+
+@app.on_event("startup")
+async def start_preprocessor():
+    preprocessor.start()
+    jobs.start()
+
+@app.on_event("shutdown")
+async def stop_preprocessor():
+    jobs.stop()
+    preprocessor.stop()
+
+async def load_upload(upload: UploadFile, size=TARGET_SIZE) -> Image.Image:
+    """Read an uploaded image and decode it straight to ``size`` off the event loop."""
+    data = await upload.read()
+    image, timings = await preprocessor.run(data, size=size)
+    logger.info(f"Preprocessed {upload.filename}: " + ", ".join(f"{stage} {ms:.1f}ms" for stage, ms in timings.items()))
+    return image
+
+def job_links(job: Job) -> dict:
+    return {
+        "status_url": f"/jobs/{job.id}",
+        "result_url": f"/jobs/{job.id}/result",
+        "events_url": f"/jobs/{job.id}/events"
+    }
+
+def job_result(job: Job) -> StreamingResponse:
+    """The finished job's PNG, or the reason there is none."""
+    if job.state == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if not job.finished or job.result is None:
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}")
+    return StreamingResponse(io.BytesIO(job.result), media_type="image/png")
+
+def generators(group: List[Job]) -> List[torch.Generator]:
+    """One seeded generator per batch item, so each result depends only on its own seed."""
+    return [torch.Generator(device="cpu").manual_seed(job.params["seed"]) for job in group]
+
+def step_callback(group: List[Job]):
+    """
+    Pipeline step callback for a batch: progress for every job, plus a
+    preview of its intermediate latents (cheap linear decode, no VAE) when
+    someone is watching the job.
+    """
+    def callback(pipeline, step: int, timestep, callback_kwargs: dict) -> dict:
+        steps = pipeline.num_timesteps
+        latents = callback_kwargs["latents"]
+        for index, job in enumerate(group):
+            preview = None
+            # The last step's image is the result itself
+            if job.watched and PREVIEW_EVERY and (step + 1) % PREVIEW_EVERY == 0 and step + 1 < steps:
+                preview = preview_jpeg(latent_preview(latents[index], PREVIEW_SIZE))
+            jobs.progress(job, step + 1, steps, preview)
+        return callback_kwargs
+    return callback
+
+def img2img_batch(group: List[Job]) -> List[Image.Image]:
+    """One img2img call for a batch of jobs sharing steps, strength and guidance."""
+    settings = group[0].params
+    pipeline = load_img2img_pipeline(settings["scheduler"])
+    with torch.no_grad():
+        return pipeline(
+            prompt=[job.params["prompt"] for job in group],
+            image=[job.params["image"] for job in group],
+            strength=settings["strength"],
+            guidance_scale=settings["guidance_scale"],
+            num_inference_steps=settings["num_inference_steps"],
+            generator=generators(group),
+            callback_on_step_end=step_callback(group),
+            callback_on_step_end_tensor_inputs=["latents"]
+        ).images
+
+def inpaint_batch(group: List[Job]) -> List[Image.Image]:
+    """One inpainting call for a batch of jobs sharing steps and guidance."""
+    settings = group[0].params
+    pipeline = load_inpaint_pipeline(settings["scheduler"])
+    with torch.no_grad():
+        return pipeline(
+            prompt=[job.params["prompt"] for job in group],
+            image=[job.params["image"] for job in group],
+            mask_image=[job.params["mask_image"] for job in group],
+            guidance_scale=settings["guidance_scale"],
+            num_inference_steps=settings["num_inference_steps"],
+            generator=generators(group),
+            callback_on_step_end=step_callback(group),
+            callback_on_step_end_tensor_inputs=["latents"]
+        ).images
+
+def txt2img_batch(group: List[Job]) -> List[Image.Image]:
+    """One text-to-image call for a batch of jobs sharing resolution, steps and guidance."""
+    settings = group[0].params
+    pipeline = pipelines.get("txt2img", settings["scheduler"])
+    with torch.no_grad():
+        return pipeline(
+            prompt=[job.params["prompt"] for job in group],
+            negative_prompt=[job.params["negative_prompt"] for job in group],
+            height=settings["height"],
+            width=settings["width"],
+            guidance_scale=settings["guidance_scale"],
+            num_inference_steps=settings["num_inference_steps"],
+            generator=generators(group),
+            callback_on_step_end=step_callback(group),
+            callback_on_step_end_tensor_inputs=["latents"]
+        ).images
+
+BATCH_RUNNERS = {"txt2img": txt2img_batch, "img2img": img2img_batch, "inpaint": inpaint_batch}
+
+def sampling_params(preset: Optional[str], scheduler: Optional[str], num_inference_steps: int) -> dict:
+    """Scheduler and steps for a request; a preset ("preview", "fast", "final") sets both."""
+    try:
+        scheduler, num_inference_steps = resolve_sampling(preset, scheduler, num_inference_steps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"scheduler": scheduler, "num_inference_steps": num_inference_steps}
+
+async def job_event_stream(job: Job, include_result: bool = False):
+    """
+    Server-Sent events for a job until it finishes: "status" on every
+    change, "preview" with a base64 JPEG of the intermediate result while it
+    denoises and, with ``include_result``, a final "result" with the PNG.
+    """
+    queue = jobs.subscribe(job)
+    try:
+        while True:
+            status = await queue.get()
+            event = "preview" if "preview" in status else "status"
+            yield f"event: {event}\ndata: {json.dumps(status)}\n\n"
+            if status["state"] in FINISHED_STATES:
+                break
+    finally:
+        jobs.unsubscribe(job, queue)
+    if include_result and job.result is not None:
+        image = base64.b64encode(job.result).decode("ascii")
+        yield f"event: result\ndata: {json.dumps({'job_id': job.id, 'image': image})}\n\n"
+
+def job_event_response(job: Job, include_result: bool = False) -> StreamingResponse:
+    return StreamingResponse(
+        job_event_stream(job, include_result),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def run_job(kind: str, pipeline: str, priority: str, wait: bool, seed: Optional[int], stream: bool = False,
+                  **params):
+    """
+    Queue a generation on ``pipeline`` ("txt2img", "img2img" or "inpaint"). With
+    ``stream`` the response is the job's event stream with previews and the
+    final image; with ``wait`` it is the PNG once the job is done (the
+    original synchronous API); otherwise 202 with the job id.
+    """
+    params["seed"] = seed if seed is not None else random.randrange(2 ** 32)
+    # Everything but the per-item inputs must match for jobs to share a batch
+    batch_key = (pipeline,) + tuple(sorted(
+        (name, value) for name, value in params.items()
+        if name not in ("prompt", "negative_prompt", "image", "mask_image", "seed")
+    ))
+    try:
+        job = jobs.submit(kind, BATCH_RUNNERS[pipeline], priority, params, batch_key)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Queued {kind} job {job.id} (priority {priority}, position {jobs.position(job)})")
+    
+    if stream:
+        return job_event_response(job, include_result=True)
+    if not wait:
+        return JSONResponse(status_code=202, content={**job.status(jobs.position(job)), **job_links(job)})
+    await jobs.wait(job)
+    return job_result(job)
 
 class TryOnRequest(BaseModel):
     prompt: Optional[str] = "person wearing fashionable clothing"
@@ -74,7 +263,10 @@ async def root():
         "service": "Stable Diffusion Virtual Try-On Service",
         "model": MODEL_NAME,
         "device": device,
-        "status": "active"
+        "status": "active",
+        "jobs": jobs.stats(),
+        "pipelines": pipelines.stats(),
+        "preprocessing": preprocessor.stats()
     }
 
 @app.post("/try-on/img2img")
@@ -84,49 +276,41 @@ async def try_on_img2img(
     prompt: str = Form("person wearing the clothing item, professional photo, high quality"),
     strength: float = Form(0.7),
     guidance_scale: float = Form(7.5),
-    num_inference_steps: int = Form(30)
+    num_inference_steps: int = Form(30),
+    seed: Optional[int] = Form(None),
+    preset: Optional[str] = Form(None),
+    scheduler: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    priority: str = Form("normal"),
+    wait: bool = Form(True)
 ):
     """
     Virtual try-on using image-to-image diffusion.
     Combines person and clothing images to generate a preview.
     """
     try:
-        # Load pipeline
-        pipeline = load_img2img_pipeline()
-        
-        # Read images
-        person_data = await person_image.read()
-        person_img = Image.open(io.BytesIO(person_data)).convert("RGB")
-        
-        clothing_data = await clothing_image.read()
-        clothing_img = Image.open(io.BytesIO(clothing_data)).convert("RGB")
-        
-        # Resize to appropriate size (512x512 for SD 1.5)
-        target_size = (512, 512)
-        person_img = person_img.resize(target_size)
+        # Read images, decoded and resized to 512x512 for SD 1.5
+        person_img, clothing_img = await asyncio.gather(
+            load_upload(person_image), load_upload(clothing_image)
+        )
         
         # Enhanced prompt incorporating clothing
         enhanced_prompt = f"{prompt}, wearing stylish outfit, detailed clothing, natural pose"
         
         logger.info(f"Generating try-on with prompt: {enhanced_prompt}")
         
-        # Generate image
-        with torch.no_grad():
-            result = pipeline(
-                prompt=enhanced_prompt,
-                image=person_img,
-                strength=strength,
-                guidance_scale=guidance_scale,
-                num_inference_steps=num_inference_steps
-            ).images[0]
-        
-        # Convert to bytes
-        img_byte_arr = io.BytesIO()
-        result.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
-        return StreamingResponse(img_byte_arr, media_type="image/png")
+        return await run_job(
+            "try-on/img2img", "img2img", priority, wait, seed,
+            stream=stream,
+            prompt=enhanced_prompt,
+            image=person_img,
+            strength=strength,
+            guidance_scale=guidance_scale,
+            **sampling_params(preset, scheduler, num_inference_steps)
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in try-on generation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -138,50 +322,38 @@ async def try_on_inpaint(
     clothing_image: UploadFile = File(...),
     prompt: str = Form("person wearing fashionable clothing, detailed outfit, high quality"),
     guidance_scale: float = Form(7.5),
-    num_inference_steps: int = Form(50)
+    num_inference_steps: int = Form(50),
+    seed: Optional[int] = Form(None),
+    preset: Optional[str] = Form(None),
+    scheduler: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    priority: str = Form("normal"),
+    wait: bool = Form(True)
 ):
     """
     Virtual try-on using inpainting.
     Requires a mask image indicating where to place the clothing.
     """
     try:
-        # Load pipeline
-        pipeline = load_inpaint_pipeline()
-        
-        # Read images
-        person_data = await person_image.read()
-        person_img = Image.open(io.BytesIO(person_data)).convert("RGB")
-        
-        mask_data = await mask_image.read()
-        mask_img = Image.open(io.BytesIO(mask_data)).convert("RGB")
-        
-        clothing_data = await clothing_image.read()
-        clothing_img = Image.open(io.BytesIO(clothing_data)).convert("RGB")
-        
-        # Resize to appropriate size
-        target_size = (512, 512)
-        person_img = person_img.resize(target_size)
-        mask_img = mask_img.resize(target_size)
+        # Read images, decoded and resized to the target size
+        person_img, mask_img, clothing_img = await asyncio.gather(
+            load_upload(person_image), load_upload(mask_image), load_upload(clothing_image)
+        )
         
         logger.info(f"Generating inpaint try-on with prompt: {prompt}")
         
-        # Generate image
-        with torch.no_grad():
-            result = pipeline(
-                prompt=prompt,
-                image=person_img,
-                mask_image=mask_img,
-                guidance_scale=guidance_scale,
-                num_inference_steps=num_inference_steps
-            ).images[0]
-        
-        # Convert to bytes
-        img_byte_arr = io.BytesIO()
-        result.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
-        return StreamingResponse(img_byte_arr, media_type="image/png")
+        return await run_job(
+            "try-on/inpaint", "inpaint", priority, wait, seed,
+            stream=stream,
+            prompt=prompt,
+            image=person_img,
+            mask_image=mask_img,
+            guidance_scale=guidance_scale,
+            **sampling_params(preset, scheduler, num_inference_steps)
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in inpaint try-on: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -192,43 +364,36 @@ async def try_on_simple(
     prompt: str = Form("person wearing stylish casual outfit, jeans and t-shirt, high quality photo"),
     strength: float = Form(0.65),
     guidance_scale: float = Form(7.5),
-    num_inference_steps: int = Form(30)
+    num_inference_steps: int = Form(30),
+    seed: Optional[int] = Form(None),
+    preset: Optional[str] = Form(None),
+    scheduler: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    priority: str = Form("normal"),
+    wait: bool = Form(True)
 ):
     """
     Simplified try-on that generates outfit based on text prompt.
     Good for quick previews without needing clothing images.
     """
     try:
-        # Load pipeline
-        pipeline = load_img2img_pipeline()
-        
-        # Read person image
-        person_data = await person_image.read()
-        person_img = Image.open(io.BytesIO(person_data)).convert("RGB")
-        
-        # Resize
-        target_size = (512, 512)
-        person_img = person_img.resize(target_size)
+        # Read person image, decoded and resized to the target size
+        person_img = await load_upload(person_image)
         
         logger.info(f"Generating simple try-on with prompt: {prompt}")
         
-        # Generate image
-        with torch.no_grad():
-            result = pipeline(
-                prompt=prompt,
-                image=person_img,
-                strength=strength,
-                guidance_scale=guidance_scale,
-                num_inference_steps=num_inference_steps
-            ).images[0]
-        
-        # Convert to bytes
-        img_byte_arr = io.BytesIO()
-        result.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
-        return StreamingResponse(img_byte_arr, media_type="image/png")
+        return await run_job(
+            "try-on/simple", "img2img", priority, wait, seed,
+            stream=stream,
+            prompt=prompt,
+            image=person_img,
+            strength=strength,
+            guidance_scale=guidance_scale,
+            **sampling_params(preset, scheduler, num_inference_steps)
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in simple try-on: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -236,43 +401,79 @@ async def try_on_simple(
 @app.post("/generate-outfit")
 async def generate_outfit(
     prompt: str = Form("stylish casual outfit with jeans and blazer, fashion photography"),
+    negative_prompt: str = Form("blurry, low quality, deformed, disfigured, extra limbs, watermark, text"),
+    width: int = Form(512),
+    height: int = Form(512),
     num_inference_steps: int = Form(50),
-    guidance_scale: float = Form(7.5)
+    guidance_scale: float = Form(7.5),
+    seed: Optional[int] = Form(None),
+    preset: Optional[str] = Form(None),
+    scheduler: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    priority: str = Form("normal"),
+    wait: bool = Form(True)
 ):
     """
     Generate outfit visualization from text description.
     Useful for inspiration and style exploration.
     """
     try:
-        # Load pipeline
-        pipeline = load_img2img_pipeline()
-        
-        # Create blank canvas
-        blank = Image.new('RGB', (512, 512), color=(240, 240, 240))
+        for name, value in (("width", width), ("height", height)):
+            if value % 8 or not MIN_RESOLUTION <= value <= MAX_RESOLUTION:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{name} must be a multiple of 8 between {MIN_RESOLUTION} and {MAX_RESOLUTION}"
+                )
         
-        logger.info(f"Generating outfit from prompt: {prompt}")
+        logger.info(f"Generating outfit ({width}x{height}) from prompt: {prompt}")
         
-        # Generate image
-        with torch.no_grad():
-            result = pipeline(
-                prompt=prompt,
-                image=blank,
-                strength=0.9,
-                guidance_scale=guidance_scale,
-                num_inference_steps=num_inference_steps
-            ).images[0]
-        
-        # Convert to bytes
-        img_byte_arr = io.BytesIO()
-        result.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
-        return StreamingResponse(img_byte_arr, media_type="image/png")
+        return await run_job(
+            "generate-outfit", "txt2img", priority, wait, seed,
+            stream=stream,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            width=width,
+            height=height,
+            guidance_scale=guidance_scale,
+            **sampling_params(preset, scheduler, num_inference_steps)
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating outfit: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_job(job_id: str) -> Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (or its result has expired)")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Poll a job: state, queue position, timings."""
+    job = get_job(job_id)
+    return {**job.status(jobs.position(job)), **job_links(job)}
+
+@app.get("/jobs/{job_id}/result")
+async def job_result_image(job_id: str):
+    """The generated PNG; 409 while the job is still queued or running."""
+    return job_result(get_job(job_id))
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Subscribe to a job: Server-Sent "status" and "preview" events until it finishes."""
+    return job_event_response(get_job(job_id))
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a job that has not started yet."""
+    job = get_job(job_id)
+    if not jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}")
+    return {"success": True, "job_id": job_id, "state": job.state}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003)
@@ -0,0 +1,222 @@
+import collections
+import gc
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import diffusers
+import torch
+from diffusers import (
+    AutoencoderKL, StableDiffusionImg2ImgPipeline, StableDiffusionInpaintPipeline,
+    StableDiffusionPipeline, UNet2DConditionModel,
+)
+from transformers import CLIPTextModel, CLIPTokenizer
+
+from sampling import make_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Pipeline -> (class, UNet it runs on)
+PIPELINES = {
+    "txt2img": (StableDiffusionPipeline, "base"),
+    "img2img": (StableDiffusionImg2ImgPipeline, "base"),
+    "inpaint": (StableDiffusionInpaintPipeline, "inpaint"),
+}
+EVICTION_POLICIES = ("offload", "unload")
+
+
+def module_bytes(module: torch.nn.Module) -> int:
+    """Memory held by a module's parameters and buffers."""
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class PipelineManager:
+    """
+    Loads the Stable Diffusion components once and builds every pipeline
+    from them.
+
+    The text encoder, tokenizer and VAE come from ``model_name`` and are
+    shared by all pipelines; the inpainting checkpoint is fine-tuned from
+    the same base and only brings its own (9-channel) UNet. txt2img and
+    img2img run on the base UNet, inpaint on ``inpaint_model_name``'s.
+    Pipelines are thin wrappers, built on first use.
+
+    Memory on ``device`` is tracked per component. With a ``memory_budget_mb``
+    (0 = unlimited), loading a UNet first evicts the least recently used
+    other UNets until everything fits: ``offload`` moves them to CPU memory
+    (cheap to bring back, GPU only), ``unload`` frees them. The shared
+    components always stay. Loads and evictions are logged and kept as
+    recent events for ``stats``.
+    """
+
+    def __init__(self, model_name: str, inpaint_model_name: str, device: str = "cpu",
+                 dtype: torch.dtype = torch.float32, memory_budget_mb: float = 0, eviction: str = "offload"):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{eviction}' (expected one of {', '.join(EVICTION_POLICIES)})")
+        self.model_names = {"base": model_name, "inpaint": inpaint_model_name}
+        self.device = device
+        self.dtype = dtype
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        # Offloading to CPU frees nothing when the device is the CPU
+        self.eviction = eviction if device != "cpu" else "unload"
+        self._shared: Optional[dict] = None
+        self._scheduler_config: Optional[dict] = None
+        self._unets: Dict[str, UNet2DConditionModel] = {}
+        # UNets resident on the device, least recently used first
+        self._resident: "collections.OrderedDict[str, None]" = collections.OrderedDict()
+        self._pipelines: Dict[str, diffusers.DiffusionPipeline] = {}
+        # Scheduler each built pipeline currently has
+        self._schedulers: Dict[str, str] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.events = collections.deque(maxlen=50)
+        self.counters = {"loads": 0, "evictions": 0, "restores": 0}
+
+    def _event(self, event: str, component: str, started: float):
+        entry = {
+            "time": time.time(),
+            "event": event,
+            "component": component,
+            "mb": round(self._sizes.get(component, 0) / 2 ** 20, 1),
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        self.events.append(entry)
+        logger.info(f"Pipeline manager: {event} {component} ({entry['mb']} MB, {entry['ms']} ms)")
+
+    def _load_shared(self) -> dict:
+        if self._shared is None:
+            model_name = self.model_names["base"]
+            shared = {}
+            for name, loader in (("text_encoder", CLIPTextModel), ("vae", AutoencoderKL)):
+                started = time.perf_counter()
+                module = loader.from_pretrained(model_name, subfolder=name, torch_dtype=self.dtype).to(self.device)
+                module.requires_grad_(False)
+                shared[name] = module
+                self._sizes[name] = module_bytes(module)
+                self.counters["loads"] += 1
+                self._event("load", name, started)
+            shared["tokenizer"] = CLIPTokenizer.from_pretrained(model_name, subfolder="tokenizer")
+            # Any scheduler class reads the config; "_class_name" names the model's own
+            self._scheduler_config = diffusers.PNDMScheduler.load_config(model_name, subfolder="scheduler")
+            self._shared = shared
+        return self._shared
+
+    def _resident_bytes(self) -> int:
+        shared = sum(self._sizes.get(name, 0) for name in ("text_encoder", "vae") if self._shared)
+        return shared + sum(self._sizes[f"unet:{key}"] for key in self._resident)
+
+    def _evict(self, key: str):
+        component = f"unet:{key}"
+        started = time.perf_counter()
+        del self._resident[key]
+        if self.eviction == "offload":
+            self._unets[key].to("cpu")
+        else:
+            del self._unets[key]
+            for name, (_, unet_key) in PIPELINES.items():
+                if unet_key == key:
+                    self._pipelines.pop(name, None)
+            gc.collect()
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+        self.counters["evictions"] += 1
+        self._event("offload" if self.eviction == "offload" else "unload", component, started)
+
+    def _make_room(self, keep: str, needed: int):
+        while self.memory_budget and self._resident:
+            if self._resident_bytes() + needed <= self.memory_budget:
+                return
+            victim = next((key for key in self._resident if key != keep), None)
+            if victim is None:
+                break
+            self._evict(victim)
+        if self.memory_budget and self._resident_bytes() + needed > self.memory_budget:
+            logger.warning(
+                f"Pipeline manager: {self._resident_bytes() + needed >> 20} MB needed exceeds the "
+                f"{self.memory_budget >> 20} MB budget with nothing left to evict"
+            )
+
+    def _unet(self, key: str) -> UNet2DConditionModel:
+        component = f"unet:{key}"
+        if key in self._resident:
+            self._resident.move_to_end(key)
+            return self._unets[key]
+        if key in self._unets:
+            # Offloaded earlier: bring it back
+            self._make_room(key, self._sizes[component])
+            started = time.perf_counter()
+            self._unets[key].to(self.device)
+            self.counters["restores"] += 1
+            event = "restore"
+        else:
+            # Free room first if this UNet's size is known from an earlier load
+            self._make_room(key, self._sizes.get(component, 0))
+            started = time.perf_counter()
+            unet = UNet2DConditionModel.from_pretrained(
+                self.model_names[key], subfolder="unet", torch_dtype=self.dtype
+            )
+            unet.requires_grad_(False)
+            self._sizes[component] = module_bytes(unet)
+            self._make_room(key, self._sizes[component])
+            self._unets[key] = unet.to(self.device)
+            self.counters["loads"] += 1
+            event = "load"
+        self._resident[key] = None
+        self._event(event, component, started)
+        return self._unets[key]
+
+    def get(self, name: str, scheduler: str = "default") -> diffusers.DiffusionPipeline:
+        """
+        The ``name`` pipeline ("txt2img", "img2img" or "inpaint"), with its
+        UNet on the device and ``scheduler`` (a ``sampling.SCHEDULERS`` name).
+        """
+        pipeline_class, unet_key = PIPELINES[name]
+        with self._lock:
+            shared = self._load_shared()
+            unet = self._unet(unet_key)
+            pipeline = self._pipelines.get(name)
+            if pipeline is None:
+                pipeline = pipeline_class(
+                    vae=shared["vae"],
+                    text_encoder=shared["text_encoder"],
+                    tokenizer=shared["tokenizer"],
+                    unet=unet,
+                    # Schedulers keep per-run state, so every pipeline gets its own
+                    scheduler=make_scheduler(scheduler, self._scheduler_config),
+                    safety_checker=None,
+                    feature_extractor=None,
+                    requires_safety_checker=False
+                )
+                if self.device == "cuda":
+                    pipeline.enable_attention_slicing()
+                self._pipelines[name] = pipeline
+                self._schedulers[name] = scheduler
+                logger.info(f"Pipeline manager: built {name} pipeline")
+            elif self._schedulers.get(name) != scheduler:
+                pipeline.scheduler = make_scheduler(scheduler, self._scheduler_config)
+                self._schedulers[name] = scheduler
+            return pipeline
+
+    def stats(self) -> dict:
+        with self._lock:
+            components = {}
+            for component, size in self._sizes.items():
+                if component.startswith("unet:"):
+                    key = component[len("unet:"):]
+                    location = self.device if key in self._resident else ("cpu" if key in self._unets else "unloaded")
+                else:
+                    location = self.device
+                components[component] = {"mb": round(size / 2 ** 20, 1), "device": location}
+            return {
+                "device": self.device,
+                "dtype": str(self.dtype).replace("torch.", ""),
+                "memory_budget_mb": self.memory_budget >> 20,
+                "eviction": self.eviction,
+                "resident_mb": round(self._resident_bytes() / 2 ** 20, 1),
+                "components": components,
+                "pipelines": {name: self._schedulers[name] for name in sorted(self._pipelines)},
+                **self.counters,
+                "recent_events": list(self.events)[-10:],
+            }
@@ -0,0 +1,82 @@
+import base64
+import io
+from typing import Optional, Tuple
+
+import diffusers
+import torch
+from PIL import Image
+
+# Scheduler name -> (class, config overrides); "default" is the model's own (PNDM for SD 1.5)
+SCHEDULERS = {
+    "default": (None, {}),
+    "dpmpp": (diffusers.DPMSolverMultistepScheduler, {"algorithm_type": "dpmsolver++", "use_karras_sigmas": True}),
+    "euler-a": (diffusers.EulerAncestralDiscreteScheduler, {}),
+    "euler": (diffusers.EulerDiscreteScheduler, {}),
+    "unipc": (diffusers.UniPCMultistepScheduler, {}),
+    "ddim": (diffusers.DDIMScheduler, {}),
+}
+
+# Quality preset -> (scheduler, steps). img2img runs ``strength`` of the steps.
+PRESETS = {
+    "preview": ("dpmpp", 8),
+    "fast": ("dpmpp", 15),
+    "final": ("dpmpp", 25),
+}
+
+# Linear map from SD 1.x latent channels to RGB: a preview without running the VAE decoder
+LATENT_RGB_FACTORS = torch.tensor([
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+])
+
+
+def make_scheduler(name: str, config: dict):
+    """A fresh ``name`` scheduler for a model whose scheduler config is ``config``."""
+    scheduler_class, overrides = SCHEDULERS[name]
+    if scheduler_class is None:
+        scheduler_class = getattr(diffusers, config["_class_name"])
+    return scheduler_class.from_config(config, **overrides)
+
+
+def resolve_sampling(preset: Optional[str], scheduler: Optional[str], num_inference_steps: int) -> Tuple[str, int]:
+    """
+    Scheduler and step count for a request. A preset sets both; an explicit
+    ``scheduler`` overrides the preset's. Without a preset the request's
+    ``num_inference_steps`` is used.
+    """
+    if preset is not None:
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown preset '{preset}' (expected one of {', '.join(PRESETS)})")
+        preset_scheduler, num_inference_steps = PRESETS[preset]
+        scheduler = scheduler or preset_scheduler
+    scheduler = scheduler or "default"
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler '{scheduler}' (expected one of {', '.join(SCHEDULERS)})")
+    if num_inference_steps < 1:
+        raise ValueError("num_inference_steps must be at least 1")
+    return scheduler, num_inference_steps
+
+
+def latent_preview(latents: torch.Tensor, size: int = 128) -> Image.Image:
+    """
+    Approximate image of one item's latents (4 x h/8 x w/8), without running the VAE.
+
+    The result has the latent resolution (64x64 for 512x512) and is upscaled
+    so its longer side is ``size``.
+    """
+    rgb = latents.float().permute(1, 2, 0).cpu() @ LATENT_RGB_FACTORS
+    pixels = ((rgb + 1) / 2).clamp(0, 1).mul(255).to(torch.uint8).numpy()
+    image = Image.fromarray(pixels)
+    scale = size / max(image.size)
+    if scale > 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.BILINEAR)
+    return image
+
+
+def preview_jpeg(image: Image.Image, quality: int = 70) -> str:
+    """Base64 JPEG for event payloads."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
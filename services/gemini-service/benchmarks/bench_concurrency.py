@@ -0,0 +1,132 @@
+"""
+Load test for the Gemini endpoints against a local stub model.
+
+    python benchmarks/bench_concurrency.py --requests 64 --latency 0.5 --limits 1 8 32
+
+Replaces ``genai.GenerativeModel`` with a stub whose synchronous
+``generate_content`` sleeps for ``--latency`` seconds (like the real SDK,
+it blocks the calling thread) and fails with a 429 for ``--error-rate`` of
+calls. It then fires ``--requests`` concurrent /recommend requests with
+distinct prompts (so the response cache never hits) and reports throughput
+and latency percentiles, first for the old inline call, which blocks the
+event loop, and then through ``GeminiClient`` at each concurrency limit.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "stub")
+
+import google.generativeai as genai  # noqa: E402
+
+STUB_TEXT = (
+    "1. **Outfit Description**: A relaxed weekend look\n"
+    "2. **Items**:\n- White linen shirt\n- Navy chinos\n- Suede loafers\n"
+    "3. **Reasoning**: Breathable fabrics for warm weather\n"
+    "4. **Style Tips**: Roll the sleeves once"
+)
+
+
+class QuotaExceeded(Exception):
+    code = 429
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubModel:
+    latency = 0.5
+    error_rate = 0.0
+
+    def __init__(self, model_name: str, **kwargs):
+        self.model_name = model_name
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.latency)
+            if random.random() < self.error_rate:
+                raise QuotaExceeded("429 Resource has been exhausted")
+            return StubResponse(STUB_TEXT)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+genai.GenerativeModel = StubModel
+
+import main  # noqa: E402
+from gemini_client import GeminiClient  # noqa: E402
+
+
+async def blocking_generate(prompt, **kwargs):
+    """The pre-GeminiClient behaviour: the SDK call runs on the event loop."""
+    return main.model.generate_content(prompt, **kwargs)
+
+
+async def load(requests: int, run: str) -> dict:
+    latencies, failures = [], 0
+
+    async def one(client: httpx.AsyncClient, i: int):
+        nonlocal failures
+        start = time.perf_counter()
+        response = await client.post("/recommend", json={"prompt": f"weekend outfit #{i} ({run})"})
+        latencies.append(time.perf_counter() - start)
+        failures += response.status_code != 200
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return {
+        "rps": requests / elapsed,
+        "p50": np.percentile(latencies, 50),
+        "p95": np.percentile(latencies, 95),
+        "failures": failures,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub generation time in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="fraction of stub calls failing with 429")
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    random.seed(0)
+    StubModel.latency = args.latency
+    StubModel.error_rate = args.error_rate
+    print(f"{args.requests} concurrent /recommend requests, stub latency {args.latency:g}s, "
+          f"{args.error_rate:.0%} quota errors")
+    print(f"{'mode':<22}{'req/s':>8}{'p50 s':>8}{'p95 s':>8}{'peak upstream':>15}{'retries':>9}{'failed':>8}")
+
+    runs = [("inline (blocking)", None)] + [(f"client, limit {limit}", limit) for limit in args.limits]
+    for label, limit in runs:
+        main.model = StubModel(main.MODEL_NAME)
+        main.gemini = GeminiClient(main.model, max_concurrency=limit or 1, backoff_base_s=0.05)
+        if limit is None:
+            main.gemini.generate = blocking_generate
+        result = asyncio.run(load(args.requests, label))
+        print(f"{label:<22}{result['rps']:>8.1f}{result['p50']:>8.2f}{result['p95']:>8.2f}"
+              f"{main.model.peak:>15}{main.gemini.counters['retries']:>9}{result['failures']:>8}")
+        main.gemini.close()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,118 @@
+"""
+Wardrobe context for recommendation prompts: first-20 truncation vs.
+relevance-ranked, token-budgeted selection.
+
+    python benchmarks/bench_context.py --items 300 --budget 300
+    python benchmarks/bench_context.py --clip-url http://localhost:8001
+
+Builds a synthetic wardrobe and a set of requests that ask for a colour and
+a style. For each request it reports the estimated prompt tokens spent on
+items, the number of item lines and how many of them match the request (precision), how
+many of the wardrobe's matching items made it in (recall; merged "(xN)"
+lines count N times), and the share of categories represented. Uses the
+offline fake embedder unless --clip-url points at a running clip-service.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_selection import (  # noqa: E402
+    ClipTextEmbedder, ContextSelector, FakeTextEmbedder, estimate_tokens, item_line,
+)
+
+CATEGORIES = ["top", "bottom", "dress", "outerwear", "shoes", "accessory"]
+COLORS = ["black", "white", "navy", "red", "beige", "green", "grey", "brown"]
+STYLES = ["casual", "formal", "sporty", "bohemian", "minimalist"]
+DESCRIPTIONS = {
+    "top": ["linen shirt", "crew neck tee", "silk blouse", "cable knit sweater"],
+    "bottom": ["slim chinos", "wide leg trousers", "denim jeans", "pleated skirt"],
+    "dress": ["wrap dress", "slip dress", "shirt dress"],
+    "outerwear": ["trench coat", "denim jacket", "wool blazer", "puffer jacket"],
+    "shoes": ["leather loafers", "white sneakers", "ankle boots", "strappy sandals"],
+    "accessory": ["leather belt", "silk scarf", "gold hoops", "canvas tote"],
+}
+
+
+def wardrobe(rng, count: int):
+    items = []
+    for i in range(count):
+        category = CATEGORIES[rng.integers(len(CATEGORIES))]
+        items.append({
+            "item_id": f"item_{i}",
+            "category": category,
+            "color": COLORS[rng.integers(len(COLORS))],
+            "style": STYLES[rng.integers(len(STYLES))],
+            "description": DESCRIPTIONS[category][rng.integers(len(DESCRIPTIONS[category]))],
+        })
+    return items
+
+
+def legacy_lines(items):
+    """What build_recommendation_prompt used to send: the first 20 items."""
+    return [
+        f"- {item.get('category', 'Item')}: {item.get('color', 'unknown color')}, "
+        f"{item.get('style', 'unknown style')}"
+        for item in items[:20]
+    ]
+
+
+def score(lines, items, color: str, style: str) -> dict:
+    listed = [line for line in lines if f": {color}, {style}" in line]
+    listed_count = sum(int(line.rsplit("(x", 1)[1].rstrip(")")) if line.endswith(")") and "(x" in line else 1
+                       for line in listed)
+    relevant = [item for item in items if item["color"] == color and item["style"] == style]
+    covered = {category for category in CATEGORIES if any(line.startswith(f"- {category}:") for line in lines)}
+    return {
+        "lines": len(lines),
+        "tokens": sum(estimate_tokens(line) + 1 for line in lines),
+        "precision": len(listed) / len(lines) if lines else 0.0,
+        "recall": listed_count / len(relevant) if relevant else 1.0,
+        "coverage": len(covered & {item["category"] for item in items}) / len({item["category"] for item in items}),
+    }
+
+
+async def run(args):
+    rng = np.random.default_rng(0)
+    items = wardrobe(rng, args.items)
+    embedder = ClipTextEmbedder(args.clip_url) if args.clip_url else FakeTextEmbedder()
+    selector = ContextSelector(embedder, args.budget)
+    results = {"first 20": [], "selected": []}
+    for _ in range(args.requests):
+        color = COLORS[rng.integers(len(COLORS))]
+        style = STYLES[rng.integers(len(STYLES))]
+        query = f"Something {style} for the weekend, ideally in {color}"
+        order = rng.permutation(len(items))
+        shuffled = [items[i] for i in order]
+        results["first 20"].append(score(legacy_lines(shuffled), shuffled, color, style))
+        lines, _ = await selector.select(query, shuffled)
+        results["selected"].append(score(lines, shuffled, color, style))
+    await embedder.close()
+
+    print(f"{args.items} items, {args.requests} requests, budget {args.budget} tokens, "
+          f"{'clip-service' if args.clip_url else 'fake'} embeddings")
+    print(f"{'context':<12}{'lines':>7}{'tokens':>8}{'precision':>11}{'recall':>8}{'coverage':>10}")
+    for name, rows in results.items():
+        mean = {key: np.mean([row[key] for row in rows]) for key in rows[0]}
+        print(f"{name:<12}{mean['lines']:>7.1f}{mean['tokens']:>8.0f}{mean['precision']:>11.2f}{mean['recall']:>8.2f}{mean['coverage']:>10.2f}")
+    print("(the legacy line omits descriptions; the selected lines include them)")
+    example = [item_line(item) for item in items[:3]]
+    print("example lines:", *example, sep="\n  ")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=300)
+    parser.add_argument("--clip-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,174 @@
+import collections
+import hashlib
+import logging
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough size of a prompt token in characters (English text, Gemini tokenizer)
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def item_text(item: dict) -> str:
+    """What an item is, as CLIP text: "black casual top, linen shirt with rolled sleeves"."""
+    words = [item.get(field) for field in ("color", "style", "category")]
+    text = " ".join(word for word in words if word) or "clothing item"
+    if item.get("description"):
+        text += f", {item['description']}"
+    return text
+
+
+def item_line(item: dict, max_description_chars: int = 60) -> str:
+    """Compact prompt encoding of an item: "- top: black, casual (linen shirt)"."""
+    line = (f"- {item.get('category', 'Item')}: {item.get('color', 'unknown color')}, "
+            f"{item.get('style', 'unknown style')}")
+    description = (item.get("description") or "").strip()
+    if description:
+        if len(description) > max_description_chars:
+            description = description[:max_description_chars - 3].rstrip() + "..."
+        line += f" ({description})"
+    return line
+
+
+class ClipTextEmbedder:
+    """
+    CLIP text embeddings from clip-service's ``/embed/text``, so requests and
+    wardrobe items are compared in the same space the wardrobe is searched
+    in. Item texts repeat across requests, so vectors are kept in an LRU and
+    only unseen texts are sent.
+    """
+
+    def __init__(self, base_url: str, timeout_s: float = 5.0, cache_size: int = 10000, batch_size: int = 256):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout_s
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: "collections.OrderedDict[str, np.ndarray]" = collections.OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        missing = list(dict.fromkeys(text for text in texts if text not in self._cache))
+        if missing:
+            if self._client is None:
+                self._client = httpx.AsyncClient(timeout=self.timeout)
+            fetched = {}
+            for start in range(0, len(missing), self.batch_size):
+                batch = missing[start:start + self.batch_size]
+                response = await self._client.post(f"{self.base_url}/embed/text", json={"texts": batch})
+                response.raise_for_status()
+                for text, vector in zip(batch, response.json()["embeddings"]):
+                    fetched[text] = np.asarray(vector, dtype=np.float32)
+            self._cache.update(fetched)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            fetched = {}
+        vectors = []
+        for text in texts:
+            vector = fetched.get(text)
+            if vector is None:
+                vector = self._cache[text]
+                self._cache.move_to_end(text)
+            vectors.append(vector)
+        return np.stack(vectors)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FakeTextEmbedder:
+    """
+    Offline stand-in for ``ClipTextEmbedder``: hashed bag-of-words vectors,
+    so texts sharing words score higher. Deterministic, no network, no model.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"[a-z0-9]+", text.lower()):
+                bucket = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest(), "little")
+                vectors[row, bucket % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    async def close(self):
+        pass
+
+
+class ContextSelector:
+    """
+    Picks the wardrobe items worth spending prompt tokens on.
+
+    Items are ranked by cosine similarity between their CLIP text embedding
+    and the request (prompt, occasion, weather, style and colour). The best
+    item of every category goes in first, so the model can always build a
+    complete outfit, then the rest by score, each as one compact line, until
+    ``token_budget`` is spent. Identical lines are merged ("(x3)"). If the
+    embedder is unreachable the items keep their original order and still
+    get category coverage and the budget.
+    """
+
+    def __init__(self, embedder, token_budget: int = 300):
+        self.embedder = embedder
+        self.token_budget = token_budget
+        self.stats = {"requests": 0, "items_in": 0, "items_out": 0, "tokens": 0, "embed_failures": 0}
+
+    async def rank(self, query: str, items: List[dict]) -> np.ndarray:
+        """Relevance of every item to ``query`` (0 for all when embedding fails)."""
+        try:
+            vectors = await self.embedder.embed([query] + [item_text(item) for item in items])
+        except Exception as e:
+            self.stats["embed_failures"] += 1
+            logger.warning(f"Embedding wardrobe context failed, keeping request order: {e}")
+            return np.zeros(len(items), dtype=np.float32)
+        return vectors[1:] @ vectors[0]
+
+    async def select(self, query: str, items: List[dict]) -> Tuple[List[str], Dict[str, int]]:
+        """Returns the prompt lines for the chosen items, best first, and selection stats."""
+        scores = await self.rank(query, items)
+        # Stable sort: equal scores (or no embeddings) keep the request order
+        order = sorted(range(len(items)), key=lambda i: -scores[i])
+        seen_categories = set()
+        coverage, rest = [], []
+        for i in order:
+            category = (items[i].get("category") or "item").lower()
+            (rest if category in seen_categories else coverage).append(i)
+            seen_categories.add(category)
+
+        lines: "collections.OrderedDict[str, int]" = collections.OrderedDict()
+        tokens = 0
+        selected = 0
+        for i in coverage + rest:
+            line = item_line(items[i])
+            if line in lines:
+                if lines[line] == 1:
+                    tokens += estimate_tokens(" (x2)")
+                lines[line] += 1
+                selected += 1
+                continue
+            cost = estimate_tokens(line) + 1
+            if tokens + cost > self.token_budget:
+                continue  # a shorter line further down may still fit
+            lines[line] = 1
+            tokens += cost
+            selected += 1
+
+        self.stats["requests"] += 1
+        self.stats["items_in"] += len(items)
+        self.stats["items_out"] += selected
+        self.stats["tokens"] += tokens
+        encoded = [line if count == 1 else f"{line} (x{count})" for line, count in lines.items()]
+        return encoded, {"items": len(items), "selected": selected, "tokens": tokens}
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth retrying: quota/rate limits and server-side errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def error_status(e: Exception) -> Optional[int]:
+    """HTTP status of an upstream error (google.api_core errors carry it as ``code``)."""
+    for attribute in ("code", "status_code"):
+        status = getattr(e, attribute, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+class GeminiClient:
+    """
+    Non-blocking access to a ``genai.GenerativeModel``.
+
+    The SDK's ``generate_content`` is synchronous, so it runs on a dedicated
+    thread pool and the event loop keeps serving other requests meanwhile.
+    At most ``max_concurrency`` calls are upstream at once (the rest wait on
+    a semaphore), each attempt gets ``timeout_s``, and quota / 5xx errors and
+    timeouts are retried up to ``max_retries`` times with full-jitter
+    exponential backoff. A timed-out attempt cannot be interrupted: its
+    thread finishes in the background, so the pool has one spare thread per
+    slot for those.
+
+    ``stream`` yields text chunks as they arrive; there the deadline applies
+    to each wait for the next chunk, and retries only happen before the
+    first chunk has been yielded.
+    """
+
+    def __init__(self, model, max_concurrency: int = 8, timeout_s: float = 30.0, max_retries: int = 3,
+                 backoff_base_s: float = 0.5, backoff_max_s: float = 8.0):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout_s
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base_s
+        self.backoff_max = backoff_max_s
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_concurrency * 2, thread_name_prefix="gemini")
+        self.in_flight = 0
+        self.counters = {"calls": 0, "succeeded": 0, "failures": 0, "attempts": 0, "retries": 0, "timeouts": 0}
+        self._latency_total = 0.0
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max, base * 2^attempt)]."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _attempt(self, prompt, kwargs):
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            self.in_flight += 1
+            self.counters["attempts"] += 1
+            try:
+                call = loop.run_in_executor(self._executor, lambda: self.model.generate_content(prompt, **kwargs))
+                return await asyncio.wait_for(call, self.timeout)
+            finally:
+                self.in_flight -= 1
+
+    async def _stream_attempt(self, prompt, kwargs) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        abandoned = threading.Event()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                abandoned.set()  # event loop already closed
+
+        def produce():
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True, **kwargs):
+                    if abandoned.is_set():
+                        return
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue  # chunk without text parts (e.g. only safety ratings)
+                    if text:
+                        put(text)
+                put(finished)
+            except Exception as e:
+                put(e)
+
+        async with self._semaphore:
+            self.in_flight += 1
+            self.counters["attempts"] += 1
+            try:
+                loop.run_in_executor(self._executor, produce)
+                while True:
+                    item = await asyncio.wait_for(queue.get(), self.timeout)
+                    if item is finished:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                # Stops the producer at its next chunk if the consumer went away
+                abandoned.set()
+                self.in_flight -= 1
+
+    async def _failed(self, attempt: int, error: Exception, retryable: bool):
+        """Back off before the next attempt, or raise if ``error`` is final."""
+        if isinstance(error, asyncio.TimeoutError):
+            self.counters["timeouts"] += 1
+            status, error = 504, f"Gemini did not answer within {self.timeout:g}s"
+        else:
+            status = error_status(error)
+            if status not in RETRYABLE_STATUS:
+                self.counters["failures"] += 1
+                raise error
+        if not retryable or attempt >= self.max_retries:
+            self.counters["failures"] += 1
+            logger.warning(f"Gemini call failed after {attempt + 1} attempts: {error}")
+            raise HTTPException(status_code=status, detail=f"Gemini unavailable: {error}")
+        delay = self.backoff(attempt)
+        self.counters["retries"] += 1
+        logger.info(f"Retrying Gemini call in {delay:.2f}s (attempt {attempt + 2}, status {status})")
+        await asyncio.sleep(delay)
+
+    async def generate(self, prompt, **kwargs):
+        """``model.generate_content(prompt, **kwargs)`` with concurrency limit, deadline and retries."""
+        self.counters["calls"] += 1
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = await self._attempt(prompt, kwargs)
+                self.counters["succeeded"] += 1
+                self._latency_total += time.perf_counter() - start
+                return response
+            except Exception as e:
+                await self._failed(attempt, e, retryable=True)
+            attempt += 1
+
+    async def stream(self, prompt, **kwargs) -> AsyncIterator[str]:
+        """Stream the generated text chunk by chunk (``generate_content(..., stream=True)``)."""
+        self.counters["calls"] += 1
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            emitted = False
+            try:
+                async for text in self._stream_attempt(prompt, kwargs):
+                    emitted = True
+                    yield text
+                self.counters["succeeded"] += 1
+                self._latency_total += time.perf_counter() - start
+                return
+            except Exception as e:
+                # Part of the answer is already with the client: no retry
+                await self._failed(attempt, e, retryable=not emitted)
+            attempt += 1
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        succeeded = self.counters["succeeded"]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "timeout_s": self.timeout,
+            "in_flight": self.in_flight,
+            **self.counters,
+            "avg_latency_ms": round(self._latency_total * 1000 / succeeded, 1) if succeeded else 0.0,
+        }
@@ -1,12 +1,19 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 import google.generativeai as genai
 import os
+import json
+import time
 import logging
+from response_cache import ResponseCache, items_key, prompt_key
+from gemini_client import GeminiClient
+from recommendation_parser import RecommendationParser, parse_recommendation
+from context_selection import ClipTextEmbedder, ContextSelector, FakeTextEmbedder
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -49,7 +56,36 @@ else:
     genai.configure(api_key=GEMINI_API_KEY)
 
 # Initialize model
-model = genai.GenerativeModel('gemini-2.5-flash')
+MODEL_NAME = 'gemini-2.5-flash'
+model = genai.GenerativeModel(MODEL_NAME)
+
+# Upstream calls run off the event loop with a concurrency limit, a deadline
+# per attempt and jittered exponential backoff on quota / 5xx errors
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+BACKOFF_BASE_SECONDS = float(os.getenv("GEMINI_BACKOFF_BASE_SECONDS", "0.5"))
+gemini = GeminiClient(model, MAX_CONCURRENCY, TIMEOUT_SECONDS, MAX_RETRIES, BACKOFF_BASE_SECONDS)
+
+# Response caches
+# Identical requests build identical prompts; repeats within the TTL are
+# served from memory and concurrent duplicates share one upstream call.
+CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "512"))
+CACHE_TTL_SECONDS = float(os.getenv("GEMINI_CACHE_TTL_SECONDS", "900"))
+recommendation_cache = ResponseCache(CACHE_SIZE, CACHE_TTL_SECONDS)
+analysis_cache = ResponseCache(CACHE_SIZE, CACHE_TTL_SECONDS)
+
+# Wardrobe context selection
+# Items are ranked against the request with CLIP text embeddings from
+# clip-service ("fake" = offline hashed bag-of-words) and packed into a
+# token budget, instead of sending the first 20 items.
+CLIP_SERVICE_URL = os.getenv("CLIP_SERVICE_URL", "http://localhost:8001")
+CONTEXT_EMBEDDER = os.getenv("GEMINI_CONTEXT_EMBEDDER", "clip")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("GEMINI_CONTEXT_TOKEN_BUDGET", "300"))
+context_selector = ContextSelector(
+    FakeTextEmbedder() if CONTEXT_EMBEDDER == "fake" else ClipTextEmbedder(CLIP_SERVICE_URL),
+    CONTEXT_TOKEN_BUDGET
+)
 
 class OutfitRequest(BaseModel):
     prompt: str
@@ -69,8 +105,21 @@ class ChatRequest(BaseModel):
     message: str
     context: Optional[str] = None
 
-def build_recommendation_prompt(request: OutfitRequest) -> str:
-    """Build a detailed prompt for Gemini based on user request."""
+def context_query(request: OutfitRequest) -> str:
+    """Everything in the request that says what the outfit should be."""
+    parts = [request.prompt, request.occasion, request.weather, request.style_preference, request.color_preference]
+    return " ".join(part for part in parts if part)
+
+async def select_wardrobe_context(request: OutfitRequest) -> Optional[List[str]]:
+    """Prompt lines for the most relevant wardrobe items that fit the token budget."""
+    if not request.available_items:
+        return None
+    lines, stats = await context_selector.select(context_query(request), request.available_items)
+    logger.info(f"Wardrobe context: {stats['selected']}/{stats['items']} items, ~{stats['tokens']} tokens")
+    return lines
+
+def build_recommendation_prompt(request: OutfitRequest, item_lines: Optional[List[str]] = None) -> str:
+    """Build a detailed prompt for Gemini based on user request and the selected wardrobe lines."""
     prompt_parts = [
         "You are an expert fashion stylist and outfit recommender.",
         f"\nUser Request: {request.prompt}"
@@ -88,14 +137,9 @@ def build_recommendation_prompt(request: OutfitRequest) -> str:
     if request.color_preference:
         prompt_parts.append(f"\nColor Preference: {request.color_preference}")
     
-    if request.available_items:
-        prompt_parts.append(f"\nAvailable Items in Wardrobe: {len(request.available_items)} items")
-        items_desc = "\n".join([
-            f"- {item.get('category', 'Item')}: {item.get('color', 'unknown color')}, "
-            f"{item.get('style', 'unknown style')}"
-            for item in request.available_items[:20]  # Limit to avoid token overflow
-        ])
-        prompt_parts.append(f"\n{items_desc}")
+    if request.available_items and item_lines:
+        prompt_parts.append(f"\nAvailable Items in Wardrobe: {len(request.available_items)} items (most relevant listed)")
+        prompt_parts.append("\n" + "\n".join(item_lines))
     
     prompt_parts.append(
         "\n\nPlease suggest a complete outfit with the following structure:"
@@ -108,13 +152,44 @@ def build_recommendation_prompt(request: OutfitRequest) -> str:
     
     return "".join(prompt_parts)
 
+def build_chat_prompt(request: ChatRequest) -> str:
+    """Build the chat prompt: system context, optional context, user message."""
+    system_context = (
+        "You are a helpful fashion assistant. Provide friendly, "
+        "practical fashion advice and outfit suggestions."
+    )
+    
+    full_prompt = f"{system_context}\n\n"
+    if request.context:
+        full_prompt += f"Context: {request.context}\n\n"
+    full_prompt += f"User: {request.message}\n\nAssistant:"
+    return full_prompt
+
+async def generate_text(prompt: str, failure_detail: str) -> str:
+    """Run one Gemini generation; an empty answer is an error (and never cached)."""
+    response = await gemini.generate(prompt)
+    if not response or not response.text:
+        raise HTTPException(status_code=500, detail=failure_detail)
+    return response.text
+
 @app.get("/")
 async def root():
     return {
         "service": "Gemini Outfit Recommendation Service",
-        "status": "active" if GEMINI_API_KEY else "API key not configured"
+        "status": "active" if GEMINI_API_KEY else "API key not configured",
+        "upstream": gemini.stats(),
+        "context": context_selector.stats,
+        "cache": {
+            "recommend": recommendation_cache.stats(),
+            "analyze_outfit": analysis_cache.stats()
+        }
     }
 
+@app.on_event("shutdown")
+async def close_client():
+    gemini.close()
+    await context_selector.embedder.close()
+
 @app.post("/recommend", response_model=dict)
 async def recommend_outfit(request: OutfitRequest):
     """Generate outfit recommendations using Gemini AI."""
@@ -126,60 +201,20 @@ async def recommend_outfit(request: OutfitRequest):
             )
         
         # Build prompt
-        prompt = build_recommendation_prompt(request)
+        prompt = build_recommendation_prompt(request, await select_wardrobe_context(request))
         logger.info(f"Generating recommendation for: {request.prompt}")
         
-        # Generate response
-        response = model.generate_content(prompt)
-        
-        if not response or not response.text:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to generate recommendation"
-            )
-        
-        # Parse response
-        recommendation_text = response.text
-        
-        # Extract structured data (simplified parsing)
-        # In production, you might want more sophisticated parsing
-        sections = {
-            "outfit_description": "",
-            "items": [],
-            "reasoning": "",
-            "style_tips": ""
-        }
-        
-        # Simple section extraction
-        current_section = None
-        for line in recommendation_text.split('\n'):
-            line = line.strip()
-            if '**Outfit Description' in line or 'Outfit Description:' in line:
-                current_section = 'outfit_description'
-            elif '**Items' in line or 'Items:' in line:
-                current_section = 'items'
-            elif '**Reasoning' in line or 'Reasoning:' in line:
-                current_section = 'reasoning'
-            elif '**Style Tips' in line or 'Style Tips:' in line:
-                current_section = 'style_tips'
-            elif line and current_section:
-                if current_section == 'items' and (line.startswith('-') or line.startswith('•')):
-                    item_text = line.lstrip('-•').strip()
-                    sections['items'].append({"description": item_text})
-                elif current_section != 'items':
-                    sections[current_section] += line + " "
+        # Generate response (or reuse a cached / in-flight one for the same prompt)
+        recommendation_text, cached = await recommendation_cache.get_or_generate(
+            prompt_key(MODEL_NAME, prompt),
+            lambda: generate_text(prompt, "Failed to generate recommendation")
+        )
         
         return {
             "success": True,
-            "recommendation": {
-                "outfit_description": sections['outfit_description'].strip(),
-                "items": sections['items'] if sections['items'] else [
-                    {"description": "See full recommendation below"}
-                ],
-                "reasoning": sections['reasoning'].strip(),
-                "style_tips": sections['style_tips'].strip()
-            },
-            "full_text": recommendation_text
+            "recommendation": parse_recommendation(recommendation_text),
+            "full_text": recommendation_text,
+            "cached": cached
         }
         
     except Exception as e:
@@ -196,19 +231,8 @@ async def chat(request: ChatRequest):
                 detail="Gemini API key not configured"
             )
         
-        # Build chat prompt
-        system_context = (
-            "You are a helpful fashion assistant. Provide friendly, "
-            "practical fashion advice and outfit suggestions."
-        )
-        
-        full_prompt = f"{system_context}\n\n"
-        if request.context:
-            full_prompt += f"Context: {request.context}\n\n"
-        full_prompt += f"User: {request.message}\n\nAssistant:"
-        
         # Generate response
-        response = model.generate_content(full_prompt)
+        response = await gemini.generate(build_chat_prompt(request))
         
         return {
             "success": True,
@@ -219,6 +243,97 @@ async def chat(request: ChatRequest):
         logger.exception("Error in chat")
         raise handle_exception(e, "Failed to process chat request")
 
+# Streaming variants (Server-Sent Events)
+# Text is forwarded as "token" events as Gemini produces it; /recommend/stream
+# also emits a "section" event as soon as each section is complete, and both
+# end with "done" (the same payload as the non-streaming endpoint) or "error".
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def stream_errors(events: AsyncIterator[str], failure_detail: str) -> AsyncIterator[str]:
+    """Headers are already sent once streaming starts, so failures become an "error" event."""
+    try:
+        async for event in events:
+            yield event
+    except Exception as e:
+        logger.exception(failure_detail)
+        error = handle_exception(e, failure_detail)
+        yield sse_event("error", {"status_code": error.status_code, "detail": error.detail})
+
+async def replay(text: str) -> AsyncIterator[str]:
+    """A cached answer, as a one-chunk stream."""
+    yield text
+
+def require_api_key():
+    if not GEMINI_API_KEY:
+        raise HTTPException(
+            status_code=503,
+            detail="Gemini API key not configured"
+        )
+
+@app.post("/recommend/stream")
+async def recommend_outfit_stream(request: OutfitRequest):
+    """Stream an outfit recommendation as SSE: token, section and done events."""
+    require_api_key()
+    prompt = build_recommendation_prompt(request, await select_wardrobe_context(request))
+    key = prompt_key(MODEL_NAME, prompt)
+    logger.info(f"Streaming recommendation for: {request.prompt}")
+    
+    async def events() -> AsyncIterator[str]:
+        start = time.perf_counter()
+        cached_text = recommendation_cache.lookup(key)
+        chunks = replay(cached_text) if cached_text is not None else gemini.stream(prompt)
+        
+        parser = RecommendationParser()
+        parts = []
+        first_token_ms = None
+        async for chunk in chunks:
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - start) * 1000
+            parts.append(chunk)
+            yield sse_event("token", {"text": chunk})
+            for section, content in parser.feed(chunk):
+                yield sse_event("section", {"section": section, "content": content})
+        for section, content in parser.finish():
+            yield sse_event("section", {"section": section, "content": content})
+        
+        recommendation_text = "".join(parts)
+        if not recommendation_text:
+            raise HTTPException(status_code=500, detail="Failed to generate recommendation")
+        if cached_text is None:
+            recommendation_cache.put(key, recommendation_text)
+        yield sse_event("done", {
+            "success": True,
+            "recommendation": parser.recommendation(),
+            "full_text": recommendation_text,
+            "cached": cached_text is not None,
+            "first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None
+        })
+    
+    return sse_response(stream_errors(events(), "Failed to generate recommendation"))
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Stream a chat answer as SSE: token events, then done."""
+    require_api_key()
+    
+    async def events() -> AsyncIterator[str]:
+        parts = []
+        async for chunk in gemini.stream(build_chat_prompt(request)):
+            parts.append(chunk)
+            yield sse_event("token", {"text": chunk})
+        yield sse_event("done", {"success": True, "response": "".join(parts)})
+    
+    return sse_response(stream_errors(events(), "Failed to process chat request"))
+
 @app.post("/analyze-outfit", response_model=dict)
 async def analyze_outfit(items: List[dict]):
     """Analyze compatibility of selected outfit items."""
@@ -245,11 +360,16 @@ async def analyze_outfit(items: List[dict]):
             f"4. Overall assessment"
         )
         
-        response = model.generate_content(prompt)
+        # The same outfit in any order gets the same analysis
+        analysis, cached = await analysis_cache.get_or_generate(
+            prompt_key(MODEL_NAME, items_key(items)),
+            lambda: generate_text(prompt, "Failed to analyze outfit")
+        )
         
         return {
             "success": True,
-            "analysis": response.text
+            "analysis": analysis,
+            "cached": cached
         }
         
     except Exception as e:
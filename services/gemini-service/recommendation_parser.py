@@ -0,0 +1,89 @@
+from typing import List, Tuple
+
+# Section -> header markers, in the order the prompt asks for them
+SECTION_MARKERS = (
+    ("outfit_description", ("**Outfit Description", "Outfit Description:")),
+    ("items", ("**Items", "Items:")),
+    ("reasoning", ("**Reasoning", "Reasoning:")),
+    ("style_tips", ("**Style Tips", "Style Tips:")),
+)
+
+
+class RecommendationParser:
+    """
+    Incremental parser for the recommendation format requested by
+    ``build_recommendation_prompt`` (Outfit Description / Items / Reasoning /
+    Style Tips).
+
+    Feed it text in arbitrary chunks as it streams in; ``feed`` returns the
+    sections that were completed by that chunk (a section is complete once
+    the next header starts, or at ``finish``), so callers can emit each one
+    as soon as it is known. Feeding the whole text at once and calling
+    ``finish`` gives the same result as parsing it in one go.
+    """
+
+    def __init__(self):
+        self.sections = {"outfit_description": "", "items": [], "reasoning": "", "style_tips": ""}
+        self.current = None
+        self._buffer = ""
+        self._completed = set()
+
+    def _content(self, section: str):
+        value = self.sections[section]
+        return value.strip() if isinstance(value, str) else list(value)
+
+    def _complete_current(self, completed: List[Tuple[str, object]]):
+        if self.current is not None and self.current not in self._completed:
+            self._completed.add(self.current)
+            completed.append((self.current, self._content(self.current)))
+
+    def _line(self, line: str, completed: List[Tuple[str, object]]):
+        line = line.strip()
+        for section, markers in SECTION_MARKERS:
+            if any(marker in line for marker in markers):
+                if section != self.current:
+                    self._complete_current(completed)
+                self.current = section
+                return
+        if line and self.current:
+            if self.current == 'items':
+                if line.startswith('-') or line.startswith('•'):
+                    self.sections['items'].append({"description": line.lstrip('-•').strip()})
+            else:
+                self.sections[self.current] += line + " "
+
+    def feed(self, text: str) -> List[Tuple[str, object]]:
+        """Consume a chunk; returns ``(section, content)`` for sections it completed."""
+        completed = []
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            self._line(line, completed)
+        return completed
+
+    def finish(self) -> List[Tuple[str, object]]:
+        """Flush the last line; returns the sections completed by the end of the text."""
+        completed = []
+        if self._buffer:
+            self._line(self._buffer, completed)
+            self._buffer = ""
+        self._complete_current(completed)
+        return completed
+
+    def recommendation(self) -> dict:
+        return {
+            "outfit_description": self._content('outfit_description'),
+            "items": self.sections['items'] if self.sections['items'] else [
+                {"description": "See full recommendation below"}
+            ],
+            "reasoning": self._content('reasoning'),
+            "style_tips": self._content('style_tips')
+        }
+
+
+def parse_recommendation(text: str) -> dict:
+    """Extract the structured sections from a complete recommendation."""
+    parser = RecommendationParser()
+    parser.feed(text)
+    parser.finish()
+    return parser.recommendation()
@@ -0,0 +1,110 @@
+import asyncio
+import collections
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+def prompt_key(*parts: str) -> str:
+    """Cache key for a generation: SHA-256 over the model name, prompt, etc."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def items_key(items: List[dict]) -> str:
+    """Order-independent canonical form of an item list (same outfit, same key)."""
+    return json.dumps(sorted(json.dumps(item, sort_keys=True, default=str) for item in items))
+
+
+class ResponseCache:
+    """
+    Bounded TTL + LRU cache of generated text, with single-flight coalescing.
+
+    ``get_or_generate(key, generate)`` serves a fresh entry if there is one.
+    Otherwise the first caller starts ``generate`` and every concurrent caller
+    with the same key awaits that same call instead of starting its own.
+    Only successful results are stored; an error is raised to everyone who
+    waited for it and the next request tries again. The upstream call runs
+    as its own task, so a caller that goes away does not cancel it for the
+    others.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 900.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "collections.OrderedDict[Hashable, Tuple[float, str]]" = collections.OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def lookup(self, key: Hashable) -> Optional[str]:
+        """``get`` that counts towards the hit rate (for callers that generate on a miss themselves)."""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return value
+
+    def put(self, key: Hashable, value: str):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_generate(self, key: Hashable, generate: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """Returns ``(text, cached)``; ``cached`` is False only for the caller that ran ``generate``."""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        self.misses += 1
+        task = asyncio.ensure_future(generate())
+        self._inflight[key] = task
+
+        def finished(done: asyncio.Task):
+            self._inflight.pop(key, None)
+            if not done.cancelled() and done.exception() is None:
+                self.put(key, done.result())
+
+        task.add_done_callback(finished)
+        return await asyncio.shield(task), False
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round((self.hits + self.coalesced) / requests, 4) if requests else 0.0,
+        }